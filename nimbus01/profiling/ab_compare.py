@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+A/B comparison of two Python/libvips environments.
+
+Runs the same corpus alternately under two interpreters (e.g. two venvs
+with different libvips, pyvips or libjpeg-turbo builds), each run in a
+fresh child process. Rounds alternate ABBA so slow drift (thermals, page
+cache, other tenants) lands on both sides equally. Each operation gets a
+Mann-Whitney U test (two-sided, normal approximation with tie correction,
+Holm-corrected across operations) and a bootstrap confidence interval on
+the ratio of medians, which is the effect size reported in the verdict.
+
+The statistical unit is the run, not the image timing: repeated timings
+of the same images within a run are not independent, so each run
+contributes one sample per operation, its median over the corpus.
+"""
+
+import argparse
+import json
+import math
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from profile_vips import ALL_FORMATS, DEFAULT_FORMATS, ENCODER_EFFORT, OPERATIONS, get_image_files
+
+DEFAULT_ROUNDS = 6
+DEFAULT_ALPHA = 0.05
+BOOTSTRAP_RESAMPLES = 2000
+MIN_EFFECT = 0.02               # Ratios within 2% are reported as equivalent
+
+PROBE = ("import pyvips, sys; "
+         "print(f'libvips {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}, "
+         "pyvips {pyvips.__version__}, Python {sys.version.split()[0]}')")
+
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def mann_whitney(a: List[float], b: List[float]) -> Tuple[float, float]:
+    """Two-sided Mann-Whitney U test; returns (U for a, p-value)."""
+    n1, n2 = len(a), len(b)
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        t = j - i + 1
+        tie_term += t ** 3 - t
+        i = j + 1
+    rank_sum_a = sum(r for r, (_, side) in zip(ranks, combined) if side == 0)
+    u = rank_sum_a - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    if sigma == 0:
+        return u, 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / sigma  # Continuity correction
+    return u, min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
+
+
+def bootstrap_ratio(a: List[float], b: List[float], rng: random.Random,
+                    level: float = 0.95) -> Tuple[float, float]:
+    """Bootstrap confidence interval for median(b) / median(a)."""
+    ratios = sorted(
+        median(rng.choices(b, k=len(b))) / median(rng.choices(a, k=len(a)))
+        for _ in range(BOOTSTRAP_RESAMPLES)
+    )
+    tail = (1 - level) / 2
+    return ratios[int(tail * len(ratios))], ratios[int((1 - tail) * len(ratios)) - 1]
+
+
+def holm(p_values: Dict[str, float]) -> Dict[str, float]:
+    """Holm-Bonferroni adjusted p-values."""
+    adjusted = {}
+    running = 0.0
+    ordered = sorted(p_values.items(), key=lambda kv: kv[1])
+    for i, (key, p) in enumerate(ordered):
+        running = max(running, min(1.0, p * (len(ordered) - i)))
+        adjusted[key] = running
+    return adjusted
+
+
+def run_side(python: str, image_files: List[Path], formats: str) -> dict:
+    """Run one benchmark pass in a child interpreter via envelopes.py --child."""
+    script = Path(__file__).resolve().parent / "envelopes.py"
+    effort = ",".join(f"{k}={v}" for k, v in ENCODER_EFFORT.items())
+    with tempfile.TemporaryDirectory() as work_dir:
+        cmd = [python, str(script), "--child", "--output", work_dir,
+               "--formats", formats, "--effort", effort] + [str(p) for p in image_files]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"exit code {proc.returncode}")
+    return json.loads(proc.stdout)
+
+
+def print_comparison(samples: Dict[str, Dict[str, List[float]]], alpha: float,
+                     seed: int) -> None:
+    """Print per-operation tests and verdicts."""
+    rng = random.Random(seed)
+    keys = [k for k in samples["a"] if samples["a"][k] and samples["b"][k]]
+    tests = {k: mann_whitney(samples["a"][k], samples["b"][k]) for k in keys}
+    p_adj = holm({k: p for k, (_, p) in tests.items()})
+
+    print("\n" + "=" * 70)
+    print("A/B RESULTS")
+    print("=" * 70)
+    print(f"\n{'Operation':<18} {'Runs':>5} {'A med ms':>10} {'B med ms':>10} "
+          f"{'B/A':>7} {'95% CI':>15} {'p (Holm)':>9}  Verdict")
+    print("-" * 90)
+    for key in keys:
+        a, b = samples["a"][key], samples["b"][key]
+        ratio = median(b) / median(a)
+        lo, hi = bootstrap_ratio(a, b, rng)
+        # Cliff's delta: P(b > a) - P(b < a), from U
+        u_a = tests[key][0]
+        cliffs = 1 - 2 * u_a / (len(a) * len(b))
+        if p_adj[key] >= alpha or (lo <= 1 <= hi):
+            verdict = "no significant difference"
+        elif abs(ratio - 1) < MIN_EFFECT:
+            verdict = "significant but < 2%"
+        elif ratio < 1:
+            verdict = f"B {(1 - ratio) * 100:.1f}% faster"
+        else:
+            verdict = f"B {(ratio - 1) * 100:.1f}% slower"
+        print(f"{key:<18} {min(len(a), len(b)):>5} {median(a):>10.2f} {median(b):>10.2f} "
+              f"{ratio:>7.3f} {f'{lo:.3f}-{hi:.3f}':>15} {p_adj[key]:>9.4f}  "
+              f"{verdict} (Cliff's d {cliffs:+.2f})")
+    print("-" * 90)
+
+    overall_a = sum(median(samples["a"][k]) for k in keys)
+    overall_b = sum(median(samples["b"][k]) for k in keys)
+    if overall_a:
+        print(f"\nSum of medians: A {overall_a:.1f} ms, B {overall_b:.1f} ms "
+              f"(B/A {overall_b / overall_a:.3f})")
+    print("Each sample is one run's median over the corpus; medians above are across runs.")
+    print(f"Verdicts use alpha {alpha} after Holm correction over {len(keys)} operations;")
+    print("Cliff's d runs from -1 (B always faster) to +1 (B always slower).")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two Python/libvips environments on the same corpus.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/24mp --a ~/venv-8.15/bin/python --b ~/venv-8.16/bin/python
+  {sys.argv[0]} --input ./sample_input/48mp --a python3 --b ./turbo/bin/python --rounds 10
+  {sys.argv[0]} --input ./sample_input/12mp --a python3 --b ./new/bin/python --formats jpeg
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Input directory containing images to process"
+    )
+    parser.add_argument(
+        "--a",
+        required=True,
+        help="Python interpreter for side A (baseline)"
+    )
+    parser.add_argument(
+        "--b",
+        required=True,
+        help="Python interpreter for side B (candidate)"
+    )
+    parser.add_argument(
+        "--rounds", "-n",
+        type=int,
+        default=DEFAULT_ROUNDS,
+        help=f"Runs per side, interleaved ABBA (default: {DEFAULT_ROUNDS})"
+    )
+    parser.add_argument(
+        "--formats", "-f",
+        default=",".join(DEFAULT_FORMATS),
+        help=f"Comma-separated output formats (default: {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=DEFAULT_ALPHA,
+        help=f"Significance level (default: {DEFAULT_ALPHA})"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Bootstrap random seed (default: 0)"
+    )
+
+    args = parser.parse_args()
+
+    known = [name for name, _, _ in ALL_FORMATS]
+    unknown = [name for name in args.formats.split(",") if name not in known]
+    if unknown:
+        print(f"Error: Unknown format(s): {', '.join(unknown)}. Known: {', '.join(known)}")
+        sys.exit(1)
+
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    sides = {"a": args.a, "b": args.b}
+    versions = {}
+    for side, python in sides.items():
+        try:
+            proc = subprocess.run([python, "-c", PROBE], capture_output=True, text=True)
+        except OSError as e:
+            print(f"Error: Cannot run {python}: {e}")
+            sys.exit(1)
+        if proc.returncode != 0:
+            print(f"Error: {python} cannot import pyvips")
+            sys.exit(1)
+        versions[side] = proc.stdout.strip()
+
+    print(f"VIPS A/B Comparison")
+    print(f"===================")
+    print(f"A: {args.a} ({versions['a']})")
+    print(f"B: {args.b} ({versions['b']})")
+    print(f"Input directory: {args.input}")
+    print(f"Images per run: {len(image_files)}")
+    print(f"Formats: {args.formats}")
+    print(f"Rounds: {args.rounds} per side, ABBA order")
+    print()
+
+    keys = [f"{op}_{fmt}" for op, _, _ in OPERATIONS for fmt in args.formats.split(",")]
+    samples = {side: {k: [] for k in keys} for side in sides}
+    # ABBA: A B B A A B B A ... so neither side always runs first
+    order = [("a", "b") if r % 2 == 0 else ("b", "a") for r in range(args.rounds)]
+    for r, pair in enumerate(order, 1):
+        for side in pair:
+            print(f"  Round {r}/{args.rounds} {side.upper()}...", end=" ", flush=True)
+            try:
+                run = run_side(sides[side], image_files, args.formats)
+            except RuntimeError as e:
+                print(f"error: {e}")
+                sys.exit(1)
+            # One sample per run: timings within a run share images and process state
+            for key in keys:
+                if run["times_ms"].get(key):
+                    samples[side][key].append(median(run["times_ms"][key]))
+            print(f"{run['elapsed_s']:.2f} s")
+
+    print_comparison(samples, args.alpha, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Tar and zip archives as profile_vips.py --input, without extracting.
+
+Members are read one at a time into memory and decoded with
+new_from_buffer, so a multi-GB import is read once, sequentially, instead
+of being written out to disk and read back. Tar archives (plain, gzip,
+bzip2 or xz) are read in streaming mode and need not be seekable; zip
+archives are read through their central directory.
+"""
+
+import os
+import tarfile
+import time
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List
+
+from profile_vips import SUPPORTED_EXTENSIONS
+
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError)
+
+
+@dataclass
+class ArchiveMember:
+    """One image read from an archive.
+
+    st_size and st_mtime_ns mirror os.stat_result, so members can be
+    journaled like files.
+    """
+    path: Path                  # Relative path inside the archive
+    data: bytes
+    st_size: int
+    st_mtime_ns: int
+
+
+def is_archive(path: Path) -> bool:
+    return path.is_file() and path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def wanted(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def member_path(name: str) -> Path:
+    """Archive member name as a safe relative path (no absolute or .. parts)."""
+    parts = [p for p in PurePosixPath(name).parts if p not in ("/", "..", ".")]
+    return Path(*parts)
+
+
+def iter_archive(path: Path) -> Iterator[ArchiveMember]:
+    """Yield supported images from a tar or zip archive, in archive order."""
+    if path.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not wanted(info.filename):
+                    continue
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                yield ArchiveMember(member_path(info.filename), zf.read(info),
+                                    info.file_size, int(mtime * 1e9))
+        return
+    # "r|*" streams with transparent decompression and never seeks
+    with tarfile.open(path, "r|*") as tf:
+        for info in tf:
+            if not info.isfile() or not wanted(info.name):
+                continue
+            data = tf.extractfile(info).read()
+            yield ArchiveMember(member_path(info.name), data, info.size, int(info.mtime * 1e9))
+
+
+def until_error(members: Iterator[ArchiveMember], errors: List[Exception]) -> Iterator[ArchiveMember]:
+    """Yield members until the archive turns out truncated or corrupt.
+
+    The read error is appended to errors instead of raised, so the caller's
+    loop ends normally and can still report the members already processed.
+    """
+    try:
+        yield from members
+    except ARCHIVE_ERRORS as e:
+        errors.append(e)
@@ -0,0 +1,233 @@
+"""
+Resumable batch derivative generation for profile_vips.py --batch.
+
+Outputs are written to a temporary name, fsynced and renamed, so a crash
+never leaves a truncated derivative behind. Each derivative that succeeds
+is then appended to a journal (one JSON list per line) and the journal is
+fsynced, so a journaled derivative is on disk even after a power loss and
+an interrupted run redoes only what is missing. A derivative that fails
+does not cost its source's other derivatives their journal entries.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from profile_vips import (ENCODER_EFFORT, FORMATS, OPERATIONS, pyvips, resize_image,
+                          select_formats)
+
+JOURNAL_FILE = "batch_journal.log"
+IN_FLIGHT_PER_JOB = 4           # Submitted-but-unfinished sources per worker
+
+
+@dataclass
+class BatchStats:
+    """Totals for one batch run."""
+    sources: int = 0
+    skipped: int = 0
+    failed: int = 0
+    derivatives: int = 0
+    bytes_out: int = 0
+    elapsed_s: float = 0
+    
+    @property
+    def processed(self) -> int:
+        return self.sources - self.skipped - self.failed
+
+
+def journal_entry(rel_path: str, st: os.stat_result, key: str) -> str:
+    """Journal line for one derivative; includes size and mtime so edits redo work.
+
+    JSON, so tabs or newlines in a path cannot break the line.
+    """
+    return json.dumps([rel_path, f"{st.st_size}:{st.st_mtime_ns}", key])
+
+
+def load_journal(path: Path) -> Set[str]:
+    """Read completed entries, truncating a partially written last line."""
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        data = data[:data.rfind(b"\n") + 1]
+        with open(path, "r+b") as f:
+            f.truncate(len(data))
+    return set(data.decode(errors="surrogateescape").splitlines())
+
+
+def fsync_path(path: str) -> None:
+    """fsync a file, or a directory so a rename inside it is durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def init_worker(formats: List[str], effort: dict) -> None:
+    """Apply the parent's format and effort selection in a spawned worker."""
+    select_formats(formats)
+    ENCODER_EFFORT.update(effort)
+
+
+def process_source(image_path: str, out_dir: str, keys: List[str],
+                   data: Optional[bytes] = None
+                   ) -> List[Tuple[str, float, int, float, Optional[str]]]:
+    """Render the requested derivatives of one source with durable, atomic writes.
+
+    Returns (key, elapsed_ms, bytes, start, error) per derivative, start
+    being the worker's perf_counter() (CLOCK_MONOTONIC, so comparable across
+    processes on Linux) and error None on success. With data (an archive
+    member), decodes from memory and image_path only names the outputs.
+    Runs in a pool worker.
+    """
+    if data is not None:
+        img = pyvips.Image.new_from_buffer(data, "")
+    else:
+        img = pyvips.Image.new_from_file(image_path)
+    stem = Path(image_path).stem
+    done = []
+    for op_name, max_size, quality in OPERATIONS:
+        for fmt_name, ext, save_func in FORMATS:
+            key = f"{op_name}_{fmt_name}"
+            if key not in keys:
+                continue
+            start = time.perf_counter()
+            output_path = os.path.join(out_dir, f"{stem}_{op_name}{ext}")
+            tmp_path = output_path + ".tmp"
+            try:
+                save_func(resize_image(img, max_size), tmp_path, quality)
+                fsync_path(tmp_path)
+                os.replace(tmp_path, output_path)
+                fsync_path(out_dir)
+            except (pyvips.Error, OSError) as e:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                done.append((key, 0, 0, start, (str(e).splitlines() or [repr(e)])[0]))
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            done.append((key, elapsed_ms, os.path.getsize(output_path), start, None))
+    return done
+
+
+def run_batch(
+    image_files: Iterable[Path],
+    input_dir: Path,
+    output_dir: Path,
+    results: dict,
+    jobs: int,
+    journal_path: Path,
+    verbose: bool = False,
+    stats: Optional[BatchStats] = None
+) -> BatchStats:
+    """Generate all missing derivatives, resuming from the journal.
+    
+    image_files may also yield archive_input.ArchiveMember, whose bytes are
+    sent to the workers. Pass stats to watch progress from another thread while the batch runs.
+    """
+    completed = load_journal(journal_path)
+    all_keys = list(results)
+    stats = stats if stats is not None else BatchStats()
+    if completed:
+        print(f"Resuming: {len(completed)} derivatives already in journal")
+
+    journal = open(journal_path, "a", errors="surrogateescape")
+    executor = None
+    if jobs > 1:
+        # Spawn rather than fork: libvips worker threads (and the optional
+        # system sampler) are already running, and a forked child can inherit
+        # a lock held by one of them and hang
+        executor = ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=([name for name, _, _ in FORMATS], dict(ENCODER_EFFORT)))
+    in_flight = {}
+
+    def finish(image_path: Path, entries: dict, outcome) -> None:
+        try:
+            done = outcome() if callable(outcome) else outcome.result()
+        except Exception as e:
+            stats.failed += 1
+            print(f"  error: {image_path.name}: {e}")
+            return
+        errors = [(key, error) for key, _, _, _, error in done if error is not None]
+        for key, elapsed_ms, nbytes, started, error in done:
+            if error is not None:
+                continue
+            # The output is already fsynced, so the entry never outlives it
+            journal.write(entries[key] + "\n")
+            results[key].times_ms.append(elapsed_ms)
+            results[key].bytes_out.append(nbytes)
+            results[key].starts_s.append(started)
+            stats.derivatives += 1
+            stats.bytes_out += nbytes
+        journal.flush()
+        os.fsync(journal.fileno())
+        if errors:
+            stats.failed += 1
+            for key, error in errors:
+                print(f"  error: {image_path.name} {key}: {error}")
+        if verbose:
+            print(f"  {image_path.name}: {len(done) - len(errors)} derivatives")
+
+    start = time.perf_counter()
+    try:
+        for image_path in image_files:
+            stats.sources += 1
+            data = None
+            if isinstance(image_path, Path):
+                st = image_path.stat()
+                rel_path = image_path.relative_to(input_dir)
+            else:
+                st, rel_path, data = image_path, image_path.path, image_path.data
+                image_path = rel_path
+            rel = str(rel_path)
+            entries = {k: journal_entry(rel, st, k) for k in all_keys}
+            todo = [k for k in all_keys if entries[k] not in completed]
+            if not todo:
+                stats.skipped += 1
+                continue
+
+            out_dir = output_dir / rel_path.parent
+            out_dir.mkdir(parents=True, exist_ok=True)
+            args = (str(image_path), str(out_dir), todo, data)
+            if executor is None:
+                finish(image_path, entries, lambda: process_source(*args))
+                continue
+
+            # Bound the queue so a streaming scan isn't drained into memory
+            while len(in_flight) >= jobs * IN_FLIGHT_PER_JOB:
+                ready, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in ready:
+                    finish(*in_flight.pop(fut), fut)
+            in_flight[executor.submit(process_source, *args)] = (image_path, entries)
+
+        for fut in list(in_flight):
+            finish(*in_flight.pop(fut), fut)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        journal.close()
+
+    stats.elapsed_s = time.perf_counter() - start
+    return stats
+
+
+def print_batch_stats(stats: BatchStats, jobs: int) -> None:
+    """Print batch throughput summary."""
+    processed = stats.processed
+    elapsed = stats.elapsed_s or 1e-9
+    print("\nBATCH SUMMARY:")
+    print(f"  Sources:     {stats.sources} seen, {processed} processed, "
+          f"{stats.skipped} already done, {stats.failed} failed")
+    print(f"  Jobs:        {jobs}")
+    print(f"  Throughput:  {processed / elapsed:.2f} images/s, "
+          f"{stats.derivatives / elapsed:.2f} derivatives/s, "
+          f"{stats.bytes_out / elapsed / 1e6:.2f} MB/s out")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Cold-start latency benchmark for thumbnail workers.
+
+Measures how long a worker takes from process start to its first encoded
+thumbnail, and compares three ways of serving a request:
+  cold   - a fresh interpreter per request, broken into phases:
+             startup   process spawn to the first line of Python
+             setup     the harness's own imports and argument parsing
+             import    import pyvips (cffi load of libvips, vips_init)
+             init      first image open (loader lookup, operation
+                       introspection, libvips module loading)
+             first op  resize and encode the thumbnail
+  forked - a prewarmed daemon (zygote) that has already imported and
+           initialized pyvips forks one child per request
+  warm   - a second prewarmed daemon serves requests in-process (steady
+           state, after its first request)
+
+The zygote must not run a pixel pipeline before forking: libvips worker
+threads do not survive fork(), and a child that inherits a lock held by one
+of them hangs. It warms by importing and introspecting only.
+"""
+
+import time
+
+STARTED = time.perf_counter()  # As early as possible, ends the startup phase
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+DEFAULT_RUNS = 10
+PHASES = ["startup", "setup", "import", "init", "first_op"]
+WARM_OPERATIONS = ["thumbnail", "resize", "jpegsave_buffer", "webpsave_buffer", "jpegload"]
+
+
+def thumbnail_phases(image_path: str, fmt: str) -> Dict[str, float]:
+    """Import, open and thumbnail one image, returning perf_counter marks."""
+    marks = {"main": STARTED, "importing": time.perf_counter()}
+    import pyvips
+    marks["imported"] = time.perf_counter()
+    from profile_vips import OPERATIONS, encode_buffer, resize_image
+    marks["harness"] = time.perf_counter()
+    img = pyvips.Image.new_from_file(image_path)
+    marks["opened"] = time.perf_counter()
+    _, max_size, quality = OPERATIONS[0]
+    encode_buffer(resize_image(img, max_size), fmt, quality)
+    marks["done"] = time.perf_counter()
+    return marks
+
+
+def serve_one(image_path: str, fmt: str) -> Dict[str, float]:
+    """Thumbnail one image in an already initialized process."""
+    import pyvips
+    from profile_vips import OPERATIONS, encode_buffer, resize_image
+    start = time.perf_counter()
+    img = pyvips.Image.new_from_file(image_path)
+    _, max_size, quality = OPERATIONS[0]
+    encode_buffer(resize_image(img, max_size), fmt, quality)
+    return {"start": start, "done": time.perf_counter()}
+
+
+def answer(image_path: str, fmt: str, **extra) -> None:
+    """Serve one request and write its reply line; errors are replies too."""
+    try:
+        reply = dict(serve_one(image_path, fmt), **extra)
+    except Exception as e:
+        # Without a reply the parent would block on readline() forever
+        reply = {"error": f"{Path(image_path).name}: {(str(e).splitlines() or [repr(e)])[0]}"}
+    print(json.dumps(reply), flush=True)
+
+
+def run_zygote(fmt: str, fork: bool) -> None:
+    """Daemon side: warm up, then thumbnail each path read from stdin.
+
+    With fork, every request is served by a freshly forked child and the
+    daemon itself never touches pixels; without, requests run in-process.
+    """
+    import pyvips
+    importlib.import_module("profile_vips")
+    for name in WARM_OPERATIONS:
+        pyvips.Introspect.get(name)
+    print("ready", flush=True)
+
+    for line in sys.stdin:
+        path = line.rstrip("\n")
+        if not fork:
+            answer(path, fmt)
+            continue
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                answer(path, fmt, forked=forked)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+
+def run_cold(image_files: List[Path], runs: int, fmt: str) -> Dict[str, List[float]]:
+    """Launch a fresh interpreter per run and collect phase durations in ms."""
+    phases = {name: [] for name in PHASES + ["harness", "total"]}
+    script = Path(__file__).resolve()
+    for i in range(runs):
+        image_path = image_files[i % len(image_files)]
+        spawned = time.perf_counter()
+        proc = subprocess.run([sys.executable, str(script), "--child", "--format", fmt,
+                               str(image_path)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"exit code {proc.returncode}")
+        m = json.loads(proc.stdout)
+        phases["startup"].append((m["main"] - spawned) * 1000)
+        phases["setup"].append((m["importing"] - m["main"]) * 1000)
+        phases["import"].append((m["imported"] - m["importing"]) * 1000)
+        phases["harness"].append((m["harness"] - m["imported"]) * 1000)
+        phases["init"].append((m["opened"] - m["harness"]) * 1000)
+        phases["first_op"].append((m["done"] - m["opened"]) * 1000)
+        phases["total"].append((m["done"] - spawned) * 1000)
+        print(f"    run {i + 1}/{runs}: {phases['total'][-1]:.1f} ms")
+    return phases
+
+
+def start_daemon(fmt: str, fork: bool) -> subprocess.Popen:
+    script = Path(__file__).resolve()
+    cmd = [sys.executable, str(script), "--zygote" if fork else "--warm-worker", "--format", fmt]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    if proc.stdout.readline().strip() != "ready":
+        raise RuntimeError("daemon failed to start")
+    return proc
+
+
+def request(proc: subprocess.Popen, image_path: Path) -> Dict[str, float]:
+    """Send one path to a daemon and wait for its reply."""
+    proc.stdin.write(f"{image_path}\n")
+    proc.stdin.flush()
+    line = proc.stdout.readline()
+    if not line:
+        raise RuntimeError(f"daemon exited (code {proc.poll()})")
+    reply = json.loads(line)
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def run_daemon(image_files: List[Path], runs: int, fmt: str) -> Dict[str, List[float]]:
+    """Time requests against a prewarmed forking zygote and a warm worker."""
+    started = time.perf_counter()
+    zygote = start_daemon(fmt, fork=True)
+    latencies = {"zygote_ready": [(time.perf_counter() - started) * 1000],
+                 "fork": [], "forked": [], "warm": []}
+    # Pixel work starts libvips threads, so warm requests get their own process
+    worker = start_daemon(fmt, fork=False)
+    try:
+        # One untimed request each, so warm is measured after first-pixel setup
+        for proc in (zygote, worker):
+            request(proc, image_files[0])
+        for i in range(runs):
+            image_path = image_files[i % len(image_files)]
+            for proc, key in ((zygote, "forked"), (worker, "warm")):
+                sent = time.perf_counter()
+                m = request(proc, image_path)
+                latencies[key].append((time.perf_counter() - sent) * 1000)
+                if key == "forked":
+                    latencies["fork"].append((m["start"] - m["forked"]) * 1000)
+    finally:
+        for proc in (zygote, worker):
+            proc.stdin.close()
+            proc.wait()
+    return latencies
+
+
+def stats_row(name: str, values: List[float]) -> str:
+    from profile_vips import percentile
+    return (f"{name:<26} {sum(values) / len(values):>10.1f} {percentile(values, 50):>10.1f} "
+            f"{percentile(values, 95):>10.1f} {max(values):>10.1f}")
+
+
+def print_cold_start_results(cold: Dict[str, List[float]], daemon: Dict[str, List[float]]) -> None:
+    """Print phase breakdown and the cold vs. forked vs. warm comparison."""
+    header = f"{'':<26} {'Avg (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'Max (ms)':>10}"
+    print("\n" + "=" * 70)
+    print("COLD START RESULTS")
+    print("=" * 70)
+    if cold:
+        print(f"\n{'Cold phase':<26}" + header[26:])
+        print("-" * 70)
+        for name in ["startup", "setup", "import", "harness", "init", "first_op", "total"]:
+            label = {"first_op": "first op", "setup": "(harness setup)",
+                     "harness": "(harness import)",
+                     "total": "TOTAL to first thumbnail"}.get(name, name)
+            print(stats_row(label, cold[name]))
+        print("-" * 70)
+    if daemon:
+        print(f"\n{'Per request':<26}" + header[26:])
+        print("-" * 70)
+        if cold:
+            print(stats_row("cold (fresh interpreter)", cold["total"]))
+        print(stats_row("forked from zygote", daemon["forked"]))
+        print(stats_row("  of which fork", daemon["fork"]))
+        print(stats_row("warm (in-process)", daemon["warm"]))
+        print("-" * 70)
+        print(f"\nZygote startup (paid once): {daemon['zygote_ready'][0]:.1f} ms")
+        if cold:
+            cold_avg = sum(cold["total"]) / len(cold["total"])
+            forked_avg = sum(daemon["forked"]) / len(daemon["forked"])
+            warm_avg = sum(daemon["warm"]) / len(daemon["warm"])
+            print(f"Scale-to-zero penalty: {cold_avg - warm_avg:.1f} ms per cold request "
+                  f"({cold_avg / warm_avg:.1f}x warm)")
+            print(f"Forked worker overhead: {forked_avg - warm_avg:.1f} ms over warm")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark worker cold start vs. a prewarmed forking daemon.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/12mp
+  {sys.argv[0]} --input ./sample_input/12mp --runs 30 --format webp
+  {sys.argv[0]} --input ./sample_input/12mp --mode cold
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        help="Input directory containing images to process"
+    )
+    parser.add_argument(
+        "--runs", "-n",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"Requests per mode (default: {DEFAULT_RUNS})"
+    )
+    parser.add_argument(
+        "--format", "-f",
+        choices=["jpeg", "webp"],
+        default="jpeg",
+        help="Thumbnail format (default: jpeg)"
+    )
+    parser.add_argument(
+        "--mode", "-m",
+        choices=["all", "cold", "daemon"],
+        default="all",
+        help="What to measure (default: all)"
+    )
+    # Internal entry points used by the benchmark itself
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--zygote", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("image", nargs="?", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(thumbnail_phases(args.image, args.format)))
+        return
+    if args.zygote or args.warm_worker:
+        run_zygote(args.format, fork=args.zygote)
+        return
+
+    if not args.input:
+        parser.error("--input is required")
+    from profile_vips import get_image_files, pyvips
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    print(f"VIPS Cold Start Benchmark")
+    print(f"=========================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Python: {sys.executable} ({sys.version.split()[0]})")
+    print(f"Input directory: {args.input}")
+    print(f"Runs per mode: {args.runs}, thumbnail format {args.format}")
+    print()
+
+    cold = daemon = {}
+    try:
+        if args.mode in ("all", "cold"):
+            print("  Cold starts (fresh interpreter per request)...")
+            cold = run_cold(image_files, args.runs, args.format)
+        if args.mode in ("all", "daemon"):
+            print("  Prewarmed daemon (forked and warm requests)...")
+            daemon = run_daemon(image_files, args.runs, args.format)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print_cold_start_results(cold, daemon)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Persistent derivative cache keyed by source content hash.
+
+Stores encoded derivatives on disk under a byte budget with LRU eviction.
+Keys combine a hash of the source bytes with the operation parameters, so a
+re-uploaded or renamed file still hits. The index is a flat file of
+fixed-size records kept in LRU order, so it loads in one read after a restart.
+Puts and evictions between index writes are appended to a journal of the
+same records, which is replayed on load, so a crash loses no entries.
+
+Run as a script to replay a synthetic request stream against a sample folder
+and report hit ratio, latency saved and index overhead.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import struct
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from profile_vips import (FORMATS, OPERATIONS, encode_buffer, get_image_files, percentile, pyvips,
+                          resize_image)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_cache")
+DEFAULT_CACHE_MB = 256
+DEFAULT_REQUESTS = 200
+DEFAULT_REPEAT_RATE = 0.5
+
+KEY_BYTES = 16                  # blake2b digest size for keys
+INDEX_FILE = "index.bin"
+JOURNAL_FILE = "index.journal"
+INDEX_RECORD = struct.Struct(f"<{KEY_BYTES}sI")   # key, entry size in bytes (0: removed)
+FLUSH_EVERY = 256               # Puts and hits between index writes
+HASH_CHUNK = 1024 * 1024
+
+
+def content_hash(path: Path) -> bytes:
+    """Hash the bytes of a source file."""
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.digest()
+
+
+class SourceHashes:
+    """content_hash() memoised per path and revalidated by size and mtime.
+
+    Repeat requests then cost one stat instead of re-reading the source,
+    so hit latency measures the cache rather than hashing.
+    """
+
+    def __init__(self):
+        self.hashes = {}            # path -> (size, mtime_ns, digest)
+        self.hashed = 0
+        self.hash_seconds = 0.0
+
+    def get(self, path: Path) -> bytes:
+        st = os.stat(path)
+        cached = self.hashes.get(path)
+        if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+            return cached[2]
+        start = time.perf_counter()
+        digest = content_hash(path)
+        self.hash_seconds += time.perf_counter() - start
+        self.hashed += 1
+        self.hashes[path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+
+def derivative_key(source_hash: bytes, op_name: str, max_size: int,
+                   quality: int, fmt_name: str) -> bytes:
+    """Key for one derivative of one source."""
+    h = hashlib.blake2b(source_hash, digest_size=KEY_BYTES)
+    h.update(f"{op_name}:{max_size}:{quality}:{fmt_name}".encode())
+    return h.digest()
+
+
+class DerivativeCache:
+    """Size-bounded LRU cache of encoded derivatives on disk."""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[bytes, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.load_seconds = self._load_index()
+        self.journal = open(self.journal_path, "ab", buffering=0)
+
+    @property
+    def index_path(self) -> Path:
+        return self.cache_dir / INDEX_FILE
+
+    @property
+    def journal_path(self) -> Path:
+        return self.cache_dir / JOURNAL_FILE
+
+    def _entry_path(self, key: bytes) -> Path:
+        name = key.hex()
+        return self.cache_dir / name[:2] / name
+
+    def _load_index(self) -> float:
+        """Load the index and replay the journal, or rebuild from entry files if lost."""
+        start = time.perf_counter()
+        if self.index_path.exists():
+            data = self.index_path.read_bytes()
+            usable = len(data) - len(data) % INDEX_RECORD.size
+            for key, size in INDEX_RECORD.iter_unpack(data[:usable]):
+                self.entries[key] = size
+                self.total_bytes += size
+            if self.journal_path.exists():
+                data = self.journal_path.read_bytes()
+                usable = len(data) - len(data) % INDEX_RECORD.size   # Torn last record
+                for key, size in INDEX_RECORD.iter_unpack(data[:usable]):
+                    self.total_bytes -= self.entries.pop(key, 0)
+                    if size:
+                        self.entries[key] = size
+                        self.total_bytes += size
+        else:
+            # Oldest mtime first approximates the lost LRU order
+            found = []
+            for sub in self.cache_dir.iterdir():
+                if sub.is_dir():
+                    for f in sub.iterdir():
+                        if f.suffix:
+                            continue  # Leftover temp file from an interrupted put
+                        st = f.stat()
+                        found.append((st.st_mtime, bytes.fromhex(f.name), st.st_size))
+            for _, key, size in sorted(found):
+                self.entries[key] = size
+                self.total_bytes += size
+        return time.perf_counter() - start
+
+    def flush(self) -> None:
+        """Write the index atomically in LRU order, then empty the journal."""
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(b"".join(INDEX_RECORD.pack(k, s) for k, s in self.entries.items()))
+        os.replace(tmp, self.index_path)
+        # Replaying a journal the index already covers is harmless
+        self.journal.truncate(0)
+        self.dirty = 0
+
+    def close(self) -> None:
+        if self.dirty:
+            self.flush()
+        self.journal.close()
+
+    def _log(self, key: bytes, size: int) -> None:
+        self.journal.write(INDEX_RECORD.pack(key, size))
+
+    def _touch(self) -> None:
+        self.dirty += 1
+        if self.dirty >= FLUSH_EVERY:
+            self.flush()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        try:
+            data = self._entry_path(key).read_bytes()
+        except FileNotFoundError:
+            self.total_bytes -= self.entries.pop(key)
+            self._log(key, 0)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self._touch()   # LRU order changed
+        return data
+
+    def put(self, key: bytes, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Journal first: a file on disk is then always accounted for
+        self._log(key, len(data))
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+        self._evict()
+        self._touch()
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            self._log(key, 0)
+            try:
+                self._entry_path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def render_cached(cache: DerivativeCache, hashes: SourceHashes, source_path: Path, op_name: str,
+                  max_size: int, quality: int, fmt_name: str) -> bytes:
+    """Return the encoded derivative, rendering and caching it on a miss."""
+    key = derivative_key(hashes.get(source_path), op_name, max_size, quality, fmt_name)
+    data = cache.get(key)
+    if data is None:
+        img = pyvips.Image.new_from_file(str(source_path))
+        data = encode_buffer(resize_image(img, max_size), fmt_name, quality)
+        cache.put(key, data)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a request stream against the persistent derivative cache.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Each request picks a (source, operation, format) triple. With probability
+--repeat-rate it re-requests a triple seen earlier in the stream, otherwise
+it picks uniformly from all triples.
+
+Examples:
+  {sys.argv[0]} --input ./sample_input/24mp
+  {sys.argv[0]} --input ./sample_input/24mp --repeat-rate 0.8 --cache-size 32
+  {sys.argv[0]} --input ./sample_input/24mp --keep-cache   # then re-run to test restart
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Input directory containing images to process"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Cache directory (default: {DEFAULT_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=DEFAULT_CACHE_MB,
+        help=f"Cache budget in MB (default: {DEFAULT_CACHE_MB})"
+    )
+    parser.add_argument(
+        "--requests", "-n",
+        type=int,
+        default=DEFAULT_REQUESTS,
+        help=f"Number of requests to replay (default: {DEFAULT_REQUESTS})"
+    )
+    parser.add_argument(
+        "--repeat-rate", "-r",
+        type=float,
+        default=DEFAULT_REPEAT_RATE,
+        help=f"Probability of re-requesting an earlier item (default: {DEFAULT_REPEAT_RATE})"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for a reproducible stream"
+    )
+    parser.add_argument(
+        "--keep-cache", "-k",
+        action="store_true",
+        help="Keep the cache directory after the run (default: delete it if this run created it)"
+    )
+
+    args = parser.parse_args()
+
+    if not 0 <= args.repeat_rate <= 1:
+        print("Error: Repeat rate must be between 0 and 1")
+        sys.exit(1)
+
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    universe = [(f, op, fmt) for f in image_files for op in OPERATIONS for fmt in FORMATS]
+
+    cache_dir = Path(args.cache_dir).resolve()
+    created = not cache_dir.exists()    # Never delete a directory we didn't make
+    cache = DerivativeCache(cache_dir, int(args.cache_size * 1024 * 1024))
+
+    print(f"Derivative Cache Replay")
+    print(f"=======================")
+    print(f"Cache directory: {cache_dir}")
+    print(f"Cache budget: {args.cache_size:.1f} MB")
+    print(f"Loaded entries: {len(cache.entries)} ({cache.total_bytes / 1e6:.1f} MB) "
+          f"in {cache.load_seconds * 1000:.2f} ms")
+    print(f"Requests: {args.requests}, repeat rate {args.repeat_rate:.2f}, "
+          f"{len(universe)} distinct items")
+    print()
+
+    hashes = SourceHashes()
+    history = []
+    hit_ms = []
+    miss_ms = []
+    print("Replaying requests...")
+    total_start = time.perf_counter()
+    for _ in range(args.requests):
+        if history and rng.random() < args.repeat_rate:
+            item = rng.choice(history)
+        else:
+            item = rng.choice(universe)
+        history.append(item)
+        source, (op_name, max_size, quality), (fmt_name, _, _) = item
+
+        hits_before = cache.hits
+        start = time.perf_counter()
+        render_cached(cache, hashes, source, op_name, max_size, quality, fmt_name)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        (hit_ms if cache.hits > hits_before else miss_ms).append(elapsed_ms)
+    total_time = time.perf_counter() - total_start
+    cache.close()
+
+    lookups = cache.hits + cache.misses
+    avg_hit = sum(hit_ms) / len(hit_ms) if hit_ms else 0
+    avg_miss = sum(miss_ms) / len(miss_ms) if miss_ms else 0
+    index_bytes = cache.index_path.stat().st_size if cache.index_path.exists() else 0
+
+    print("\n" + "=" * 70)
+    print("CACHE RESULTS")
+    print("=" * 70)
+    print(f"  Hit ratio:        {cache.hits}/{lookups} ({cache.hits / lookups * 100 if lookups else 0:.1f}%)")
+    print(f"  Hit latency:      avg {avg_hit:.2f} ms, p99 {percentile(hit_ms, 99):.2f} ms")
+    print(f"  Miss latency:     avg {avg_miss:.2f} ms, p99 {percentile(miss_ms, 99):.2f} ms")
+    print(f"  Latency saved:    {(avg_miss - avg_hit) * len(hit_ms) / 1000:.2f} s "
+          f"over {len(hit_ms)} hits")
+    print(f"  Source hashing:   {hashes.hashed} sources hashed in {hashes.hash_seconds * 1000:.2f} ms "
+          f"(memoised by size and mtime; included in the latencies above)")
+    print(f"  Evictions:        {cache.evictions}")
+    print(f"  Cached:           {len(cache.entries)} entries, {cache.total_bytes / 1e6:.1f} MB")
+    print(f"  Index overhead:   {index_bytes} bytes ({INDEX_RECORD.size} B/entry), "
+          f"load {cache.load_seconds * 1000:.2f} ms")
+    print(f"\nTotal replay time: {total_time:.2f} seconds")
+
+    if not args.keep_cache and created:
+        print("\nCleaning up cache directory...")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    else:
+        print(f"\nCache kept in: {cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Resource envelopes for profile_vips.py --envelope.
+
+An envelope is the slice of a machine a worker gets in production: a CPU
+affinity set, an address-space limit and a libvips thread count. Each
+envelope runs the benchmark in its own child process with VIPS_CONCURRENCY
+set. The child applies the affinity and rlimit to itself before importing
+pyvips, so every libvips thread inherits them and libvips sizes its thread
+pool for the slot rather than the host.
+
+Envelope spec: [NAME:]key=value[,key=value...], or a bare NAME for the host
+  cpus=0-3,8-11   explicit CPU list
+  cpus=ccd:N      N cores from the first L3 domain (one CCD on Zen)
+  cpus=split:N    N cores spread round-robin over all L3 domains
+  mem=8G          RLIMIT_AS (K/M/G suffixes)
+  concurrency=4   libvips threads per pipeline (default: number of CPUs)
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CPU_SYSFS = "/sys/devices/system/cpu"
+MEM_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+@dataclass
+class Envelope:
+    """One resource configuration to benchmark under."""
+    name: str
+    cpus: Optional[List[int]] = None
+    mem_bytes: Optional[int] = None
+    concurrency: Optional[int] = None
+
+    def describe(self) -> str:
+        parts = [f"cpus={format_cpu_list(self.cpus)}" if self.cpus else "cpus=all"]
+        if self.mem_bytes:
+            mb = self.mem_bytes / (1 << 20)
+            parts.append(f"mem={mb / 1024:g}G" if mb >= 1024 else f"mem={mb:g}M")
+        if self.concurrency:
+            parts.append(f"concurrency={self.concurrency}")
+        return ", ".join(parts)
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parse a kernel-style CPU list such as 0-3,8,10-11."""
+    cpus = []
+    for part in filter(None, text.strip().split(",")):
+        lo, _, hi = part.partition("-")
+        cpus.extend(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def format_cpu_list(cpus: List[int]) -> str:
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def l3_domains() -> List[List[int]]:
+    """Group usable CPUs by shared L3 cache, one core per SMT pair first."""
+    usable = os.sched_getaffinity(0)
+    domains: Dict[str, List[int]] = {}
+    for cpu in sorted(usable):
+        base = f"{CPU_SYSFS}/cpu{cpu}"
+        shared = str(cpu)
+        for index in Path(base, "cache").glob("index*"):
+            try:
+                if (index / "level").read_text().strip() == "3":
+                    shared = (index / "shared_cpu_list").read_text().strip()
+            except OSError:
+                pass
+        domains.setdefault(shared, []).append(cpu)
+
+    def smt_rank(cpu: int) -> int:
+        try:
+            siblings = parse_cpu_list(
+                Path(f"{CPU_SYSFS}/cpu{cpu}/topology/thread_siblings_list").read_text())
+            return siblings.index(cpu)
+        except (OSError, ValueError):
+            return 0
+
+    return [sorted(cpus, key=lambda c: (smt_rank(c), c)) for cpus in domains.values()]
+
+
+def resolve_cpus(text: str) -> List[int]:
+    """Turn a cpus= value into a concrete CPU list on this machine."""
+    usable = os.sched_getaffinity(0)
+    layout, _, count = text.partition(":")
+    if layout in ("ccd", "split"):
+        n = int(count)
+        domains = l3_domains()
+        if layout == "ccd":
+            pool = domains[0]
+        else:
+            # Interleave domains so N cores land evenly on every CCD
+            pool = [d[i] for i in range(max(map(len, domains))) for d in domains if i < len(d)]
+        if n > len(pool):
+            raise ValueError(f"{text} needs {n} CPUs, only {len(pool)} available")
+        return sorted(pool[:n])
+    cpus = parse_cpu_list(text)
+    missing = sorted(set(cpus) - usable)
+    if missing:
+        raise ValueError(f"CPUs not available to this process: {format_cpu_list(missing)}")
+    return cpus
+
+
+def parse_envelope(text: str) -> Envelope:
+    """Parse an envelope spec; raises ValueError with a readable message."""
+    name, sep, body = text.partition(":")
+    if "=" not in text:
+        name, body = text, ""     # Bare name: the whole host, for comparison
+    elif not sep or "=" in name:
+        name, body = text, text
+    envelope = Envelope(name)
+    for item in filter(None, re.split(r",(?=\w+=)", body)):
+        key, _, value = item.partition("=")
+        if key == "cpus":
+            envelope.cpus = resolve_cpus(value)
+        elif key == "mem":
+            match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)", value.upper())
+            if not match:
+                raise ValueError(f"mem must look like 512M or 8G, got '{value}'")
+            envelope.mem_bytes = int(float(match[1]) * MEM_SUFFIXES.get(match[2], 1))
+        elif key == "concurrency" and value.isdigit():
+            envelope.concurrency = int(value)
+        else:
+            raise ValueError(f"unknown envelope setting '{item}' (cpus, mem, concurrency)")
+    return envelope
+
+
+def run_child(image_files: List[Path], output_dir: Path) -> dict:
+    """Benchmark all images inside the current envelope (child process side)."""
+    from profile_vips import benchmark_resize, new_results, pyvips
+
+    results = new_results()
+    failed = 0
+    start = time.perf_counter()
+    for image_path in image_files:
+        try:
+            benchmark_resize(image_path, output_dir, results)
+        except Exception as e:
+            # MemoryError and vips allocation failures are expected under tight limits
+            failed += 1
+            print(f"{image_path.name}: {e}", file=sys.stderr)
+        for f in output_dir.iterdir():
+            f.unlink()
+    return {
+        "elapsed_s": time.perf_counter() - start,
+        "failed": failed,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "cpus": sorted(os.sched_getaffinity(0)),
+        "concurrency": pyvips.concurrency_get(),
+        "times_ms": {key: r.times_ms for key, r in results.items()},
+    }
+
+
+def run_envelopes(image_files: List[Path], envelopes: List[Envelope]) -> None:
+    """Run the benchmark once per envelope in a confined child process."""
+    from profile_vips import ENCODER_EFFORT, FORMATS, OPERATIONS, percentile
+
+    script = Path(__file__).resolve()
+    effort = ",".join(f"{k}={v}" for k, v in ENCODER_EFFORT.items())
+    formats = ",".join(name for name, _, _ in FORMATS)
+    runs = {}
+
+    for envelope in envelopes:
+        print(f"  [{envelope.name}] {envelope.describe()}...", end=" ", flush=True)
+
+        env = dict(os.environ)
+        if envelope.concurrency:
+            env["VIPS_CONCURRENCY"] = str(envelope.concurrency)
+        with tempfile.TemporaryDirectory() as work_dir:
+            cmd = [sys.executable, str(script), "--child", "--output", work_dir,
+                   "--formats", formats, "--effort", effort]
+            # Applied by the child itself: preexec_fn is unsafe here, since
+            # this process already runs libvips threads
+            if envelope.cpus:
+                cmd += ["--cpus", format_cpu_list(envelope.cpus)]
+            if envelope.mem_bytes:
+                cmd += ["--mem", str(envelope.mem_bytes)]
+            cmd += [str(p) for p in image_files]
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            lines = proc.stderr.strip().splitlines()
+            print(f"error: {lines[-1] if lines else f'exit code {proc.returncode}'}")
+            continue
+        runs[envelope.name] = run = json.loads(proc.stdout)
+        print(f"{run['elapsed_s']:.2f} s")
+
+    if not runs:
+        return
+
+    print("\n" + "=" * 70)
+    print("ENVELOPE RESULTS")
+    print("=" * 70)
+    print(f"\n{'Envelope':<16} {'CPUs':<12} {'Threads':>8} {'Images/s':>10} "
+          f"{'Peak RSS MB':>12} {'Failed':>7}")
+    print("-" * 70)
+    for name, run in runs.items():
+        images = len(image_files) - run["failed"]
+        print(f"{name:<16} {format_cpu_list(run['cpus']):<12} {run['concurrency']:>8} "
+              f"{images / run['elapsed_s']:>10.2f} {run['peak_rss_kb'] / 1024:>12.1f} "
+              f"{run['failed']:>7}")
+    print("-" * 70)
+
+    # Per-operation avg and p99, relative to the first envelope
+    names = list(runs)
+    baseline = names[0]
+    print(f"\nAvg / p99 ms per operation (change vs. {baseline}):")
+    print(f"{'Operation':<20} " + " ".join(f"{n[:22]:>22}" for n in names))
+    print("-" * 70)
+    for op_name, _, _ in OPERATIONS:
+        for fmt_name, _, _ in FORMATS:
+            key = f"{op_name}_{fmt_name}"
+            base_times = runs[baseline]["times_ms"][key]
+            base_avg = sum(base_times) / len(base_times) if base_times else 0
+            cells = []
+            for name in names:
+                times = runs[name]["times_ms"][key]
+                if not times:
+                    cells.append(f"{'-':>22}")
+                    continue
+                avg = sum(times) / len(times)
+                change = f" {(avg / base_avg - 1) * 100:+.0f}%" if base_avg and name != baseline else ""
+                cells.append(f"{f'{avg:.1f}/{percentile(times, 99):.1f}{change}':>22}")
+            print(f"{key:<20} " + " ".join(cells))
+    print("-" * 70)
+
+
+def main():
+    # Child-process entry point used by run_envelopes(); not meant to be run by hand
+    parser = argparse.ArgumentParser(description="Run the benchmark in one envelope (internal).")
+    parser.add_argument("--child", action="store_true", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--formats", required=True)
+    parser.add_argument("--effort", default="")
+    parser.add_argument("--cpus", default=None)
+    parser.add_argument("--mem", type=int, default=None)
+    parser.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    # Confine this process before pyvips starts any threads, so they all inherit it
+    if args.cpus:
+        os.sched_setaffinity(0, parse_cpu_list(args.cpus))
+    if args.mem:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        resource.setrlimit(resource.RLIMIT_AS, (args.mem, hard))
+
+    from profile_vips import ENCODER_EFFORT, select_formats
+
+    select_formats(args.formats.split(","))
+    for item in filter(None, args.effort.split(",")):
+        name, _, value = item.partition("=")
+        ENCODER_EFFORT[name] = int(value)
+    run = run_child([Path(p) for p in args.images], Path(args.output))
+    json.dump(run, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
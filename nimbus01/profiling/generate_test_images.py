@@ -11,6 +11,7 @@ import math
 import os
 import random
 import sys
+import tarfile
 
 try:
     import numpy as np
@@ -180,7 +181,7 @@ def add_text_overlay(img: Image.Image, image_number: int, resolution_name: str)
     return img
 
 
-def generate_images(preset: str, output_dir: str, num_images: int, quality: int) -> None:
+def generate_images(preset: str, output_dir: str, num_images: int, quality: int) -> str:
     """Generate a set of test images for a given preset."""
     if preset not in PRESETS:
         print(f"Error: Unknown preset '{preset}'. Available: {', '.join(PRESETS.keys())}")
@@ -211,6 +212,22 @@ def generate_images(preset: str, output_dir: str, num_images: int, quality: int)
         print(f"saved {filename} ({file_size:.1f} MB)")
     
     print(f"Done! Generated {num_images} images in {preset_dir}")
+    return preset_dir
+
+
+def write_tar(preset_dir: str) -> None:
+    """Pack a preset directory into an uncompressed tar next to it.
+    
+    JPEGs don't compress further, so plain tar keeps ingest I/O-bound
+    rather than spending CPU on decompression.
+    """
+    tar_path = preset_dir.rstrip(os.sep) + ".tar"
+    with tarfile.open(tar_path, "w") as tf:
+        for name in sorted(os.listdir(preset_dir)):
+            tf.add(os.path.join(preset_dir, name),
+                   arcname=os.path.join(os.path.basename(preset_dir), name))
+    size = os.path.getsize(tar_path) / (1024 * 1024)
+    print(f"Wrote archive {tar_path} ({size:.1f} MB)")
 
 
 def main():
@@ -229,6 +246,7 @@ Examples:
   {sys.argv[0]} --preset 24mp
   {sys.argv[0]} --preset 48mp --num 5 --quality 90
   {sys.argv[0]} --preset all
+  {sys.argv[0]} --preset 12mp --num 100 --tar
         """
     )
     
@@ -255,6 +273,11 @@ Examples:
         default=DEFAULT_JPEG_QUALITY,
         help=f"JPEG quality 1-100 (default: {DEFAULT_JPEG_QUALITY})"
     )
+    parser.add_argument(
+        "--tar",
+        action="store_true",
+        help="Also pack each preset into <output>/<preset>.tar for archive ingest"
+    )
     
     args = parser.parse_args()
     
@@ -267,12 +290,13 @@ Examples:
     os.makedirs(args.output, exist_ok=True)
     
     # Generate images
-    if args.preset == "all":
-        for preset in PRESETS.keys():
-            generate_images(preset, args.output, args.num, args.quality)
+    presets = list(PRESETS.keys()) if args.preset == "all" else [args.preset]
+    for preset in presets:
+        preset_dir = generate_images(preset, args.output, args.num, args.quality)
+        if args.tar:
+            write_tar(preset_dir)
+        if args.preset == "all":
             print()
-    else:
-        generate_images(args.preset, args.output, args.num, args.quality)
 
 
 if __name__ == "__main__":
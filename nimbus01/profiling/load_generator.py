@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Load generator for thumbnail_server.py.
+
+Closed-loop mode runs N clients that each issue requests back to back over a
+keep-alive connection. Open-loop mode issues requests on a Poisson schedule at
+a target rate regardless of how fast the server answers, and measures latency
+from the scheduled send time so a stalled server cannot hide its queueing
+delay. Both report throughput and p50/p99 latency for each load level.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from profile_vips import ALL_FORMATS, DEFAULT_FORMATS, OPERATIONS, get_image_files, percentile
+
+DEFAULT_URL = "127.0.0.1:8080"
+DEFAULT_DURATION = 10.0
+DEFAULT_CONCURRENCY = "1,2,4,8,16,32"
+DEFAULT_RATES = "1,2,4,8,16"
+
+
+@dataclass
+class LevelResult:
+    """Outcome of one load level (concurrency or arrival rate)."""
+    level: float
+    elapsed_s: float = 0
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    rejected: int = 0
+    bytes_in: int = 0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies_ms) / self.elapsed_s if self.elapsed_s else 0
+
+
+class HttpClient:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, path: str) -> Tuple[int, int]:
+        """Issue GET path; returns (status, body length)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode())
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed connection")
+        status = int(status_line.split()[1])
+        length = 0
+        close = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+        await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status, length
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def record(result: LevelResult, start: float, status: int, length: int) -> None:
+    if status == 200:
+        result.latencies_ms.append((time.perf_counter() - start) * 1000)
+        result.bytes_in += length
+    elif status == 503:
+        result.rejected += 1
+    else:
+        result.errors += 1
+
+
+async def run_closed_loop(host: str, port: int, paths: List[str],
+                          concurrency: int, duration: float) -> LevelResult:
+    """Run concurrency clients back to back for duration seconds."""
+    result = LevelResult(concurrency)
+    deadline = time.perf_counter() + duration
+
+    async def client() -> None:
+        conn = HttpClient(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    status, length = await conn.request(random.choice(paths))
+                except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                    conn.close()
+                    result.errors += 1
+                    continue
+                record(result, start, status, length)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    result.elapsed_s = time.perf_counter() - start
+    return result
+
+
+async def run_open_loop(host: str, port: int, paths: List[str],
+                        rate: float, duration: float) -> LevelResult:
+    """Issue Poisson arrivals at rate req/s for duration seconds."""
+    result = LevelResult(rate)
+    idle: List[HttpClient] = []
+
+    async def one_request(scheduled: float) -> None:
+        conn = idle.pop() if idle else HttpClient(host, port)
+        try:
+            status, length = await conn.request(random.choice(paths))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            conn.close()
+            result.errors += 1
+            return
+        # Latency counts from the scheduled arrival, not from when we got to send
+        record(result, scheduled, status, length)
+        idle.append(conn)
+
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival < start + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one_request(next_arrival)))
+        next_arrival += random.expovariate(rate)
+    await asyncio.gather(*tasks)
+    result.elapsed_s = time.perf_counter() - start
+    for conn in idle:
+        conn.close()
+    return result
+
+
+def print_level_results(mode: str, results: List[LevelResult]) -> None:
+    """Print formatted load test results."""
+    label = "Clients" if mode == "closed" else "Rate/s"
+    print("\n" + "=" * 70)
+    print(f"LOAD TEST RESULTS ({mode}-loop)")
+    print("=" * 70)
+
+    print(f"\n{label:>8} {'Done':>7} {'503':>6} {'Err':>5} {'Req/s':>9} "
+          f"{'p50 (ms)':>10} {'p99 (ms)':>10} {'MB/s':>8}")
+    print("-" * 70)
+    for r in results:
+        mb_s = r.bytes_in / r.elapsed_s / 1e6 if r.elapsed_s else 0
+        print(f"{r.level:>8g} {len(r.latencies_ms):>7} {r.rejected:>6} {r.errors:>5} "
+              f"{r.throughput:>9.2f} {percentile(r.latencies_ms, 50):>10.2f} "
+              f"{percentile(r.latencies_ms, 99):>10.2f} {mb_s:>8.2f}")
+    print("-" * 70)
+
+
+def parse_levels(text: str) -> List[float]:
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Closed- and open-loop load generator for thumbnail_server.py.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/24mp
+  {sys.argv[0]} --input ./sample_input/24mp --mode open --rates 2,4,8 --duration 30
+  {sys.argv[0]} --input ./sample_input/24mp --operation display --format jpeg
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Directory the server was started with (used to pick request names)"
+    )
+    parser.add_argument(
+        "--url", "-u",
+        default=DEFAULT_URL,
+        help=f"Server host:port (default: {DEFAULT_URL})"
+    )
+    parser.add_argument(
+        "--mode", "-m",
+        choices=["closed", "open"],
+        default="closed",
+        help="Closed loop (fixed clients) or open loop (fixed arrival rate)"
+    )
+    parser.add_argument(
+        "--concurrency", "-c",
+        default=DEFAULT_CONCURRENCY,
+        help=f"Comma-separated client counts for closed loop (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--rates", "-r",
+        default=DEFAULT_RATES,
+        help=f"Comma-separated arrival rates for open loop (default: {DEFAULT_RATES})"
+    )
+    parser.add_argument(
+        "--duration", "-d",
+        type=float,
+        default=DEFAULT_DURATION,
+        help=f"Seconds per load level (default: {DEFAULT_DURATION})"
+    )
+    parser.add_argument(
+        "--operation",
+        choices=[name for name, _, _ in OPERATIONS] + ["all"],
+        default="all",
+        help="Derivative to request (default: all)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=[name for name, _, _ in ALL_FORMATS] + ["all"],
+        default="all",
+        help=f"Output format to request; the server must serve it (see its --formats). "
+             f"'all' cycles the default formats, {', '.join(DEFAULT_FORMATS)} (default: all)"
+    )
+
+    args = parser.parse_args()
+
+    host, _, port = args.url.rpartition(":")
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    ops = [name for name, _, _ in OPERATIONS if args.operation in (name, "all")]
+    fmts = DEFAULT_FORMATS if args.format == "all" else [args.format]
+    paths = [f"/{op}/{f.stem}.{fmt}" for f in image_files for op in ops for fmt in fmts]
+
+    print(f"Thumbnail Server Load Test")
+    print(f"==========================")
+    print(f"Target: http://{host}:{port}/")
+    print(f"Request mix: {len(paths)} paths ({', '.join(ops)} x {', '.join(fmts)})")
+    print(f"Duration per level: {args.duration:.1f} s")
+
+    results = []
+    levels = parse_levels(args.concurrency if args.mode == "closed" else args.rates)
+    for level in levels:
+        print(f"  Running {args.mode}-loop level {level:g}...", end=" ", flush=True)
+        if args.mode == "closed":
+            coro = run_closed_loop(host, int(port), paths, int(level), args.duration)
+        else:
+            coro = run_open_loop(host, int(port), paths, level, args.duration)
+        try:
+            result = asyncio.run(coro)
+        except OSError as e:
+            print(f"error: {e}")
+            sys.exit(1)
+        results.append(result)
+        print(f"{result.throughput:.2f} req/s")
+
+    print_level_results(args.mode, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Prometheus metrics for profile_vips.py runs.
+
+Renders per-operation latency histograms, output bytes and throughput in
+the Prometheus text format (or OpenMetrics for pull clients that ask for it).
+Metrics can be written to a node_exporter textfile-collector directory,
+served from a local /metrics endpoint, or both. Long runs refresh the
+textfile periodically so dashboards follow a batch job while it runs.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# Debian/Ubuntu prometheus-node-exporter reads *.prom files from here
+DEFAULT_TEXTFILE_DIR = "/var/lib/prometheus/node-exporter"
+TEXTFILE_NAME = "vips_profile.prom"
+DEFAULT_INTERVAL = 15.0         # Seconds between textfile refreshes
+METRIC_PREFIX = "vips_profile"
+
+# Latency buckets in seconds, from tiny thumbnails to large AVIF encodes
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+@dataclass
+class MetricsState:
+    """Live view of a run that the exporter renders on demand."""
+    mode: str
+    results: dict
+    images: Callable[[], int]
+    started: float = field(default_factory=time.time)
+    extra_gauges: Dict[str, float] = field(default_factory=dict)
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + body + "}" if body else ""
+
+
+def render_metrics(state: MetricsState, openmetrics: bool = False) -> str:
+    """Render the current state in Prometheus text or OpenMetrics format."""
+    p = METRIC_PREFIX
+    lines = []
+
+    def header(name: str, kind: str, help_text: str) -> None:
+        # OpenMetrics names the counter family without the _total suffix
+        family = name[:-len("_total")] if openmetrics and kind == "counter" else name
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+
+    base = {"mode": state.mode}
+
+    header(f"{p}_operation_duration_seconds", "histogram",
+           "Resize plus encode latency per derivative.")
+    for result in state.results.values():
+        if not result.times_ms:
+            continue
+        labels = dict(base, operation=result.operation, format=result.format)
+        seconds = [t / 1000 for t in result.times_ms]
+        for bound in LATENCY_BUCKETS:
+            count = sum(1 for s in seconds if s <= bound)
+            lines.append(f"{p}_operation_duration_seconds_bucket"
+                         f"{format_labels(dict(labels, le=str(bound)))} {count}")
+        lines.append(f"{p}_operation_duration_seconds_bucket"
+                     f"{format_labels(dict(labels, le='+Inf'))} {len(seconds)}")
+        lines.append(f"{p}_operation_duration_seconds_sum{format_labels(labels)} {sum(seconds):.6f}")
+        lines.append(f"{p}_operation_duration_seconds_count{format_labels(labels)} {len(seconds)}")
+
+    header(f"{p}_output_bytes_total", "counter", "Encoded bytes written per derivative type.")
+    for result in state.results.values():
+        if result.bytes_out:
+            labels = dict(base, operation=result.operation, format=result.format)
+            lines.append(f"{p}_output_bytes_total{format_labels(labels)} {sum(result.bytes_out)}")
+
+    elapsed = max(time.time() - state.started, 1e-9)
+    images = state.images()
+    header(f"{p}_images_processed_total", "counter", "Source images fully processed.")
+    lines.append(f"{p}_images_processed_total{format_labels(base)} {images}")
+    header(f"{p}_images_per_second", "gauge", "Source images processed per second of wall time.")
+    lines.append(f"{p}_images_per_second{format_labels(base)} {images / elapsed:.4f}")
+    header(f"{p}_run_duration_seconds", "gauge", "Wall time since the run started.")
+    lines.append(f"{p}_run_duration_seconds{format_labels(base)} {elapsed:.3f}")
+    header(f"{p}_last_update_timestamp_seconds", "gauge", "When these metrics were rendered.")
+    lines.append(f"{p}_last_update_timestamp_seconds{format_labels(base)} {time.time():.3f}")
+    for name, value in state.extra_gauges.items():
+        header(f"{p}_{name}", "gauge", f"Run-specific value {name}.")
+        lines.append(f"{p}_{name}{format_labels(base)} {value}")
+
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(text: str, directory: Path, name: str = TEXTFILE_NAME) -> Path:
+    """Atomically write metrics so node_exporter never reads a partial file."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / name
+    tmp = directory / f".{name}.{os.getpid()}.tmp"
+    tmp.write_text(text)
+    os.replace(tmp, path)
+    return path
+
+
+class MetricsExporter:
+    """Refresh a textfile and/or serve /metrics for the lifetime of a run."""
+
+    def __init__(self, state: MetricsState, textfile_dir: Optional[Path] = None,
+                 port: Optional[int] = None, interval: float = DEFAULT_INTERVAL):
+        self.state = state
+        self.textfile_dir = textfile_dir
+        self.port = port
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.server = None
+
+    def start(self) -> None:
+        """Start exporting; raises OSError if the textfile can't be written or the port bound."""
+        if self.textfile_dir is not None:
+            # Fail before the run rather than after it
+            write_textfile(render_metrics(self.state), self.textfile_dir)
+            t = threading.Thread(target=self._refresh_loop, daemon=True)
+            t.start()
+            self.threads.append(t)
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("", self.port), self._handler())
+            t = threading.Thread(target=self.server.serve_forever, daemon=True)
+            t.start()
+            self.threads.append(t)
+            print(f"Serving metrics on http://localhost:{self.port}/metrics")
+
+    def stop(self) -> None:
+        """Stop background work and write the final textfile."""
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+        if self.textfile_dir is not None:
+            try:
+                path = write_textfile(render_metrics(self.state), self.textfile_dir)
+            except OSError as e:
+                print(f"  warning: could not write metrics textfile: {e}")
+            else:
+                print(f"Metrics written to: {path}")
+
+    def _refresh_loop(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                write_textfile(render_metrics(self.state), self.textfile_dir)
+            except OSError as e:
+                print(f"  warning: could not write metrics textfile: {e}")
+
+    def _handler(self):
+        state = self.state
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = render_metrics(state, openmetrics).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics
+                                 else PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+        return Handler
@@ -0,0 +1,139 @@
+"""
+Cold vs. warm page-cache input measurement for profile_vips.py --cache-state.
+
+Before a cold measurement each input is flushed and dropped from the page
+cache with posix_fadvise(POSIX_FADV_DONTNEED), which works on files we can
+open without needing root (unlike drop_caches). The file is then read in
+full and decoded from memory, so storage read time and decode time are
+reported separately. mincore() checks that the eviction took effect, since
+some filesystems (tmpfs, some overlay and network mounts) ignore the hint.
+"""
+
+import ctypes
+import mmap
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from profile_vips import percentile, pyvips
+
+EVICTION_WARN_RESIDENT = 0.1    # Warn if more than this fraction stayed cached
+PRIME_CHUNK_BYTES = 1 << 20     # Read size when pulling a file into the cache
+
+
+@dataclass
+class InputTimings:
+    """Read and decode timings for one cache state."""
+    read_ms: List[float] = field(default_factory=list)
+    decode_ms: List[float] = field(default_factory=list)
+    bytes_read: List[int] = field(default_factory=list)
+    resident_after_evict: List[float] = field(default_factory=list)
+
+
+def supported() -> bool:
+    return hasattr(os, "posix_fadvise")
+
+
+def evict(path: str) -> None:
+    """Drop a file's pages from the page cache (dirty pages are flushed first)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def resident_fraction(path: str) -> Optional[float]:
+    """Fraction of a file's pages in the page cache, or None if unknown."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0.0
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int,
+                              ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+    except (OSError, AttributeError):
+        return None
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            return None
+        try:
+            vec = (ctypes.c_ubyte * pages)()
+            if libc.mincore(addr, size, vec) != 0:
+                return None
+            return sum(v & 1 for v in vec) / pages
+        finally:
+            libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+def prime(path: str) -> None:
+    """Read a file once, untimed, so its pages are in the page cache."""
+    with open(path, "rb", buffering=0) as f:
+        while f.read(PRIME_CHUNK_BYTES):
+            pass
+
+
+def measure_input(path: str, timings: InputTimings, cold: bool) -> None:
+    """Read a file in full, then decode it from memory, timing each step.
+
+    A warm measurement reads the file once beforehand, so it is warm even
+    on the first pass.
+    """
+    if cold:
+        evict(path)
+        resident = resident_fraction(path)
+        if resident is not None:
+            timings.resident_after_evict.append(resident)
+    else:
+        prime(path)
+
+    start = time.perf_counter()
+    with open(path, "rb", buffering=0) as f:
+        data = f.read()
+    timings.read_ms.append((time.perf_counter() - start) * 1000)
+    timings.bytes_read.append(len(data))
+
+    start = time.perf_counter()
+    pyvips.Image.new_from_buffer(data, "").copy_memory()
+    timings.decode_ms.append((time.perf_counter() - start) * 1000)
+
+
+def print_input_results(states: Dict[str, InputTimings]) -> None:
+    """Print read vs. decode timing per cache state."""
+    print("\n" + "=" * 70)
+    print("INPUT READ VS DECODE")
+    print("=" * 70)
+    print(f"\n{'Cache':<8} {'Count':>6} {'Read avg':>10} {'Read p99':>10} {'Read MB/s':>10} "
+          f"{'Decode avg':>11} {'Read share':>11}")
+    print("-" * 70)
+    for state, t in states.items():
+        if not t.read_ms:
+            continue
+        read_avg = sum(t.read_ms) / len(t.read_ms)
+        decode_avg = sum(t.decode_ms) / len(t.decode_ms)
+        mb_per_s = sum(t.bytes_read) / 1e6 / (sum(t.read_ms) / 1000 or 1e-9)
+        share = read_avg / (read_avg + decode_avg) * 100
+        print(f"{state:<8} {len(t.read_ms):>6} {read_avg:>10.2f} {percentile(t.read_ms, 99):>10.2f} "
+              f"{mb_per_s:>10.1f} {decode_avg:>11.2f} {share:>10.1f}%")
+    print("-" * 70)
+    print("(times in ms; read is the full file from storage or page cache, decode is from memory)")
+
+    cold, warm = states.get("cold"), states.get("warm")
+    if cold and warm and cold.read_ms and warm.read_ms:
+        extra = sum(cold.read_ms) / len(cold.read_ms) - sum(warm.read_ms) / len(warm.read_ms)
+        print(f"\nCold read penalty: {extra:.2f} ms per image")
+    if cold and cold.resident_after_evict:
+        worst = max(cold.resident_after_evict)
+        if worst > EVICTION_WARN_RESIDENT:
+            print(f"WARNING: up to {worst * 100:.0f}% of a file stayed cached after eviction; "
+                  f"this filesystem may ignore posix_fadvise, so 'cold' reads are not cold")
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Per-operation profiling for profile_vips.py --profile.
+
+Each (operation, format) stage runs in its own child interpreter with
+cProfile around the load/resize/save work and VIPS_PROFILE set, because
+libvips only writes its profile (vips-profile.txt) when the process exits.
+Both profiles are converted to collapsed-stack files ("frame;frame;frame N",
+N in microseconds) that flamegraph.pl, speedscope and inferno read directly,
+so Python harness time can be told apart from libvips internals.
+
+Files written to the profile directory, per stage:
+  <op>_<fmt>.pstats         raw cProfile data (snakeviz, pstats)
+  <op>_<fmt>.python.folded  Python call stacks from cProfile
+  <op>_<fmt>.vips.folded    libvips thread/gate work time
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from profile_vips import (ALL_FORMATS, ENCODER_EFFORT, FORMATS, OPERATIONS, pyvips,
+                          resize_image)
+
+VIPS_PROFILE_FILE = "vips-profile.txt"
+MAX_STACK_DEPTH = 64
+MIN_WEIGHT_US = 1               # Drop apportioned stacks smaller than this
+TOP_N = 5
+
+
+def run_stage(op_name: str, fmt_name: str, image_files: List[Path], output_dir: Path,
+              pstats_path: Path) -> None:
+    """Run one stage over all images under cProfile (child process side)."""
+    max_size, quality = {o[0]: o[1:] for o in OPERATIONS}[op_name]
+    ext, save_func = {f[0]: f[1:] for f in ALL_FORMATS}[fmt_name]
+    profiler = cProfile.Profile()
+    for image_path in image_files:
+        output_path = output_dir / f"{image_path.stem}_{op_name}{ext}"
+        profiler.enable()
+        img = pyvips.Image.new_from_file(str(image_path))
+        save_func(resize_image(img, max_size), str(output_path), quality)
+        profiler.disable()
+        output_path.unlink()
+    profiler.dump_stats(str(pstats_path))
+
+
+def frame_name(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name.strip("<>")  # Built-ins, e.g. "built-in method time.sleep"
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def pstats_to_folded(pstats_path: Path) -> Dict[str, int]:
+    """Convert cProfile data into collapsed stacks.
+
+    cProfile only keeps caller->callee edges, not full stacks, so each
+    function's self time is apportioned up the call graph in proportion to
+    the time each caller spent calling it.
+    """
+    stats = pstats.Stats(str(pstats_path)).stats
+    folded: Dict[str, int] = defaultdict(int)
+
+    def walk(func, stack: List[str], weight: float, seen: frozenset) -> None:
+        callers = stats[func][4]
+        parents = [(c, v[3]) for c, v in callers.items() if c in stats and c not in seen]
+        total = sum(t for _, t in parents)
+        if not parents or total <= 0 or len(stack) >= MAX_STACK_DEPTH:
+            folded[";".join(reversed(stack))] += int(weight)
+            return
+        for caller, t in parents:
+            share = weight * t / total
+            if share >= MIN_WEIGHT_US:
+                walk(caller, stack + [frame_name(caller)], share, seen | {caller})
+
+    for func, (_, _, tottime, _, _) in stats.items():
+        weight = tottime * 1e6
+        if weight >= MIN_WEIGHT_US:
+            walk(func, [frame_name(func)], weight, frozenset([func]))
+    return folded
+
+
+def vips_profile_to_folded(profile_path: Path) -> Dict[str, int]:
+    """Convert a libvips vips-profile.txt into collapsed stacks.
+
+    Each gate records start/stop times in microseconds per thread; the
+    stack is libvips;<thread>;<gate> weighted by total time inside the gate.
+    """
+    folded: Dict[str, int] = defaultdict(int)
+    thread = gate = None
+    starts: List[int] = []
+    mode = None
+    for line in profile_path.read_text().splitlines():
+        if line.startswith("thread: "):
+            thread = re.sub(r"\s*\(0x[0-9a-f]+\)$", "", line[len("thread: "):])
+        elif line.startswith("gate: "):
+            gate = line[len("gate: "):]
+        elif line in ("start:", "stop:"):
+            mode = line[:-1]
+        elif mode == "start":
+            starts = [int(v) for v in line.split()]
+            mode = None
+        elif mode == "stop":
+            stops = [int(v) for v in line.split()]
+            mode = None
+            if gate and gate != "memory":
+                total = sum(b - a for a, b in zip(starts, stops))
+                if total > 0:
+                    folded[f"libvips;{thread};{gate}"] += total
+    return folded
+
+
+def write_folded(folded: Dict[str, int], path: Path) -> None:
+    with open(path, "w") as f:
+        for stack, weight in sorted(folded.items()):
+            if weight > 0:
+                f.write(f"{stack} {weight}\n")
+
+
+def print_top(title: str, folded: Dict[str, int], suffix: str = "") -> None:
+    """Print the heaviest leaf frames of a collapsed profile ending in suffix."""
+    leaves: Dict[str, int] = defaultdict(int)
+    for stack, weight in folded.items():
+        leaf = stack.rsplit(";", 1)[-1]
+        if leaf.endswith(suffix):
+            leaves[leaf] += weight
+    total = sum(leaves.values()) or 1
+    print(f"    {title} (total {total / 1000:.2f} ms):")
+    for name, weight in sorted(leaves.items(), key=lambda kv: -kv[1])[:TOP_N]:
+        print(f"      {weight / 1000:10.2f} ms {weight / total * 100:5.1f}%  {name}")
+
+
+def run_profile(image_files: List[Path], output_dir: Path, profile_dir: Path) -> None:
+    """Profile every active (operation, format) stage in a child process."""
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    effort = ",".join(f"{k}={v}" for k, v in ENCODER_EFFORT.items())
+    env = dict(os.environ, VIPS_PROFILE="1")
+    script = Path(__file__).resolve()
+    file_list = "\0".join(str(p) for p in image_files)
+
+    print(f"Profiling {len(OPERATIONS) * len(FORMATS)} stages into {profile_dir}")
+    for op_name, _, _ in OPERATIONS:
+        for fmt_name, _, _ in FORMATS:
+            key = f"{op_name}_{fmt_name}"
+            pstats_path = profile_dir / f"{key}.pstats"
+            print(f"\n  [{key}]")
+            with tempfile.TemporaryDirectory() as work_dir:
+                cmd = [sys.executable, str(script), "--stage", key,
+                       "--output", str(output_dir), "--pstats", str(pstats_path),
+                       "--effort", effort]
+                # The image list goes over stdin, NUL-separated: large recursive
+                # inputs would overflow ARG_MAX as argv
+                proc = subprocess.run(cmd, cwd=work_dir, env=env, input=file_list,
+                                      capture_output=True, text=True)
+                if proc.returncode != 0:
+                    lines = proc.stderr.strip().splitlines()
+                    print(f"    error: {lines[-1] if lines else f'exit code {proc.returncode}'}")
+                    continue
+                python_folded = pstats_to_folded(pstats_path)
+                vips_path = Path(work_dir) / VIPS_PROFILE_FILE
+                vips_folded = vips_profile_to_folded(vips_path) if vips_path.exists() else {}
+
+            write_folded(python_folded, profile_dir / f"{key}.python.folded")
+            write_folded(vips_folded, profile_dir / f"{key}.vips.folded")
+            in_libvips = sum(w for stack, w in python_folded.items()
+                             if stack.rsplit(";", 1)[-1].startswith("built-in method _libvips."))
+            harness = sum(python_folded.values()) - in_libvips
+            print(f"    Python: {in_libvips / 1000:.2f} ms blocked in libvips calls, "
+                  f"{harness / 1000:.2f} ms harness overhead")
+            print_top("Python (cProfile self time)", python_folded)
+            if vips_folded:
+                # Only "work" gates are compute; the rest are waits and thread bookkeeping
+                print_top("libvips work gates (all threads)", vips_folded, ": work")
+            else:
+                print("    libvips: no profile written (libvips built without profiling?)")
+
+    print(f"\nRender with e.g.: flamegraph.pl {profile_dir}/thumbnail_jpeg.vips.folded > out.svg")
+    print(f"            or load the .folded files into https://www.speedscope.app")
+
+
+def main():
+    # Child-process entry point used by run_profile(); not meant to be run by hand.
+    # Reads the NUL-separated image paths from stdin.
+    parser = argparse.ArgumentParser(description="Run one profiled stage (internal).")
+    parser.add_argument("--stage", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--pstats", required=True)
+    parser.add_argument("--effort", default="")
+    args = parser.parse_args()
+    images = [Path(p) for p in sys.stdin.read().split("\0") if p]
+
+    for item in filter(None, args.effort.split(",")):
+        name, _, value = item.partition("=")
+        ENCODER_EFFORT[name] = int(value)
+    op_name, _, fmt_name = args.stage.partition("_")
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    run_stage(op_name, fmt_name, images, output_dir, Path(args.pstats))
+
+
+if __name__ == "__main__":
+    main()
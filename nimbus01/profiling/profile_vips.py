@@ -3,17 +3,23 @@
 Profile VIPS image processing library performance.
 
 Benchmarks resizing images to thumbnail and display sizes
-in both JPEG and WebP formats.
+in JPEG and WebP, plus AVIF, HEIC and JPEG XL when the local
+libvips build can encode them.
 """
 
 import argparse
+import itertools
+import mmap
 import os
+import shutil
 import statistics
 import sys
+import tempfile
 import time
+import zlib
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
 try:
     import pyvips
@@ -33,6 +39,55 @@ THUMBNAIL_QUALITY = 80        # Quality for thumbnail (JPEG/WebP)
 # Supported input formats
 SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tiff", ".tif", ".webp"}
 
+# Derivative operations: (name, max_size, quality)
+OPERATIONS = [
+    ("thumbnail", THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY),
+    ("display", DISPLAY_MAX_SIZE, DISPLAY_QUALITY),
+]
+
+# Encoder effort (CPU spent searching for smaller output; higher is slower)
+ENCODER_EFFORT = {
+    "webp": 4,                # 0-6
+    "avif": 4,                # 0-9 (libaom speed is 9 - effort)
+    "heic": 4,                # 0-9
+    "jxl": 7,                 # 1-9
+}
+
+# Saver options beyond Q and effort, per format
+SAVER_OPTIONS = {
+    "avif": {"compression": "av1"},
+    "heic": {"compression": "hevc"},
+}
+
+
+def saver_options(fmt_name: str, quality: int) -> dict:
+    """Keyword arguments for fmt_name's saver, to file or to buffer."""
+    options = {"Q": quality, **SAVER_OPTIONS.get(fmt_name, {})}
+    if fmt_name in ENCODER_EFFORT:
+        options["effort"] = ENCODER_EFFORT[fmt_name]
+    return options
+
+
+# All known output formats: (name, extension, save function)
+ALL_FORMATS = [
+    ("jpeg", ".jpg", lambda img, path, q: img.jpegsave(path, **saver_options("jpeg", q))),
+    ("webp", ".webp", lambda img, path, q: img.webpsave(path, **saver_options("webp", q))),
+    ("avif", ".avif", lambda img, path, q: img.heifsave(path, **saver_options("avif", q))),
+    ("heic", ".heic", lambda img, path, q: img.heifsave(path, **saver_options("heic", q))),
+    ("jxl", ".jxl", lambda img, path, q: img.jxlsave(path, **saver_options("jxl", q))),
+]
+FORMAT_EXTENSIONS = {name: ext for name, ext, _ in ALL_FORMATS}
+DEFAULT_FORMATS = ["jpeg", "webp"]
+
+# Active output formats; change with select_formats()
+FORMATS = [f for f in ALL_FORMATS if f[0] in DEFAULT_FORMATS]
+
+# Where benchmark_resize gets source bytes from:
+#   path   - new_from_file, as a file-based worker would
+#   memory - corpus preloaded into RAM, new_from_buffer (the HTTP upload path)
+#   mmap   - file mapped and decoded in place via a memory Source (no copy)
+INPUT_SOURCES = ["path", "memory", "mmap"]
+
 
 @dataclass
 class TimingResult:
@@ -40,6 +95,8 @@ class TimingResult:
     operation: str
     format: str
     times_ms: List[float] = field(default_factory=list)
+    bytes_out: List[int] = field(default_factory=list)
+    starts_s: List[float] = field(default_factory=list)  # perf_counter() at start
     
     @property
     def count(self) -> int:
@@ -60,21 +117,148 @@ class TimingResult:
     @property
     def stdev(self) -> float:
         return statistics.stdev(self.times_ms) if len(self.times_ms) > 1 else 0
+    
+    @property
+    def avg_kb(self) -> float:
+        return statistics.mean(self.bytes_out) / 1024 if self.bytes_out else 0
+
+
+def encode_buffer(img: pyvips.Image, fmt_name: str, quality: int) -> bytes:
+    """Encode to memory with the same options as fmt_name's file saver."""
+    return img.write_to_buffer(FORMAT_EXTENSIONS[fmt_name], **saver_options(fmt_name, quality))
+
+
+def available_formats() -> List[str]:
+    """Names of output formats the local libvips build can actually encode.
+    
+    Probes with a tiny encode rather than checking for the saver, since e.g.
+    heifsave may exist with only some of its compression plugins.
+    """
+    probe = pyvips.Image.black(16, 16, bands=3)
+    names = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, ext, save_func in ALL_FORMATS:
+            try:
+                save_func(probe, os.path.join(tmp, "probe" + ext), 50)
+            except (pyvips.Error, AttributeError):  # AttributeError: no such saver
+                continue
+            names.append(name)
+    return names
+
+
+def select_formats(names: List[str]) -> None:
+    """Make names the active output formats, in ALL_FORMATS order."""
+    FORMATS[:] = [f for f in ALL_FORMATS if f[0] in names]
+
+
+def parse_formats(text: str) -> List[str]:
+    """Select the --formats list (or 'all') that the local libvips can encode.
+    
+    Exits with an error on unknown names or when nothing is left; returns
+    the requested formats skipped as unsupported, for the banner.
+    """
+    known = [name for name, _, _ in ALL_FORMATS]
+    requested = known if text == "all" else text.split(",")
+    unknown = [name for name in requested if name not in known]
+    if unknown:
+        print(f"Error: Unknown format(s): {', '.join(unknown)}. Known: {', '.join(known)}")
+        sys.exit(1)
+    available = available_formats()
+    select_formats([name for name in requested if name in available])
+    if not FORMATS:
+        print("Error: None of the requested formats can be encoded by this libvips build")
+        sys.exit(1)
+    return [name for name in requested if name not in available]
+
+
+def parse_effort(text: str) -> dict:
+    """Parse FORMAT=N[,FORMAT=N...] into an ENCODER_EFFORT update."""
+    effort = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name not in ENCODER_EFFORT or not value.isdigit():
+            raise argparse.ArgumentTypeError(
+                f"expected FORMAT=N with FORMAT in {', '.join(ENCODER_EFFORT)}, got '{item}'")
+        effort[name] = int(value)
+    return effort
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values using linear interpolation."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def scan_image_files(
+    input_dir: str,
+    recursive: bool = False,
+    shard: Optional[Tuple[int, int]] = None
+) -> Iterator[Path]:
+    """Yield supported image files as they are found, in directory order.
+    
+    Uses os.scandir so file types come from d_type without a stat per entry.
+    With shard=(k, n), only yields files whose relative path hashes to k mod n,
+    so n independent workers can split one tree without coordinating.
+    """
+    root = str(input_dir)
+    pending = [root]
+    while pending:
+        try:
+            it = os.scandir(pending.pop())
+        except (FileNotFoundError, PermissionError):
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                if not entry.is_file():
+                    continue
+                if shard is not None:
+                    rel = os.path.relpath(entry.path, root).encode(errors="surrogateescape")
+                    if zlib.crc32(rel) % shard[1] != shard[0]:
+                        continue
+                yield Path(entry.path)
 
 
 def get_image_files(input_dir: str) -> List[Path]:
-    """Get list of supported image files in directory."""
+    """Get sorted list of supported image files in directory."""
     input_path = Path(input_dir)
     if not input_path.is_dir():
         print(f"Error: Input directory does not exist: {input_dir}")
         sys.exit(1)
     
-    files = []
-    for f in sorted(input_path.iterdir()):
-        if f.is_file() and f.suffix.lower() in SUPPORTED_EXTENSIONS:
-            files.append(f)
-    
-    return files
+    return sorted(scan_image_files(input_dir))
+
+
+def positive_int(text: str) -> int:
+    """argparse type for a count that must be at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer, got '{text}'")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """Parse a K/N shard spec."""
+    try:
+        k, n = (int(v) for v in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like K/N, got '{text}'")
+    if n < 1 or not 0 <= k < n:
+        raise argparse.ArgumentTypeError(f"shard index must satisfy 0 <= K < N, got '{text}'")
+    return k, n
 
 
 def resize_image(img: pyvips.Image, max_size: int) -> pyvips.Image:
@@ -85,84 +269,123 @@ def resize_image(img: pyvips.Image, max_size: int) -> pyvips.Image:
     return img.resize(scale)
 
 
+def new_results() -> dict:
+    """Create an empty TimingResult for every operation/format pair."""
+    return {
+        f"{op_name}_{fmt_name}": TimingResult(op_name, fmt_name)
+        for op_name, _, _ in OPERATIONS
+        for fmt_name, _, _ in FORMATS
+    }
+
+
+def open_image(image_path: Path, source: str = "path",
+               corpus: Optional[dict] = None) -> pyvips.Image:
+    """Open an image from one of INPUT_SOURCES."""
+    if source == "memory":
+        return pyvips.Image.new_from_buffer(corpus[image_path], "")
+    if source == "mmap":
+        with open(image_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The Source keeps the mapping alive for as long as the image needs it
+        return pyvips.Image.new_from_source(pyvips.Source.new_from_memory(mapped), "")
+    return pyvips.Image.new_from_file(str(image_path))
+
+
 def benchmark_resize(
     image_path: Path,
     output_dir: Path,
     results: dict,
-    verbose: bool = False
+    verbose: bool = False,
+    source: str = "path",
+    corpus: Optional[dict] = None,
+    plan=None
 ) -> None:
-    """Benchmark resizing a single image to all output sizes and formats."""
+    """Benchmark resizing a single image to all output sizes and formats.
+    
+    With a work_plan.WorkPlan, derivatives it marks as passthrough are
+    copied from the source bytes instead of rendered; their count and time
+    go to the plan rather than results.
+    """
     
     # Load image fully into memory (random access needed for multiple operations)
-    img = pyvips.Image.new_from_file(str(image_path))
+    img = open_image(image_path, source, corpus)
     
     if verbose:
         print(f"  Source: {image_path.name} ({img.width}x{img.height})")
     
     stem = image_path.stem
     
-    # Define operations: (name, max_size, quality)
-    operations = [
-        ("thumbnail", THUMBNAIL_MAX_SIZE, THUMBNAIL_QUALITY),
-        ("display", DISPLAY_MAX_SIZE, DISPLAY_QUALITY),
-    ]
-    
-    # Define output formats
-    formats = [
-        ("jpeg", ".jpg", lambda img, path, q: img.jpegsave(path, Q=q)),
-        ("webp", ".webp", lambda img, path, q: img.webpsave(path, Q=q)),
-    ]
-    
-    for op_name, max_size, quality in operations:
-        for fmt_name, ext, save_func in formats:
+    for op_name, max_size, quality in OPERATIONS:
+        for fmt_name, ext, save_func in FORMATS:
             key = f"{op_name}_{fmt_name}"
             
             # Time the resize and save operation
             start = time.perf_counter()
             
-            resized = resize_image(img, max_size)
             output_path = output_dir / f"{stem}_{op_name}{ext}"
+            if plan is not None and plan.copies(image_path, key):
+                if corpus:
+                    output_path.write_bytes(corpus[image_path])
+                else:
+                    shutil.copyfile(image_path, output_path)
+                # Copies are tallied on the plan, not mixed into the render timings
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                plan.copied += 1
+                plan.copy_ms += elapsed_ms
+                if verbose:
+                    print(f"    {op_name:10} {fmt_name:5}: {elapsed_ms:8.2f} ms (copied)")
+                continue
+            
+            resized = resize_image(img, max_size)
             save_func(resized, str(output_path), quality)
+            if plan is not None:
+                plan.rendered += 1
             
             elapsed_ms = (time.perf_counter() - start) * 1000
             results[key].times_ms.append(elapsed_ms)
+            results[key].bytes_out.append(output_path.stat().st_size)
+            results[key].starts_s.append(start)
             
             if verbose:
                 print(f"    {op_name:10} {fmt_name:5}: {elapsed_ms:8.2f} ms")
 
 
-def print_results(results: dict) -> None:
+def print_results(results: dict, title: str = "BENCHMARK RESULTS") -> None:
     """Print formatted benchmark results."""
     print("\n" + "=" * 70)
-    print("BENCHMARK RESULTS")
+    print(title)
     print("=" * 70)
     
-    print(f"\n{'Operation':<20} {'Format':<8} {'Count':>6} {'Avg (ms)':>12} {'Min (ms)':>12} {'Max (ms)':>12} {'StdDev':>10}")
+    print(f"\n{'Operation':<20} {'Format':<8} {'Count':>6} {'Avg (ms)':>12} {'Min (ms)':>12} {'Max (ms)':>12} {'StdDev':>10} {'Avg KB':>10}")
     print("-" * 70)
     
     for key, result in results.items():
         if result.count > 0:
             print(f"{result.operation:<20} {result.format:<8} {result.count:>6} "
-                  f"{result.avg:>12.2f} {result.min:>12.2f} {result.max:>12.2f} {result.stdev:>10.2f}")
+                  f"{result.avg:>12.2f} {result.min:>12.2f} {result.max:>12.2f} {result.stdev:>10.2f} "
+                  f"{result.avg_kb:>10.1f}")
     
     print("-" * 70)
     
     # Summary by format
     print("\nSUMMARY BY FORMAT:")
-    for fmt in ["jpeg", "webp"]:
+    for fmt in [name for name, _, _ in FORMATS]:
         fmt_times = []
+        fmt_bytes = []
         for key, result in results.items():
             if result.format == fmt:
                 fmt_times.extend(result.times_ms)
+                fmt_bytes.extend(result.bytes_out)
         if fmt_times:
             avg = statistics.mean(fmt_times)
             total = sum(fmt_times)
+            kb = statistics.mean(fmt_bytes) / 1024 if fmt_bytes else 0
             print(f"  {fmt.upper():5}: {len(fmt_times)} operations, "
-                  f"avg {avg:.2f} ms/op, total {total:.2f} ms")
+                  f"avg {avg:.2f} ms/op, total {total:.2f} ms, avg {kb:.1f} KB")
     
     # Summary by operation
     print("\nSUMMARY BY OPERATION:")
-    for op in ["thumbnail", "display"]:
+    for op in [name for name, _, _ in OPERATIONS]:
         op_times = []
         for key, result in results.items():
             if result.operation == op:
@@ -174,6 +397,18 @@ def print_results(results: dict) -> None:
                   f"avg {avg:.2f} ms/op, total {total:.2f} ms")
 
 
+def print_source_comparison(results_by_source: dict) -> None:
+    """Print average time per derivative for each input source side by side."""
+    sources = list(results_by_source)
+    print("\nSUMMARY BY INPUT SOURCE (avg ms):")
+    print(f"  {'Operation':<20} " + " ".join(f"{s:>10}" for s in sources))
+    first = results_by_source[sources[0]]
+    for key in first:
+        if first[key].count:
+            print(f"  {key:<20} " + " ".join(
+                f"{results_by_source[s][key].avg:>10.2f}" for s in sources))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Profile VIPS image processing library performance.",
@@ -183,18 +418,27 @@ Resize parameters:
   Display:   {DISPLAY_MAX_SIZE}px max dimension, quality {DISPLAY_QUALITY}
   Thumbnail: {THUMBNAIL_MAX_SIZE}px max dimension, quality {THUMBNAIL_QUALITY}
 
-Output formats: JPEG and WebP
+Output formats: {', '.join(DEFAULT_FORMATS)} by default; also {', '.join(f[0] for f in ALL_FORMATS if f[0] not in DEFAULT_FORMATS)}
+when the local libvips build can encode them (see --formats)
 
 Examples:
   {sys.argv[0]} --input ./sample-data/24mp
   {sys.argv[0]} --input ./sample-data/48mp --output ./results --verbose
+  {sys.argv[0]} --input ./sample-data/48mp --formats all --effort avif=6,jxl=5
+  {sys.argv[0]} --input ./sample-data/48mp --profile ./profiles
+  {sys.argv[0]} --input /archive --output /derivatives --batch --metrics-dir --metrics-port 9464
+  {sys.argv[0]} --input /archive --recursive --shard 0/4 --keep-output
+  {sys.argv[0]} --input /archive --output /derivatives --recursive --batch --jobs 16
+  {sys.argv[0]} --input ./import.tar --output /derivatives --batch --jobs 8
+  {sys.argv[0]} --input ./sample-data/48mp --pipeline 8
+  {sys.argv[0]} --input ./sample-data/48mp --envelope one-ccd:cpus=ccd:4 --envelope split:cpus=split:4
         """
     )
     
     parser.add_argument(
         "--input", "-i",
         required=True,
-        help="Input directory containing images to process"
+        help="Input directory, or a tar/zip archive read without extracting"
     )
     parser.add_argument(
         "--output", "-o",
@@ -211,16 +455,225 @@ Examples:
         action="store_true",
         help="Keep output files after benchmarking (default: delete)"
     )
+    parser.add_argument(
+        "--formats", "-f",
+        default=",".join(DEFAULT_FORMATS),
+        help=f"Comma-separated output formats, or 'all' available (default: {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        "--effort",
+        type=parse_effort,
+        default={},
+        help="Encoder effort overrides, e.g. avif=6,jxl=5,webp=4"
+    )
+    parser.add_argument(
+        "--recursive", "-r",
+        action="store_true",
+        help="Stream images from subdirectories too (outputs mirror the tree)"
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only process files hashing to shard K of N (e.g. 0/4)"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=str(Path(__file__).parent.resolve() / "sample_profile"),
+        default=None,
+        metavar="DIR",
+        help="Profile each operation/format with cProfile and VIPS_PROFILE, "
+             "writing collapsed stacks to DIR (default: ./sample_profile)"
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        nargs="?",
+        const="/var/lib/prometheus/node-exporter",
+        default=None,
+        metavar="DIR",
+        help="Write Prometheus metrics for node_exporter's textfile collector "
+             "(default DIR: /var/lib/prometheus/node-exporter)"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve live Prometheus/OpenMetrics metrics on this port during the run"
+    )
+    parser.add_argument(
+        "--batch", "-b",
+        action="store_true",
+        help="Resumable bulk generation: journal completed work, keep outputs"
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=1,
+        help="Worker processes for --batch (default: 1)"
+    )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Journal file for --batch (default: output_dir/batch_journal.log)"
+    )
+    parser.add_argument(
+        "--sample-system",
+        action="store_true",
+        help="Sample CPU frequency, temperature, load and context switches during "
+             "the run and flag timings taken while throttled"
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=0.25,
+        help="Seconds between system samples (default: 0.25)"
+    )
+    parser.add_argument(
+        "--system-log",
+        default=None,
+        help="Write raw system samples to this CSV file (implies --sample-system)"
+    )
+    parser.add_argument(
+        "--source",
+        default="path",
+        help=f"Comma-separated input sources to benchmark, each reported separately: "
+             f"{', '.join(INPUT_SOURCES)} (default: path)"
+    )
+    parser.add_argument(
+        "--cache-state",
+        choices=["cold", "warm", "both"],
+        default=None,
+        help="Also time reading and decoding each input with a cold page cache "
+             "(evicted via posix_fadvise), a warm one, or both"
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Probe all headers first on a thread pool and copy, rather than re-encode, "
+             "derivatives whose source already fits in the right format"
+    )
+    parser.add_argument(
+        "--probe-threads",
+        type=int,
+        default=16,
+        help="Threads for the --plan header probe (default: 16)"
+    )
+    parser.add_argument(
+        "--soak",
+        default=None,
+        metavar="DURATION",
+        help="Cycle the corpus for DURATION (e.g. 30m, 8h) with fixed-memory latency "
+             "histograms, and flag latency drift and memory or FD growth"
+    )
+    parser.add_argument(
+        "--soak-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between RSS/FD/vips cache samples in --soak (default: 10)"
+    )
+    parser.add_argument(
+        "--pipeline",
+        nargs="?",
+        type=positive_int,
+        const=4,
+        default=None,
+        metavar="N",
+        help="Overlap reads, processing and writes (reader prefetching N files, default 4, "
+             "plus a write-behind thread) and report the wall time saved against a sequential pass"
+    )
+    parser.add_argument(
+        "--envelope",
+        action="append",
+        default=[],
+        metavar="SPEC",
+        help="Benchmark under a resource envelope, e.g. 'slot:cpus=ccd:4,mem=8G,concurrency=4'; "
+             "repeat to compare envelopes (see envelopes.py)"
+    )
     
     args = parser.parse_args()
     
+    # Select output formats the local libvips can encode
+    ENCODER_EFFORT.update(args.effort)
+    unavailable = parse_formats(args.formats)
+    
+    sources = args.source.split(",")
+    unknown = [name for name in sources if name not in INPUT_SOURCES]
+    if unknown:
+        print(f"Error: Unknown source(s): {', '.join(unknown)}. Known: {', '.join(INPUT_SOURCES)}")
+        sys.exit(1)
+    
+    if args.cache_state:
+        from page_cache import supported
+        if not supported():
+            print(f"Error: --cache-state needs posix_fadvise, which this platform lacks")
+            sys.exit(1)
+    
+    soak_s = None
+    if args.soak:
+        from soak import parse_duration
+        try:
+            soak_s = parse_duration(args.soak)
+        except ValueError as e:
+            print(f"Error: Invalid --soak: {e}")
+            sys.exit(1)
+    
+    envelopes = []
+    if args.envelope:
+        from envelopes import parse_envelope
+        try:
+            envelopes = [parse_envelope(spec) for spec in args.envelope]
+        except ValueError as e:
+            print(f"Error: Invalid --envelope: {e}")
+            sys.exit(1)
+    
     # Setup paths
     input_dir = Path(args.input).resolve()
     script_dir = Path(__file__).parent.resolve()
     output_dir = Path(args.output).resolve() if args.output else script_dir / "sample_output"
     
     # Get image files
-    image_files = get_image_files(str(input_dir))
+    scan_start = time.perf_counter()
+    archive = input_dir.is_file()
+    archive_errors = []
+    if archive:
+        from archive_input import (ARCHIVE_ERRORS, ARCHIVE_SUFFIXES, is_archive, iter_archive,
+                                   until_error)
+        if not is_archive(input_dir):
+            print(f"Error: Input file is not an archive ({', '.join(ARCHIVE_SUFFIXES)}): {input_dir}")
+            sys.exit(1)
+        unsupported = [flag for flag, value in (
+            ("--recursive", args.recursive), ("--shard", args.shard), ("--profile", args.profile),
+            ("--envelope", envelopes), ("--soak", args.soak), ("--cache-state", args.cache_state),
+            ("--plan", args.plan), ("--pipeline", args.pipeline))
+            if value]
+        if unsupported:
+            print(f"Error: {', '.join(unsupported)} cannot be used with an archive input")
+            sys.exit(1)
+        # Members stream straight into new_from_buffer
+        sources = ["memory"]
+        image_files = iter_archive(input_dir)
+        try:
+            first = next(image_files, None)
+        except ARCHIVE_ERRORS as e:
+            print(f"Error: Cannot read archive {input_dir}: {e}")
+            sys.exit(1)
+        # A later read error ends the run early but keeps its partial results
+        image_files = until_error(itertools.chain([first], image_files), archive_errors) if first else []
+        total = "?"
+    elif args.recursive or args.shard:
+        # Stream so work starts before the whole tree has been walked
+        if not input_dir.is_dir():
+            print(f"Error: Input directory does not exist: {input_dir}")
+            sys.exit(1)
+        image_files = scan_image_files(str(input_dir), args.recursive, args.shard)
+        first = next(image_files, None)
+        # A later read error ends the run early but keeps its partial results
+        image_files = until_error(itertools.chain([first], image_files), archive_errors) if first else []
+        total = "?"
+    else:
+        image_files = get_image_files(str(input_dir))
+        total = len(image_files)
     if not image_files:
         print(f"Error: No supported image files found in {input_dir}")
         print(f"Supported formats: {', '.join(SUPPORTED_EXTENSIONS)}")
@@ -229,62 +682,291 @@ Examples:
     print(f"VIPS Image Processing Benchmark")
     print(f"================================")
     print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
-    print(f"Input directory: {input_dir}")
+    print(f"Input {'archive' if archive else 'directory'}: {input_dir}")
     print(f"Output directory: {output_dir}")
-    print(f"Images to process: {len(image_files)}")
+    if archive:
+        print(f"Images to process: streaming from archive")
+    elif total == "?":
+        shard = f", shard {args.shard[0]}/{args.shard[1]}" if args.shard else ""
+        print(f"Images to process: streaming ({'recursive' if args.recursive else 'flat'}{shard})")
+    else:
+        print(f"Images to process: {total}")
     print(f"\nResize parameters:")
     print(f"  Display:   {DISPLAY_MAX_SIZE}px, quality {DISPLAY_QUALITY}")
     print(f"  Thumbnail: {THUMBNAIL_MAX_SIZE}px, quality {THUMBNAIL_QUALITY}")
+    print(f"Output formats: {', '.join(name for name, _, _ in FORMATS)}")
+    efforts = [f"{name}={ENCODER_EFFORT[name]}" for name, _, _ in FORMATS if name in ENCODER_EFFORT]
+    if efforts:
+        print(f"Encoder effort: {', '.join(efforts)}")
+    if unavailable:
+        print(f"Skipped (not supported by this libvips build): {', '.join(unavailable)}")
+    if sources != ["path"] and not archive:
+        print(f"Input source(s): {', '.join(sources)}" + (" (ignored by --batch)" if args.batch else ""))
     print()
     
     # Create output directory
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Initialize results
-    results = {
-        "thumbnail_jpeg": TimingResult("thumbnail", "jpeg"),
-        "thumbnail_webp": TimingResult("thumbnail", "webp"),
-        "display_jpeg": TimingResult("display", "jpeg"),
-        "display_webp": TimingResult("display", "webp"),
-    }
+    # Initialize results; exporter and sampler report the first source
+    results_by_source = {name: new_results() for name in sources}
+    results = results_by_source[sources[0]]
+    
+    if args.profile:
+        from profile_hooks import run_profile
+        run_profile(list(image_files), output_dir, Path(args.profile).resolve())
+        try:
+            output_dir.rmdir()
+        except OSError:
+            pass  # Directory not empty
+        return
+    
+    if envelopes:
+        from envelopes import run_envelopes
+        print(f"Running {len(envelopes)} resource envelopes:")
+        run_envelopes(list(image_files), envelopes)
+        try:
+            output_dir.rmdir()
+        except OSError:
+            pass  # Directory not empty
+        return
+    
+    if soak_s:
+        from soak import print_soak_results, run_soak
+        print(f"Soak mode: {args.soak} ({soak_s:.0f} s), resources sampled every "
+              f"{args.soak_interval}s")
+        start = time.perf_counter()
+        try:
+            stats, resources = run_soak(list(image_files), output_dir, soak_s,
+                                        args.soak_interval, args.verbose)
+        except KeyboardInterrupt:
+            print("\nInterrupted.")
+            sys.exit(130)
+        print_soak_results(stats, resources, time.perf_counter() - start)
+        if not args.keep_output:
+            for f in output_dir.glob("soak_*"):
+                f.unlink()
+            try:
+                output_dir.rmdir()
+            except OSError:
+                pass  # Directory not empty
+        return
+    
+    if args.pipeline:
+        from pipeline import (evict_inputs, print_pipeline_results, run_pipelined,
+                              run_sequential, warm_up)
+        image_files = list(image_files)
+        print(f"Pipeline mode: prefetch {args.pipeline}, sequential pass first")
+        try:
+            warm_up(image_files)
+            evicted = evict_inputs(image_files)
+            sequential = run_sequential(image_files, input_dir, output_dir)
+            evict_inputs(image_files)
+            pipelined = run_pipelined(image_files, input_dir, output_dir, args.pipeline)
+        except KeyboardInterrupt:
+            print("\nInterrupted.")
+            sys.exit(130)
+        print_pipeline_results(sequential, pipelined, args.pipeline, evicted)
+        if not args.keep_output:
+            output_dirs = {output_dir}
+            for image_path in image_files:
+                rel_dir = image_path.parent.relative_to(input_dir)
+                output_dirs.update(output_dir / d for d in (rel_dir, *rel_dir.parents))
+                for op_name, _, _ in OPERATIONS:
+                    for _, ext, _ in FORMATS:
+                        (output_dir / rel_dir / f"{image_path.stem}_{op_name}{ext}").unlink(
+                            missing_ok=True)
+            for d in sorted(output_dirs, key=lambda p: len(p.parts), reverse=True):
+                try:
+                    d.rmdir()
+                except OSError:
+                    pass  # Directory not empty
+        return
+    
+    # Optional Prometheus export; images processed is read live from the loop below
+    processed = 0
+    batch_stats = None
+    exporter = None
+    if args.metrics_dir or args.metrics_port:
+        from metrics_exporter import MetricsExporter, MetricsState
+        state = MetricsState(
+            "batch" if args.batch else "benchmark", results,
+            lambda: batch_stats.processed if batch_stats else processed)
+        exporter = MetricsExporter(
+            state, Path(args.metrics_dir) if args.metrics_dir else None, args.metrics_port)
+        try:
+            exporter.start()
+        except OSError as e:
+            print(f"Error: Cannot export metrics: {e}")
+            sys.exit(1)
+    
+    # Optional background sampler; timings are matched to samples afterwards
+    sampler = None
+    if args.sample_system or args.system_log:
+        from system_sampler import SystemSampler
+        sampler = SystemSampler(args.sample_interval)
+        print(f"System sampling every {args.sample_interval}s: {', '.join(sampler.sources)}")
+        sampler.start()
+    
+    def stop_sampler() -> None:
+        if sampler is None:
+            return
+        sampler.stop()
+        if exporter:
+            samples = sampler.samples
+            exporter.state.extra_gauges.update({
+                "cpu_mhz_min": min(s.mean_mhz for s in samples),
+                "temperature_celsius_max": max(s.max_temp for s in samples),
+                "load1_max": max(s.load1 for s in samples),
+            })
+    
+    def report_archive_error() -> None:
+        if archive_errors:
+            print(f"\nError: Cannot read archive {input_dir} past this point: {archive_errors[0]}")
+            print("Results above cover only the members read before the error.")
+    
+    def report_sampler() -> None:
+        if sampler is None:
+            return
+        from system_sampler import print_system_report, write_samples_csv
+        print_system_report(sampler, results)
+        if args.system_log:
+            write_samples_csv(sampler, Path(args.system_log))
+            print(f"System samples written to: {args.system_log}")
+    
+    if args.batch:
+        if args.plan:
+            print("Error: --plan applies to benchmark mode, not --batch")
+            sys.exit(1)
+        from batch_process import JOURNAL_FILE, BatchStats, print_batch_stats, run_batch
+        journal_path = Path(args.journal).resolve() if args.journal else output_dir / JOURNAL_FILE
+        print(f"Batch mode: {args.jobs} jobs, journal {journal_path}")
+        batch_stats = BatchStats()
+        try:
+            stats = run_batch(image_files, input_dir, output_dir, results,
+                              args.jobs, journal_path, args.verbose, batch_stats)
+        except KeyboardInterrupt:
+            print("\nInterrupted. Re-run the same command to resume.")
+            sys.exit(130)
+        finally:
+            stop_sampler()
+            if exporter:
+                exporter.stop()
+        print_results(results)
+        print_batch_stats(stats, args.jobs)
+        report_sampler()
+        print(f"\nOutput files kept in: {output_dir}")
+        report_archive_error()
+        if archive_errors:
+            sys.exit(1)
+        return
+    
+    # Optional header probe; decides which derivatives are plain copies
+    plan = None
+    if args.plan:
+        from work_plan import build_plan, print_plan
+        image_files = list(image_files)
+        plan = build_plan(image_files, args.probe_threads)
+        print_plan(plan)
+    
+    # Optional input read/decode timing, before each image's derivatives
+    input_states = {}
+    if args.cache_state:
+        from page_cache import InputTimings, measure_input, print_input_results
+        states = ["cold", "warm"] if args.cache_state == "both" else [args.cache_state]
+        input_states = {state: InputTimings() for state in states}
+    
+    # Preload the corpus so the memory source times decode only, not storage
+    corpus = None
+    if "memory" in sources and not archive:
+        image_files = list(image_files)
+        start = time.perf_counter()
+        corpus = {image_path: image_path.read_bytes() for image_path in image_files}
+        print(f"Preloaded {len(corpus)} images ({sum(map(len, corpus.values())) / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - start:.2f} s")
     
     # Process each image
     print("Processing images...")
     total_start = time.perf_counter()
+    first_done = None
+    output_dirs = {output_dir}
     
     for i, image_path in enumerate(image_files, 1):
+        rel_dir = None
+        if archive:
+            member = image_path
+            image_path, rel_dir = member.path, member.path.parent
+            corpus = {image_path: member.data}
         if args.verbose:
-            print(f"\n[{i}/{len(image_files)}] {image_path.name}")
+            print(f"\n[{i}/{total}] {image_path.name}")
         else:
-            print(f"  Processing {i}/{len(image_files)}: {image_path.name}...", end=" ", flush=True)
+            print(f"  Processing {i}/{total}: {image_path.name}...", end=" ", flush=True)
+        
+        # Mirror subdirectories so equal file names in different folders don't collide
+        image_output_dir = output_dir / (rel_dir or image_path.parent.relative_to(input_dir))
+        if image_output_dir not in output_dirs:
+            image_output_dir.mkdir(parents=True, exist_ok=True)
+            output_dirs.add(image_output_dir)
         
         try:
-            benchmark_resize(image_path, output_dir, results, args.verbose)
+            for state, timings in input_states.items():
+                measure_input(str(image_path), timings, cold=state == "cold")
+                if args.verbose:
+                    print(f"    {state} read {timings.read_ms[-1]:8.2f} ms, "
+                          f"decode {timings.decode_ms[-1]:8.2f} ms")
+            for name in sources:
+                if args.verbose and len(sources) > 1:
+                    print(f"  source {name}:")
+                benchmark_resize(image_path, image_output_dir, results_by_source[name],
+                                 args.verbose, name, corpus, plan)
+            processed += 1
             if not args.verbose:
                 print("done")
         except Exception as e:
             print(f"error: {e}")
+        if first_done is None:
+            first_done = time.perf_counter() - scan_start
     
     total_time = time.perf_counter() - total_start
+    stop_sampler()
+    if exporter:
+        exporter.stop()
     
     # Print results
-    print_results(results)
+    if len(sources) > 1:
+        for name in sources:
+            print_results(results_by_source[name], f"BENCHMARK RESULTS ({name})")
+        print_source_comparison(results_by_source)
+    else:
+        print_results(results)
+    if plan:
+        print(f"\nWork plan: {plan.copied} derivatives copied from the source in "
+              f"{plan.copy_ms:.2f} ms total, {plan.rendered} rendered (timed above)")
+    if input_states:
+        print_input_results(input_states)
+    report_sampler()
     
     print(f"\nTotal benchmark time: {total_time:.2f} seconds")
+    print(f"Time to first image (including scan): {first_done * 1000:.2f} ms")
     
     # Cleanup output files unless --keep-output
     if not args.keep_output:
         print("\nCleaning up output files...")
-        for f in output_dir.iterdir():
-            if f.is_file():
-                f.unlink()
-        try:
-            output_dir.rmdir()
-        except OSError:
-            pass  # Directory not empty or doesn't exist
+        for d in sorted(output_dirs, key=lambda p: len(p.parts), reverse=True):
+            for f in d.iterdir():
+                if f.is_file():
+                    f.unlink()
+            try:
+                d.rmdir()
+            except OSError:
+                pass  # Directory not empty or doesn't exist
     else:
         print(f"\nOutput files kept in: {output_dir}")
+    report_archive_error()
+    if archive_errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
+    # Sibling modules import profile_vips; let them see this run's format selection
+    sys.modules.setdefault("profile_vips", sys.modules[__name__])
     main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Benchmark responsive-image (srcset) ladders.
+
+Compares two ways of producing every width in a ladder:
+  independent - resize each rung straight from the full-resolution source
+  cascade     - resize each rung from the next larger rung, which is kept
+                in memory so smaller rungs never touch the source again
+
+Rungs listed in --direct are always resampled from the source, as a quality
+guard for sizes where accumulated resampling blur would matter. The report
+shows per-rung cost, total ladder cost and PSNR of each cascaded rung
+against its directly resampled counterpart.
+"""
+
+import argparse
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from profile_vips import DISPLAY_QUALITY, FORMATS, get_image_files, pyvips
+
+DEFAULT_WIDTHS = "3840,2560,1920,1280,640,320"
+
+
+@dataclass
+class RungResult:
+    """Timings for one ladder width across all images."""
+    width: int
+    independent_ms: List[float] = field(default_factory=list)
+    cascade_ms: List[float] = field(default_factory=list)
+    bytes_out: List[int] = field(default_factory=list)
+    psnr: List[float] = field(default_factory=list)
+
+
+def resize_to_width(img: pyvips.Image, width: int) -> pyvips.Image:
+    return img.resize(width / img.width)
+
+
+def psnr(a: pyvips.Image, b: pyvips.Image) -> float:
+    """Peak signal-to-noise ratio between two 8-bit images of about the same size."""
+    # Rounding can leave cascaded and direct rungs a pixel apart in height
+    width, height = min(a.width, b.width), min(a.height, b.height)
+    a = a.crop(0, 0, width, height)
+    b = b.crop(0, 0, width, height)
+    diff = a.cast("float") - b.cast("float")
+    mse = (diff * diff).avg()
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def build_independent(img: pyvips.Image, widths: List[int], ext: str,
+                      quality: int) -> Dict[int, Tuple[float, bytes]]:
+    """Encode every rung resized directly from the source."""
+    out = {}
+    for width in widths:
+        start = time.perf_counter()
+        data = resize_to_width(img, width).write_to_buffer(ext, Q=quality)
+        out[width] = ((time.perf_counter() - start) * 1000, data)
+    return out
+
+
+def build_cascade(img: pyvips.Image, widths: List[int], ext: str, quality: int,
+                  direct: Set[int]) -> Dict[int, Tuple[float, bytes, pyvips.Image]]:
+    """Encode every rung from the next larger in-memory intermediate."""
+    out = {}
+    current = img
+    for width in sorted(widths, reverse=True):
+        start = time.perf_counter()
+        parent = img if width in direct else current
+        # Materialize so later rungs resample these pixels instead of
+        # re-running the whole lazy pipeline back to the source
+        rung = resize_to_width(parent, width).copy_memory()
+        data = rung.write_to_buffer(ext, Q=quality)
+        out[width] = ((time.perf_counter() - start) * 1000, data, rung)
+        current = rung
+    return out
+
+
+def print_ladder_results(rungs: Dict[int, RungResult], fmt_name: str) -> None:
+    """Print formatted ladder results."""
+    print("\n" + "=" * 70)
+    print(f"LADDER RESULTS ({fmt_name.upper()})")
+    print("=" * 70)
+
+    print(f"\n{'Width':>6} {'Count':>6} {'Indep (ms)':>12} {'Cascade (ms)':>13} "
+          f"{'Saved':>8} {'Avg KB':>9} {'PSNR (dB)':>10}")
+    print("-" * 70)
+    total_indep = 0.0
+    total_cascade = 0.0
+    for width in sorted(rungs, reverse=True):
+        r = rungs[width]
+        if not r.cascade_ms:
+            continue
+        indep = sum(r.independent_ms) / len(r.independent_ms)
+        cascade = sum(r.cascade_ms) / len(r.cascade_ms)
+        total_indep += sum(r.independent_ms)
+        total_cascade += sum(r.cascade_ms)
+        saved = (1 - cascade / indep) * 100 if indep else 0
+        kb = sum(r.bytes_out) / len(r.bytes_out) / 1024
+        quality = min(r.psnr)
+        quality_str = "exact" if math.isinf(quality) else f"{quality:.2f}"
+        print(f"{width:>6} {len(r.cascade_ms):>6} {indep:>12.2f} {cascade:>13.2f} "
+              f"{saved:>7.1f}% {kb:>9.1f} {quality_str:>10}")
+    print("-" * 70)
+
+    print("\nLADDER TOTAL:")
+    print(f"  Independent: {total_indep:.2f} ms")
+    print(f"  Cascade:     {total_cascade:.2f} ms")
+    if total_indep:
+        print(f"  Saved:       {(1 - total_cascade / total_indep) * 100:.1f}%")
+    print("  (PSNR is the worst cascaded rung vs. resampling from the source)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark cascaded vs. independent responsive-image ladders.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/48mp
+  {sys.argv[0]} --input ./sample_input/48mp --format jpeg --widths 2560,1280,640
+  {sys.argv[0]} --input ./sample_input/48mp --direct 3840,1920
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Input directory containing images to process"
+    )
+    parser.add_argument(
+        "--widths", "-w",
+        default=DEFAULT_WIDTHS,
+        help=f"Comma-separated ladder widths (default: {DEFAULT_WIDTHS})"
+    )
+    parser.add_argument(
+        "--format", "-f",
+        choices=[name for name, _, _ in FORMATS],
+        default="webp",
+        help="Output format (default: webp)"
+    )
+    parser.add_argument(
+        "--quality", "-q",
+        type=int,
+        default=DISPLAY_QUALITY,
+        help=f"Encoder quality (default: {DISPLAY_QUALITY})"
+    )
+    parser.add_argument(
+        "--direct",
+        default="",
+        help="Comma-separated widths always resampled from the source (quality guard)"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show timing for each individual image"
+    )
+
+    args = parser.parse_args()
+
+    widths = sorted({int(w) for w in args.widths.split(",") if w.strip()}, reverse=True)
+    direct = {int(w) for w in args.direct.split(",") if w.strip()}
+    ext = dict((name, ext) for name, ext, _ in FORMATS)[args.format]
+
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    print(f"VIPS Responsive Ladder Benchmark")
+    print(f"================================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directory: {args.input}")
+    print(f"Images to process: {len(image_files)}")
+    print(f"Ladder widths: {', '.join(str(w) for w in widths)}")
+    print(f"Direct from source: {', '.join(str(w) for w in sorted(direct, reverse=True)) or 'none'}")
+    print(f"Format: {args.format}, quality {args.quality}")
+    print()
+
+    rungs = {w: RungResult(w) for w in widths}
+    print("Processing images...")
+    total_start = time.perf_counter()
+
+    for i, image_path in enumerate(image_files, 1):
+        print(f"  Processing {i}/{len(image_files)}: {image_path.name}...", end=" ", flush=True)
+        try:
+            # Keep the decoded source in memory so both strategies start equal
+            img = pyvips.Image.new_from_file(str(image_path)).copy_memory()
+            usable = [w for w in widths if w < img.width]  # Don't upscale
+
+            independent = build_independent(img, usable, ext, args.quality)
+            cascade = build_cascade(img, usable, ext, args.quality, direct)
+        except Exception as e:
+            print(f"error: {e}")
+            continue
+
+        for width in usable:
+            r = rungs[width]
+            r.independent_ms.append(independent[width][0])
+            r.cascade_ms.append(cascade[width][0])
+            r.bytes_out.append(len(cascade[width][1]))
+            r.psnr.append(psnr(cascade[width][2], resize_to_width(img, width)))
+        print("done")
+
+        if args.verbose:
+            for width in usable:
+                print(f"    {width:>5}px: independent {independent[width][0]:8.2f} ms, "
+                      f"cascade {cascade[width][0]:8.2f} ms")
+
+    total_time = time.perf_counter() - total_start
+
+    print_ladder_results(rungs, args.format)
+    print(f"\nTotal benchmark time: {total_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Benchmark handing decoded pixels between processes.
+
+Compares three process-pool layouts for producing every derivative:
+  per-process - each worker decodes its own source and encodes from it
+  pickle      - decoder processes send raw pixels to encoders through a
+                multiprocessing queue (pickled, copied through a pipe)
+  shm         - decoders write pixels into multiprocessing.shared_memory
+                segments; encoders wrap a segment with
+                pyvips.Image.new_from_memory without copying, then return
+                it to a fixed pool for reuse
+
+All layouts decode each source once to memory and encode from the pixels,
+so the difference is the cost (or benefit) of separating the stages.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List
+
+from batch_process import init_worker
+from profile_vips import (ENCODER_EFFORT, FORMATS, OPERATIONS, get_image_files, pyvips,
+                          resize_image)
+
+MODES = ["per-process", "pickle", "shm"]
+DEFAULT_DECODERS = 1
+DEFAULT_ENCODERS = max(1, (os.cpu_count() or 2) - 1)
+SEGMENTS_PER_ENCODER = 2        # One being encoded, one being filled
+
+# Bytes per band for each libvips band format
+BAND_BYTES = {"uchar": 1, "char": 1, "ushort": 2, "short": 2, "uint": 4, "int": 4,
+              "float": 4, "double": 8, "complex": 8, "dpcomplex": 16}
+
+
+@dataclass
+class ModeResult:
+    """Per-image timings for one layout."""
+    mode: str
+    wall_s: float = 0
+    decode_ms: List[float] = field(default_factory=list)
+    handoff_ms: List[float] = field(default_factory=list)
+    encode_ms: Dict[str, List[float]] = field(default_factory=dict)
+    bytes_moved: int = 0
+    failed: int = 0
+
+    @property
+    def images(self) -> int:
+        return len(self.decode_ms)
+
+
+def encode_all(img: pyvips.Image, stem: str, out_dir: str) -> Dict[str, float]:
+    """Produce every derivative from decoded pixels; returns ms per key."""
+    times = {}
+    for op_name, max_size, quality in OPERATIONS:
+        for fmt_name, ext, save_func in FORMATS:
+            start = time.perf_counter()
+            output_path = os.path.join(out_dir, f"{stem}_{op_name}{ext}")
+            save_func(resize_image(img, max_size), output_path, quality)
+            times[f"{op_name}_{fmt_name}"] = (time.perf_counter() - start) * 1000
+            os.unlink(output_path)
+    return times
+
+
+def per_process_worker(task_q, result_q, out_dir: str, formats: List[str], effort: dict) -> None:
+    init_worker(formats, effort)
+    while (path := task_q.get()) is not None:
+        try:
+            start = time.perf_counter()
+            img = pyvips.Image.new_from_file(path).copy_memory()
+            decode_ms = (time.perf_counter() - start) * 1000
+            result_q.put((path, decode_ms, 0.0, encode_all(img, Path(path).stem, out_dir), 0))
+        except pyvips.Error as e:
+            result_q.put((path, None, None, str(e), 0))
+
+
+def decoder_worker(task_q, ready_q, free_q, use_shm: bool) -> None:
+    segments = {}
+    while (path := task_q.get()) is not None:
+        try:
+            start = time.perf_counter()
+            img = pyvips.Image.new_from_file(path)
+            pixels = img.write_to_memory()
+            decoded = time.perf_counter()
+        except pyvips.Error as e:
+            ready_q.put((path, None, 0.0, None, str(e), 0))
+            continue
+        # Waiting for a free segment and copying into it count as handoff
+        if use_shm:
+            name = free_q.get()  # Blocks until an encoder returns a segment
+            if name not in segments:
+                segments[name] = shared_memory.SharedMemory(name)
+            segments[name].buf[:len(pixels)] = pixels
+            payload = name
+        else:
+            payload = bytes(pixels)  # The cffi buffer itself can't be pickled
+        meta = (img.width, img.height, img.bands, img.format)
+        ready_q.put((path, (decoded - start) * 1000, decoded, meta, payload, len(pixels)))
+    for shm in segments.values():
+        shm.close()
+
+
+def encoder_worker(ready_q, result_q, free_q, out_dir: str, formats: List[str],
+                   effort: dict) -> None:
+    init_worker(formats, effort)
+    # Cached operations would keep pointing into a segment after it is recycled
+    pyvips.cache_set_max(0)
+    segments = {}
+    while (item := ready_q.get()) is not None:
+        path, decode_ms, sent, meta, payload, nbytes = item
+        if decode_ms is None:
+            result_q.put((path, None, None, payload, 0))
+            continue
+        handoff_ms = (time.perf_counter() - sent) * 1000
+        if isinstance(payload, str):
+            if payload not in segments:
+                segments[payload] = shared_memory.SharedMemory(payload)
+            pixels = segments[payload].buf[:nbytes]
+        else:
+            pixels = payload
+        img = None
+        try:
+            img = pyvips.Image.new_from_memory(pixels, *meta)
+            times = encode_all(img, Path(path).stem, out_dir)
+        except Exception as e:
+            # Always answer, or the parent waits for this image forever
+            result_q.put((path, None, None, str(e), 0))
+            continue
+        finally:
+            # The segment goes back to the pool whatever happened
+            del img
+            if isinstance(payload, str):
+                pixels.release()
+                free_q.put(payload)
+        result_q.put((path, decode_ms, handoff_ms, times, nbytes))
+    for shm in segments.values():
+        shm.close()
+
+
+def run_mode(mode: str, image_files: List[Path], out_dir: Path, decoders: int, encoders: int,
+             segments: int, segment_bytes: int, verbose: bool) -> ModeResult:
+    """Run one layout over all images and collect per-image timings."""
+    ctx = multiprocessing.get_context("spawn")
+    formats = [name for name, _, _ in FORMATS]
+    effort = dict(ENCODER_EFFORT)
+    task_q, result_q, free_q = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    ready_q = ctx.Queue(maxsize=segments)  # Same backpressure as the segment pool
+    pool = []
+
+    if mode == "shm":
+        pool = [shared_memory.SharedMemory(create=True, size=segment_bytes)
+                for _ in range(segments)]
+        for shm in pool:
+            free_q.put(shm.name)
+
+    if mode == "per-process":
+        workers = [ctx.Process(target=per_process_worker,
+                               args=(task_q, result_q, str(out_dir), formats, effort))
+                   for _ in range(decoders + encoders)]
+        stage_one = workers
+    else:
+        stage_one = [ctx.Process(target=decoder_worker,
+                                 args=(task_q, ready_q, free_q, mode == "shm"))
+                     for _ in range(decoders)]
+        workers = stage_one + [
+            ctx.Process(target=encoder_worker,
+                        args=(ready_q, result_q, free_q, str(out_dir), formats, effort))
+            for _ in range(encoders)]
+
+    result = ModeResult(mode)
+    start = time.perf_counter()
+    try:
+        for p in workers:
+            p.start()
+        for path in image_files:
+            task_q.put(str(path))
+        for _ in stage_one:
+            task_q.put(None)
+
+        for _ in image_files:
+            path, decode_ms, handoff_ms, times, nbytes = result_q.get()
+            if decode_ms is None:
+                result.failed += 1
+                print(f"    error: {Path(path).name}: {times}")
+                continue
+            result.decode_ms.append(decode_ms)
+            result.handoff_ms.append(handoff_ms)
+            result.bytes_moved += nbytes
+            for key, ms in times.items():
+                result.encode_ms.setdefault(key, []).append(ms)
+            if verbose:
+                print(f"    {Path(path).name}: decode {decode_ms:.1f} ms, "
+                      f"handoff {handoff_ms:.1f} ms, encode {sum(times.values()):.1f} ms")
+        result.wall_s = time.perf_counter() - start
+
+        if mode != "per-process":
+            for _ in range(encoders):
+                ready_q.put(None)
+        for p in workers:
+            p.join()
+    finally:
+        for p in workers:
+            if p.is_alive():
+                p.terminate()
+        for shm in pool:
+            shm.close()
+            shm.unlink()
+    return result
+
+
+def print_mode_results(results: List[ModeResult]) -> None:
+    """Print formatted comparison of the layouts."""
+    print("\n" + "=" * 70)
+    print("PIPELINE RESULTS")
+    print("=" * 70)
+    print(f"\n{'Mode':<12} {'Images':>7} {'Wall (s)':>9} {'Images/s':>9} {'Decode ms':>10} "
+          f"{'Handoff ms':>11} {'Encode ms':>10} {'MB moved':>9}")
+    print("-" * 82)
+    baseline = None
+    for r in results:
+        if not r.images:
+            continue
+        encode = sum(sum(v) for v in r.encode_ms.values()) / r.images
+        print(f"{r.mode:<12} {r.images:>7} {r.wall_s:>9.2f} {r.images / r.wall_s:>9.2f} "
+              f"{sum(r.decode_ms) / r.images:>10.1f} {sum(r.handoff_ms) / r.images:>11.1f} "
+              f"{encode:>10.1f} {r.bytes_moved / 1e6:>9.1f}")
+        baseline = baseline or r
+    print("-" * 82)
+    print("Handoff = time from decode finished to encoder start (segment/queue wait + transfer)")
+
+    if baseline and len(results) > 1:
+        print(f"\nVS. {baseline.mode.upper()}:")
+        for r in results:
+            if r is not baseline and r.images:
+                change = (baseline.wall_s / r.wall_s - 1) * 100
+                print(f"  {r.mode:<12} {change:+.1f}% throughput")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark shared-memory pixel handoff between decode and encode processes.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/48mp
+  {sys.argv[0]} --input ./sample_input/48mp --decoders 2 --encoders 6
+  {sys.argv[0]} --input ./sample_input/24mp --modes per-process,shm --segments 4
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Input directory containing images to process"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=None,
+        help="Scratch directory for encoded files (default: ./sample_output)"
+    )
+    parser.add_argument(
+        "--modes", "-m",
+        default=",".join(MODES),
+        help=f"Comma-separated layouts to compare (default: {','.join(MODES)})"
+    )
+    parser.add_argument(
+        "--decoders",
+        type=int,
+        default=DEFAULT_DECODERS,
+        help=f"Decoder processes (default: {DEFAULT_DECODERS})"
+    )
+    parser.add_argument(
+        "--encoders",
+        type=int,
+        default=DEFAULT_ENCODERS,
+        help=f"Encoder processes; per-process mode uses decoders + encoders workers "
+             f"(default: {DEFAULT_ENCODERS})"
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=None,
+        help=f"Shared-memory segments in the pool (default: {SEGMENTS_PER_ENCODER} per encoder)"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show timing for each individual image"
+    )
+
+    args = parser.parse_args()
+
+    modes = args.modes.split(",")
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        print(f"Error: Unknown mode(s): {', '.join(unknown)}. Known: {', '.join(MODES)}")
+        sys.exit(1)
+
+    image_files = get_image_files(args.input)
+    if not image_files:
+        print(f"Error: No supported image files found in {args.input}")
+        sys.exit(1)
+
+    # Size segments for the largest decoded image, from headers only
+    segment_bytes = 0
+    for path in image_files:
+        img = pyvips.Image.new_from_file(str(path))
+        segment_bytes = max(segment_bytes,
+                            img.width * img.height * img.bands * BAND_BYTES[img.format])
+    segments = args.segments or args.encoders * SEGMENTS_PER_ENCODER
+
+    script_dir = Path(__file__).parent.resolve()
+    out_dir = Path(args.output).resolve() if args.output else script_dir / "sample_output"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"VIPS Shared-Memory Pipeline Benchmark")
+    print(f"=====================================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directory: {args.input}")
+    print(f"Images to process: {len(image_files)}")
+    print(f"Output formats: {', '.join(name for name, _, _ in FORMATS)}")
+    print(f"Processes: {args.decoders} decoders + {args.encoders} encoders")
+    print(f"Segment pool: {segments} x {segment_bytes / 1e6:.1f} MB "
+          f"({segments * segment_bytes / 1e6:.0f} MB shared)")
+    print()
+
+    results = []
+    for mode in modes:
+        print(f"  Running {mode}...", end="\n" if args.verbose else " ", flush=True)
+        result = run_mode(mode, image_files, out_dir, args.decoders, args.encoders,
+                          segments, segment_bytes, args.verbose)
+        results.append(result)
+        print(f"{result.wall_s:.2f} s")
+
+    try:
+        out_dir.rmdir()
+    except OSError:
+        pass  # Directory not empty
+
+    print_mode_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Long-running soak mode for profile_vips.py --soak.
+
+Cycles the corpus through every derivative until the duration runs out.
+Latencies go into fixed-size HDR-style histograms rather than the
+per-timing lists the normal benchmark keeps, so an 8-hour run uses the
+same memory as a 1-minute one. The run is split into SOAK_WINDOWS equal
+time windows, each with its own histograms, to compare early and late
+latency.
+
+A background thread samples RSS, open file descriptors and the number of
+operations in the libvips cache. At the end the report flags:
+  - latency drift: p50 of the last window more than DRIFT_WARN_RATIO above
+    the baseline window (the first window is warm-up and skipped), or p99
+    once both windows hold enough operations for a stable tail
+  - memory growth: an RSS trend (least squares, after warm-up) above
+    GROWTH_WARN_MB_PER_HOUR, or file descriptors that never drop back to
+    their warm-up level
+"""
+
+import math
+import os
+import re
+import resource
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from profile_vips import FORMATS, OPERATIONS, open_image, pyvips, resize_image
+
+SOAK_WINDOWS = 10               # Equal time windows compared for drift
+DEFAULT_RESOURCE_INTERVAL = 10.0
+HISTOGRAM_MAX_MS = 3_600_000    # Values above this are clamped into the top bucket
+HISTOGRAM_DIGITS = 2            # Significant decimal digits kept per value
+DRIFT_WARN_RATIO = 0.10         # Last window 10% slower than baseline
+TAIL_MIN_OPS = 1000             # Ops per window before p99 drift is judged
+GROWTH_WARN_MB_PER_HOUR = 20.0
+
+
+def parse_duration(text: str) -> float:
+    """Parse 90, 90s, 30m, 8h or 1h30m into seconds."""
+    parts = re.fullmatch(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m)?(?:(\d+(?:\.\d+)?)s?)?", text)
+    if not text or not parts:
+        raise ValueError(f"expected a duration like 90s, 30m or 8h, got '{text}'")
+    hours, minutes, seconds = (float(v) if v else 0.0 for v in parts.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+class LatencyHistogram:
+    """Fixed-memory log-linear histogram of latencies (HdrHistogram layout).
+
+    Values are stored in microseconds. Each power-of-two range is split into
+    the same number of linear sub-buckets, so every recorded value keeps
+    HISTOGRAM_DIGITS significant digits whatever its magnitude.
+    """
+
+    def __init__(self, max_ms: float = HISTOGRAM_MAX_MS, digits: int = HISTOGRAM_DIGITS):
+        self.sub_bits = math.ceil(math.log2(2 * 10 ** digits))
+        self.half = 1 << (self.sub_bits - 1)
+        self.max_index = self._index(int(max_ms * 1000))
+        self.counts = [0] * (self.max_index + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = math.inf
+        self.max_ms = 0.0
+
+    def _index(self, us: int) -> int:
+        shift = max(0, us.bit_length() - self.sub_bits)
+        return shift * self.half + (us >> shift)
+
+    def _value_ms(self, index: int) -> float:
+        """Midpoint of a bucket, in ms."""
+        shift = max(0, index // self.half - 1)
+        low = (index - shift * self.half) << shift
+        return (low + ((1 << shift) - 1) / 2) / 1000
+
+    def record(self, ms: float) -> None:
+        self.counts[min(self._index(int(ms * 1000)), self.max_index)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def add(self, other: "LatencyHistogram") -> None:
+        """Merge another histogram with the same layout into this one."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.min_ms = min(self.min_ms, other.min_ms)
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    @property
+    def avg(self) -> float:
+        return self.total_ms / self.count if self.count else 0
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(max(self._value_ms(index), self.min_ms), self.max_ms)
+        return self.max_ms
+
+
+@dataclass
+class ResourceSample:
+    """Process resource usage at one point in the run."""
+    t: float                    # Seconds since the soak started
+    rss_mb: float
+    open_fds: int
+    vips_cache_ops: int
+
+
+def rss_mb() -> float:
+    """Current resident set size, falling back to the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def open_fds() -> int:
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return 0
+
+
+class ResourceSampler(threading.Thread):
+    """Sample process resources every interval seconds until stopped."""
+
+    def __init__(self, interval: float, started: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.started = started
+        self.samples: List[ResourceSample] = []
+        self._stop_event = threading.Event()
+
+    def sample(self) -> None:
+        self.samples.append(ResourceSample(time.perf_counter() - self.started, rss_mb(),
+                                           open_fds(), pyvips.cache_get_size()))
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+@dataclass
+class SoakStats:
+    """Histograms for the whole run and per time window."""
+    duration_s: float
+    overall: Dict[str, LatencyHistogram] = field(default_factory=dict)
+    windows: List[Dict[str, LatencyHistogram]] = field(default_factory=list)
+    cycles: int = 0
+    images: int = 0
+    failed: int = 0
+
+    def __post_init__(self):
+        keys = [f"{op}_{fmt}" for op, _, _ in OPERATIONS for fmt, _, _ in FORMATS]
+        self.overall = {key: LatencyHistogram() for key in keys}
+        self.windows = [{key: LatencyHistogram() for key in keys} for _ in range(SOAK_WINDOWS)]
+
+    def window_of(self, elapsed: float) -> int:
+        return min(int(elapsed / self.duration_s * SOAK_WINDOWS), SOAK_WINDOWS - 1)
+
+
+def run_soak(image_files: List[Path], output_dir: Path, duration_s: float,
+             interval: float, verbose: bool) -> Tuple[SoakStats, ResourceSampler]:
+    """Cycle image_files through every derivative for duration_s seconds."""
+    stats = SoakStats(duration_s)
+    started = time.perf_counter()
+    sampler = ResourceSampler(interval, started)
+    sampler.sample()
+    sampler.start()
+    current = -1
+    try:
+        while time.perf_counter() - started < duration_s:
+            for image_path in image_files:
+                elapsed = time.perf_counter() - started
+                if elapsed >= duration_s:
+                    break
+                index = stats.window_of(elapsed)
+                if index != current:
+                    current = index
+                    last = sampler.samples[-1]
+                    print(f"  window {index + 1}/{SOAK_WINDOWS} at {format_elapsed(elapsed)}: "
+                          f"{stats.images} images, RSS {last.rss_mb:.0f} MB, {last.open_fds} fds")
+                window = stats.windows[index]
+                try:
+                    img = open_image(image_path)
+                    for op_name, max_size, quality in OPERATIONS:
+                        for fmt_name, ext, save_func in FORMATS:
+                            key = f"{op_name}_{fmt_name}"
+                            start = time.perf_counter()
+                            save_func(resize_image(img, max_size),
+                                      str(output_dir / f"soak_{op_name}{ext}"), quality)
+                            elapsed_ms = (time.perf_counter() - start) * 1000
+                            stats.overall[key].record(elapsed_ms)
+                            window[key].record(elapsed_ms)
+                    stats.images += 1
+                except pyvips.Error as e:
+                    stats.failed += 1
+                    if verbose:
+                        print(f"  error: {image_path.name}: {str(e).splitlines()[0]}")
+            else:
+                stats.cycles += 1
+    finally:
+        sampler.stop()
+    return stats, sampler
+
+
+def format_elapsed(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+
+
+def trend_per_hour(points: List[Tuple[float, float]]) -> float:
+    """Least squares slope of (seconds, value) points, per hour."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if var_t == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t * 3600
+
+
+def print_soak_results(stats: SoakStats, sampler: ResourceSampler, elapsed: float) -> None:
+    """Print latency per derivative, per-window drift and resource trends."""
+    print("\n" + "=" * 70)
+    print("SOAK RESULTS")
+    print("=" * 70)
+    print(f"\n{'Operation':<20} {'Count':>8} {'Avg (ms)':>10} {'p50 (ms)':>10} "
+          f"{'p99 (ms)':>10} {'p99.9 (ms)':>11} {'Max (ms)':>10}")
+    print("-" * 84)
+    for key, h in stats.overall.items():
+        if h.count:
+            print(f"{key:<20} {h.count:>8} {h.avg:>10.2f} {h.percentile(50):>10.2f} "
+                  f"{h.percentile(99):>10.2f} {h.percentile(99.9):>11.2f} {h.max_ms:>10.2f}")
+    print("-" * 84)
+
+    # Per-window p50/p99 across all derivatives, to see drift at a glance
+    print(f"\n{'Window from':<12} {'Ops':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'RSS (MB)':>10} {'FDs':>6}")
+    print("-" * 70)
+    window_s = stats.duration_s / SOAK_WINDOWS
+    merged = []
+    for i, window in enumerate(stats.windows):
+        h = LatencyHistogram()
+        for window_h in window.values():
+            h.add(window_h)
+        merged.append(h)
+        in_window = [s for s in sampler.samples if i * window_s <= s.t < (i + 1) * window_s]
+        rss = f"{max(s.rss_mb for s in in_window):>10.1f}" if in_window else f"{'-':>10}"
+        fds = f"{max(s.open_fds for s in in_window):>6}" if in_window else f"{'-':>6}"
+        print(f"{format_elapsed(i * window_s):<12} {h.count:>8} {h.percentile(50):>10.2f} {h.percentile(99):>10.2f} "
+              f"{rss} {fds}")
+    print("-" * 70)
+
+    samples = sampler.samples
+    settled = [s for s in samples if s.t >= window_s] or samples
+    rss_trend = trend_per_hour([(s.t, s.rss_mb) for s in settled])
+    print("\nSUMMARY:")
+    print(f"  Ran {elapsed / 60:.1f} min: {stats.cycles} full corpus cycles, "
+          f"{stats.images} images, {stats.failed} failed")
+    print(f"  RSS:        {samples[0].rss_mb:.1f} MB at start, {samples[-1].rss_mb:.1f} MB at end, "
+          f"trend {rss_trend:+.1f} MB/hour after warm-up")
+    print(f"  Open FDs:   {samples[0].open_fds} at start, {samples[-1].open_fds} at end")
+    print(f"  vips cache: {samples[-1].vips_cache_ops} operations at end "
+          f"(max {max(s.vips_cache_ops for s in samples)})")
+
+    warnings = []
+    baseline, last = merged[1], merged[-1]
+    if baseline.count and last.count:
+        tail = min(baseline.count, last.count) >= TAIL_MIN_OPS
+        for pct in (50, 99) if tail else (50,):
+            before, after = baseline.percentile(pct), last.percentile(pct)
+            if after > before * (1 + DRIFT_WARN_RATIO):
+                warnings.append(f"latency drift: p{pct} rose from {before:.2f} ms to "
+                                f"{after:.2f} ms between the baseline and last window")
+    if rss_trend > GROWTH_WARN_MB_PER_HOUR:
+        warnings.append(f"memory growth: RSS trending {rss_trend:+.1f} MB/hour "
+                        f"(threshold {GROWTH_WARN_MB_PER_HOUR:.0f})")
+    warm_fds = [s.open_fds for s in samples if s.t < window_s]
+    late_fds = [s.open_fds for s in samples if s.t >= stats.duration_s - window_s]
+    if warm_fds and late_fds and min(late_fds) > max(warm_fds):
+        warnings.append(f"file descriptor growth: {max(warm_fds)} during warm-up, "
+                        f"never below {min(late_fds)} in the last window")
+    if len(samples) < 4:
+        warnings.append("too few resource samples for a trend; lengthen --soak "
+                        "or shorten --soak-interval")
+    for warning in warnings:
+        print(f"WARNING: {warning}")
+    if not warnings:
+        print("  No latency drift or resource growth detected")
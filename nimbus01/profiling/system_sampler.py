@@ -0,0 +1,271 @@
+"""
+Background system sampler for benchmark runs.
+
+Records per-core CPU frequency (cpufreq sysfs) for the cores this process
+may run on, hwmon temperatures, load
+average and context-switch rate on a fixed interval while a benchmark runs,
+then lines the samples up with each timing so a slow result can be traced
+to a hot or throttled machine rather than the library.
+
+Throttling is flagged when any of these hold during a timing:
+  - Intel thermal_throttle counters increased
+  - the hottest sensor is within THROTTLE_TEMP_MARGIN_C of its critical
+    limit (or above THROTTLE_TEMP_C when no limit is published)
+  - the fastest core's frequency fell below THROTTLE_FREQ_RATIO of the
+    run's peak; idle cores clocked down by powersave or schedutil do not
+    count, since a busy core runs at the top of the sampled set
+
+Missing sources (no cpufreq in VMs, no hwmon on macOS) are skipped.
+"""
+
+import glob
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CPU_SYSFS = "/sys/devices/system/cpu"
+HWMON_SYSFS = "/sys/class/hwmon"
+DEFAULT_INTERVAL = 0.25         # Seconds between samples
+THROTTLE_FREQ_RATIO = 0.85      # Fastest-core MHz below this fraction of run peak
+THROTTLE_TEMP_C = 95.0          # Fallback when a sensor has no crit limit
+THROTTLE_TEMP_MARGIN_C = 5.0
+
+
+@dataclass
+class Sample:
+    """One snapshot of system state."""
+    t: float                    # time.perf_counter() when taken
+    freqs_mhz: List[float] = field(default_factory=list)
+    temps_c: Dict[str, float] = field(default_factory=dict)
+    load1: float = 0
+    ctxt: int = 0
+    throttle_events: int = 0
+
+    @property
+    def mean_mhz(self) -> float:
+        return sum(self.freqs_mhz) / len(self.freqs_mhz) if self.freqs_mhz else 0
+
+    @property
+    def top_mhz(self) -> float:
+        return max(self.freqs_mhz, default=0)
+
+    @property
+    def max_temp(self) -> float:
+        return max(self.temps_c.values()) if self.temps_c else 0
+
+
+def read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def discover_sensors() -> Dict[str, tuple]:
+    """Map sensor label -> (input path, critical temp or None)."""
+    sensors = {}
+    for hwmon in sorted(glob.glob(os.path.join(HWMON_SYSFS, "hwmon*"))):
+        try:
+            chip = Path(hwmon, "name").read_text().strip()
+        except OSError:
+            continue
+        for input_path in sorted(glob.glob(os.path.join(hwmon, "temp*_input"))):
+            prefix = input_path[:-len("_input")]
+            try:
+                label = Path(prefix + "_label").read_text().strip()
+            except OSError:
+                label = os.path.basename(prefix)
+            crit = read_int(prefix + "_crit")
+            sensors[f"{chip}/{label}"] = (input_path, crit / 1000 if crit else None)
+    return sensors
+
+
+def cpu_number(path: str) -> int:
+    return int(re.search(r"/cpu(\d+)/", path).group(1))
+
+
+class SystemSampler(threading.Thread):
+    """Sample system state in the background until stop() is called."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples: List[Sample] = []
+        self.times: List[float] = []    # Sample times, for bisecting
+        self.peak_mhz = 0.0             # Highest fastest-core MHz so far
+        self.stop_event = threading.Event()
+        # Only the cores this process may run on; others say nothing about our timings
+        cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+        self.freq_paths = sorted(
+            (p for p in glob.glob(os.path.join(CPU_SYSFS, "cpu[0-9]*", "cpufreq", "scaling_cur_freq"))
+             if cpus is None or cpu_number(p) in cpus),
+            key=cpu_number)
+        self.throttle_paths = glob.glob(
+            os.path.join(CPU_SYSFS, "cpu[0-9]*", "thermal_throttle", "*_throttle_count"))
+        self.sensors = discover_sensors()
+        self.max_mhz = max((read_int(p.replace("scaling_cur_freq", "cpuinfo_max_freq")) or 0
+                            for p in self.freq_paths), default=0) / 1000
+
+    @property
+    def sources(self) -> List[str]:
+        found = []
+        if self.freq_paths:
+            found.append(f"cpufreq ({len(self.freq_paths)} cores in affinity)")
+        if self.sensors:
+            found.append(f"hwmon ({len(self.sensors)} sensors)")
+        if self.throttle_paths:
+            found.append("thermal_throttle")
+        found.append("loadavg")
+        if os.path.exists("/proc/stat"):
+            found.append("context switches")
+        return found
+
+    def take_sample(self) -> Sample:
+        sample = Sample(time.perf_counter())
+        for path in self.freq_paths:
+            khz = read_int(path)
+            if khz:
+                sample.freqs_mhz.append(khz / 1000)
+        for label, (path, _) in self.sensors.items():
+            milli_c = read_int(path)
+            if milli_c is not None:
+                sample.temps_c[label] = milli_c / 1000
+        sample.throttle_events = sum(read_int(p) or 0 for p in self.throttle_paths)
+        sample.load1 = os.getloadavg()[0]
+        try:
+            with open("/proc/stat") as f:
+                for line in f:
+                    if line.startswith("ctxt "):
+                        sample.ctxt = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+        return sample
+
+    def record(self, sample: Sample) -> None:
+        """Keep the per-report lookups up to date as samples arrive."""
+        self.samples.append(sample)
+        self.times.append(sample.t)
+        self.peak_mhz = max(self.peak_mhz, sample.top_mhz)
+
+    def run(self) -> None:
+        while True:
+            self.record(self.take_sample())
+            if self.stop_event.wait(self.interval):
+                break
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.join()
+        self.record(self.take_sample())
+
+    def is_hot(self, sample: Sample) -> bool:
+        for label, temp in sample.temps_c.items():
+            crit = self.sensors.get(label, (None, None))[1]
+            limit = crit - THROTTLE_TEMP_MARGIN_C if crit else THROTTLE_TEMP_C
+            if temp >= limit:
+                return True
+        return False
+
+    def window(self, start: float, end: float) -> List[Sample]:
+        """Samples taken during [start, end], or the nearest one if none."""
+        lo, hi = bisect_left(self.times, start), bisect_right(self.times, end)
+        if lo < hi:
+            return self.samples[lo:hi]
+        nearest = min(lo, len(self.samples) - 1)
+        return self.samples[nearest:nearest + 1]
+
+    def conditions(self, start: float, end: float) -> dict:
+        """Summarize system state during one timing sample."""
+        window = self.window(start, end)
+        if not window:
+            return {"mhz": 0, "temp": 0, "throttled": False}
+        peak_mhz = self.peak_mhz
+        mhz = sum(s.top_mhz for s in window) / len(window)
+        before = self.window(start - self.interval, start)[0]
+        throttled = (
+            window[-1].throttle_events > before.throttle_events
+            or any(self.is_hot(s) for s in window)
+            or (peak_mhz > 0 and mhz < THROTTLE_FREQ_RATIO * peak_mhz)
+        )
+        return {"mhz": mhz, "temp": max(s.max_temp for s in window), "throttled": throttled}
+
+
+def print_system_report(sampler: SystemSampler, results: dict) -> None:
+    """Print system conditions per operation and flag throttled timings."""
+    samples = sampler.samples
+    if len(samples) < 2:
+        return
+
+    print("\n" + "=" * 70)
+    print("SYSTEM CONDITIONS")
+    print("=" * 70)
+    print(f"Sources: {', '.join(sampler.sources)}")
+
+    print(f"\n{'Operation':<20} {'Format':<8} {'Count':>6} {'Top MHz':>10} {'Max °C':>8} "
+          f"{'Throttled':>10} {'Avg (ms)':>10} {'Hot avg':>10}")
+    print("-" * 70)
+    total_flagged = 0
+    for result in results.values():
+        if not result.starts_s:
+            continue
+        conds = [sampler.conditions(t, t + ms / 1000)
+                 for t, ms in zip(result.starts_s, result.times_ms)]
+        flagged = [ms for c, ms in zip(conds, result.times_ms) if c["throttled"]]
+        total_flagged += len(flagged)
+        avg_mhz = sum(c["mhz"] for c in conds) / len(conds)
+        max_temp = max(c["temp"] for c in conds)
+        mhz_str = f"{avg_mhz:.0f}" if avg_mhz else "-"
+        temp_str = f"{max_temp:.1f}" if max_temp else "-"
+        hot_avg = f"{sum(flagged) / len(flagged):.2f}" if flagged else "-"
+        print(f"{result.operation:<20} {result.format:<8} {len(conds):>6} "
+              f"{mhz_str:>10} {temp_str:>8} {len(flagged):>10} "
+              f"{result.avg:>10.2f} {hot_avg:>10}")
+    print("-" * 70)
+
+    duration = samples[-1].t - samples[0].t
+    freqs = [s.mean_mhz for s in samples if s.freqs_mhz]
+    temps = [s.max_temp for s in samples if s.temps_c]
+    print("\nRUN SUMMARY:")
+    if freqs:
+        nominal = f" (cpuinfo max {sampler.max_mhz:.0f})" if sampler.max_mhz else ""
+        print(f"  Mean core MHz: min {min(freqs):.0f}, avg {sum(freqs) / len(freqs):.0f}, "
+              f"max {max(freqs):.0f}{nominal}")
+        tops = [s.top_mhz for s in samples if s.freqs_mhz]
+        print(f"  Fastest core MHz: min {min(tops):.0f}, avg {sum(tops) / len(tops):.0f}, "
+              f"max {max(tops):.0f} (throttle reference)")
+    if temps:
+        hottest = max(samples, key=lambda s: s.max_temp)
+        sensor = max(hottest.temps_c, key=hottest.temps_c.get)
+        print(f"  Max temperature: {max(temps):.1f} °C ({sensor})")
+    loads = [s.load1 for s in samples]
+    print(f"  Load average (1m): avg {sum(loads) / len(loads):.2f}, max {max(loads):.2f}")
+    if samples[-1].ctxt and duration > 0:
+        rate = (samples[-1].ctxt - samples[0].ctxt) / duration
+        print(f"  Context switches: {rate:,.0f}/s")
+    if samples[-1].throttle_events > samples[0].throttle_events:
+        print(f"  Thermal throttle events: {samples[-1].throttle_events - samples[0].throttle_events}")
+    if total_flagged:
+        print(f"  WARNING: {total_flagged} timings were taken while throttled; "
+              f"compare 'Hot avg' with 'Avg' before blaming the library")
+
+
+def write_samples_csv(sampler: SystemSampler, path: Path) -> None:
+    """Write raw samples for plotting."""
+    sensors = sorted(sampler.sensors)
+    t0 = sampler.samples[0].t if sampler.samples else 0
+    with open(path, "w") as f:
+        f.write(",".join(["t_s", "mean_mhz", "min_mhz", "max_mhz", "load1", "ctxt",
+                          "throttle_events"] + sensors) + "\n")
+        for s in sampler.samples:
+            row = [f"{s.t - t0:.3f}", f"{s.mean_mhz:.0f}",
+                   f"{min(s.freqs_mhz, default=0):.0f}", f"{max(s.freqs_mhz, default=0):.0f}",
+                   f"{s.load1:.2f}", str(s.ctxt), str(s.throttle_events)]
+            row += [f"{s.temps_c.get(label, 0):.1f}" for label in sensors]
+            f.write(",".join(row) + "\n")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Export resized images as ML training tensors.
+
+Decodes each image once with libvips, resizes it with resize_image() to a
+fixed square size (centre crop or letterbox pad), optionally normalizes it
+inside the vips pipeline, and writes it into a memory-mapped .npy store of
+shape (N, H, W, 3) or (N, 3, H, W). A tab-separated index maps each row
+back to its source file. The store opens with numpy.load(mmap_mode="r")
+without reading it into memory.
+
+The vips pipeline runs straight into a single write_to_memory(), which is
+wrapped with numpy.frombuffer (no copy); the only copy after that is into
+the store row. The pipeline, the vips-to-NumPy conversion (frombuffer and
+reshape) and the store write are timed separately.
+"""
+
+import argparse
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    print("Error: numpy required for tensor export. Install with: pip install numpy")
+    sys.exit(1)
+
+from profile_vips import get_image_files, pyvips, resize_image
+
+DEFAULT_SIZE = 224
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_THREADS = 4
+INDEX_SUFFIX = ".index.tsv"
+
+# Per-channel (mean, std) on 0-1 pixel values
+NORMALIZATION = {
+    "imagenet": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+    "unit": ((0.0, 0.0, 0.0), (1.0, 1.0, 1.0)),
+}
+
+
+@dataclass
+class ExportStats:
+    """Per-image timings for an export run."""
+    pipeline_ms: List[float] = field(default_factory=list)
+    convert_ms: List[float] = field(default_factory=list)
+    store_ms: List[float] = field(default_factory=list)
+    failed: int = 0
+
+
+def to_rgb(img: pyvips.Image) -> pyvips.Image:
+    """Coerce to 3-band 8-bit sRGB, flattening any alpha onto white."""
+    if img.hasalpha():
+        img = img.flatten(background=255)
+    if img.interpretation not in ("srgb", "rgb"):
+        img = img.colourspace("srgb")
+    if img.bands == 1:
+        img = img.bandjoin([img, img])
+    return img.cast("uchar") if img.format != "uchar" else img
+
+
+def fit_square(img: pyvips.Image, size: int, fit: str) -> pyvips.Image:
+    """Resize to exactly size x size by centre crop or letterbox pad."""
+    if fit == "crop":
+        # Scale so the short edge reaches size, then crop the long edge
+        long_edge = math.ceil(size * max(img.width, img.height) / min(img.width, img.height))
+        img = resize_image(img, long_edge)
+        if min(img.width, img.height) < size:
+            img = img.resize(size / min(img.width, img.height))  # Small sources: upscale
+        return img.crop((img.width - size) // 2, (img.height - size) // 2, size, size)
+    img = resize_image(img, size)
+    if max(img.width, img.height) < size:
+        img = img.resize(size / max(img.width, img.height))
+    return img.gravity("centre", size, size, extend="black")
+
+
+def prepare(image_path: Path, size: int, fit: str, dtype: str,
+            normalize: str) -> Tuple[np.ndarray, Tuple[int, int], float, float]:
+    """Build one HWC tensor; returns (array, source size, pipeline ms, conversion ms)."""
+    start = time.perf_counter()
+    img = pyvips.Image.new_from_file(str(image_path), access="sequential")
+    source_size = (img.width, img.height)
+    img = fit_square(to_rgb(img), size, fit)
+    if dtype == "float32":
+        mean, std = NORMALIZATION[normalize]
+        img = img.linear([1 / (255 * s) for s in std], [-m / s for m, s in zip(mean, std)])
+        img = img.cast("float")
+    # write_to_memory() runs the pipeline; the conversion then only wraps its buffer
+    data = img.write_to_memory()
+    converted = time.perf_counter()
+    array = np.frombuffer(data, dtype=dtype).reshape(img.height, img.width, img.bands)
+    done = time.perf_counter()
+    return array, source_size, (converted - start) * 1000, (done - converted) * 1000
+
+
+def export(image_files: List[Path], input_dir: Path, store_path: Path, size: int, fit: str,
+           dtype: str, normalize: str, layout: str, batch_size: int, threads: int,
+           verbose: bool) -> ExportStats:
+    """Write every image into the store, one batch at a time."""
+    shape = (len(image_files), size, size, 3) if layout == "nhwc" else (len(image_files), 3, size, size)
+    store = np.lib.format.open_memmap(str(store_path), mode="w+", dtype=dtype, shape=shape)
+    stats = ExportStats()
+    index_path = Path(str(store_path) + INDEX_SUFFIX)
+
+    with open(index_path, "w") as index, ThreadPoolExecutor(max_workers=threads) as pool:
+        index.write("row\tpath\twidth\theight\tstatus\n")
+        for batch_start in range(0, len(image_files), batch_size):
+            batch = image_files[batch_start:batch_start + batch_size]
+            futures = [pool.submit(prepare, p, size, fit, dtype, normalize) for p in batch]
+            for row, (image_path, future) in enumerate(zip(batch, futures), batch_start):
+                rel = image_path.relative_to(input_dir)
+                try:
+                    array, (width, height), pipeline_ms, convert_ms = future.result()
+                except pyvips.Error as e:
+                    # Row stays zero-filled; the index marks it unusable
+                    stats.failed += 1
+                    index.write(f"{row}\t{rel}\t0\t0\terror\n")
+                    print(f"  error: {image_path.name}: {str(e).splitlines()[0]}")
+                    continue
+                start = time.perf_counter()
+                store[row] = array if layout == "nhwc" else array.transpose(2, 0, 1)
+                stats.store_ms.append((time.perf_counter() - start) * 1000)
+                stats.pipeline_ms.append(pipeline_ms)
+                stats.convert_ms.append(convert_ms)
+                index.write(f"{row}\t{rel}\t{width}\t{height}\tok\n")
+            store.flush()
+            index.flush()
+            done = batch_start + len(batch)
+            if verbose:
+                print(f"  Batch {batch_start // batch_size + 1}: {done}/{len(image_files)} images")
+    del store
+    return stats
+
+
+def print_export_results(stats: ExportStats, elapsed: float, store_path: Path) -> None:
+    """Print throughput and per-stage timing."""
+    exported = len(stats.pipeline_ms)
+    print("\n" + "=" * 70)
+    print("EXPORT RESULTS")
+    print("=" * 70)
+    print(f"\n{'Stage':<24} {'Avg (ms)':>10} {'Min (ms)':>10} {'Max (ms)':>10} {'Total (s)':>10}")
+    print("-" * 70)
+    for name, times in (("Decode + resize (vips)", stats.pipeline_ms),
+                        ("vips -> NumPy", stats.convert_ms),
+                        ("Store write", stats.store_ms)):
+        if times:
+            print(f"{name:<24} {sum(times) / len(times):>10.3f} {min(times):>10.3f} "
+                  f"{max(times):>10.3f} {sum(times) / 1000:>10.2f}")
+    print("-" * 70)
+
+    print("\nSUMMARY:")
+    print(f"  Images:     {exported} exported, {stats.failed} failed")
+    print(f"  Throughput: {exported / elapsed:.2f} images/s ({elapsed:.2f} s wall)")
+    if stats.convert_ms:
+        convert_s = sum(stats.convert_ms) / 1000
+        pipeline_s = sum(stats.pipeline_ms) / 1000
+        print(f"  Conversion: {convert_s * 1000:.3f} ms total vips -> NumPy "
+              f"({convert_s / (pipeline_s + convert_s) * 100:.2f}% of decode + convert, no copy)")
+    print(f"  Store:      {store_path} ({store_path.stat().st_size / 1e6:.1f} MB)")
+    print(f"  Index:      {store_path}{INDEX_SUFFIX}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export resized, normalized images into a memory-mapped NumPy store.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/12mp --store train.npy
+  {sys.argv[0]} --input ./sample_input/12mp --store train.npy --dtype uint8 --fit pad
+  {sys.argv[0]} --input /uploads --store train.npy --size 384 --layout nchw --threads 8
+
+Load with: numpy.load("train.npy", mmap_mode="r")
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Input directory containing images to export"
+    )
+    parser.add_argument(
+        "--store", "-s",
+        required=True,
+        help="Output .npy file (index written alongside as <store>.index.tsv)"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=DEFAULT_SIZE,
+        help=f"Square tensor edge in pixels (default: {DEFAULT_SIZE})"
+    )
+    parser.add_argument(
+        "--fit",
+        choices=["crop", "pad"],
+        default="crop",
+        help="Centre crop to fill, or letterbox pad to fit (default: crop)"
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=["float32", "uint8"],
+        default="float32",
+        help="Tensor element type; uint8 is stored unnormalized (default: float32)"
+    )
+    parser.add_argument(
+        "--normalize",
+        choices=list(NORMALIZATION),
+        default="imagenet",
+        help="float32 normalization: imagenet mean/std or plain 0-1 (default: imagenet)"
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["nhwc", "nchw"],
+        default="nhwc",
+        help="Tensor layout (default: nhwc)"
+    )
+    parser.add_argument(
+        "--batch-size", "-b",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Images decoded in parallel and flushed together (default: {DEFAULT_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--threads", "-t",
+        type=int,
+        default=DEFAULT_THREADS,
+        help=f"Decode threads; libvips releases the GIL (default: {DEFAULT_THREADS})"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show progress per batch"
+    )
+
+    args = parser.parse_args()
+
+    input_dir = Path(args.input).resolve()
+    image_files = get_image_files(str(input_dir))
+    if not image_files:
+        print(f"Error: No supported image files found in {input_dir}")
+        sys.exit(1)
+    store_path = Path(args.store).resolve()
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+
+    itemsize = np.dtype(args.dtype).itemsize
+    print(f"VIPS Tensor Export")
+    print(f"==================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directory: {input_dir}")
+    print(f"Images to export: {len(image_files)}")
+    print(f"Tensor: {args.size}x{args.size}x3 {args.dtype}, {args.layout}, fit {args.fit}"
+          + (f", {args.normalize} normalization" if args.dtype == "float32" else ""))
+    print(f"Store: {store_path} "
+          f"({len(image_files) * args.size * args.size * 3 * itemsize / 1e6:.1f} MB)")
+    print(f"Batches of {args.batch_size}, {args.threads} threads")
+    print()
+
+    print("Exporting...")
+    start = time.perf_counter()
+    stats = export(image_files, input_dir, store_path, args.size, args.fit, args.dtype,
+                   args.normalize, args.layout, args.batch_size, args.threads, args.verbose)
+    elapsed = time.perf_counter() - start
+
+    print_export_results(stats, elapsed, store_path)
+
+
+if __name__ == "__main__":
+    main()
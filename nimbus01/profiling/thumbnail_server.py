@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Asyncio HTTP thumbnail service for realistic load testing.
+
+Serves thumbnail and display derivatives using the same resize logic as
+profile_vips.py. The event loop only parses HTTP; decode, resize and encode
+run in a bounded thread or process pool so queueing behaves like a real
+service. Pair with load_generator.py to measure throughput and tail latency.
+
+Endpoints:
+  GET  /<operation>/<stem>.<format>       derive from a file in --input
+  POST /<operation>.<format>              derive from the request body
+  GET  /healthz                           liveness check
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from profile_vips import (ALL_FORMATS, DEFAULT_FORMATS, ENCODER_EFFORT, FORMATS, OPERATIONS,
+                          encode_buffer, get_image_files, parse_effort, parse_formats, pyvips,
+                          resize_image)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = os.cpu_count() or 4
+DEFAULT_MAX_PENDING = 64        # Requests queued or running before we shed load
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+OPERATION_PARAMS = {name: (max_size, quality) for name, max_size, quality in OPERATIONS}
+CONTENT_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+    "heic": "image/heic",
+    "jxl": "image/jxl",
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class RequestError(Exception):
+    """A request the server answers with an error status and then closes."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def init_pool_worker(formats: List[str], effort: dict) -> None:
+    """Apply the parent's format selection and leave Ctrl-C to the parent."""
+    from batch_process import init_worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker(formats, effort)
+
+
+def render_derivative(source, op_name: str, fmt_name: str) -> bytes:
+    """Decode source (path or bytes), resize for op_name and encode as fmt_name.
+
+    Runs inside a pool worker, so it must be a picklable top-level function.
+    Encodes with the same effort and compression options as the FORMATS savers.
+    """
+    if isinstance(source, bytes):
+        img = pyvips.Image.new_from_buffer(source, "")
+    else:
+        img = pyvips.Image.new_from_file(source)
+    max_size, quality = OPERATION_PARAMS[op_name]
+    resized = resize_image(img, max_size)
+    return encode_buffer(resized, fmt_name, quality)
+
+
+def parse_derivative_path(path: str) -> Optional[Tuple[str, str, Optional[str]]]:
+    """Split a request path into (operation, format, source stem or None)."""
+    parts = [unquote(p) for p in path.split("?", 1)[0].strip("/").split("/")]
+    if len(parts) == 1:
+        op_name, _, fmt_name = parts[0].partition(".")
+        filename = None
+    elif len(parts) == 2:
+        op_name = parts[0]
+        filename, _, fmt_name = parts[1].rpartition(".")
+    else:
+        return None
+    if op_name not in OPERATION_PARAMS or not any(fmt_name == name for name, _, _ in FORMATS):
+        return None
+    return op_name, fmt_name, filename
+
+
+class ThumbnailServer:
+    """Minimal HTTP/1.1 server with keep-alive and bounded admission."""
+
+    def __init__(self, sources: Dict[str, Path], executor, max_pending: int):
+        self.sources = sources
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except RequestError as e:
+                    # The rest of the request can't be framed, so reply and close
+                    self.write_response(writer, e.status, "text/plain",
+                                        f"{e}\n".encode(), keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader):
+        """Read one request; returns None when the client closed the connection.
+
+        Raises RequestError for a malformed or overlong request line, an
+        overlong header line, a bad Content-Length or an oversized body.
+        """
+        request_line = await self.read_line(reader, 400, "request line")
+        if not request_line.strip():
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise RequestError(400, "malformed request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await self.read_line(reader, 431, "header line")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise RequestError(400, "invalid content-length")
+        if length < 0:
+            raise RequestError(400, "invalid content-length")
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, f"request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    @staticmethod
+    async def read_line(reader: asyncio.StreamReader, status: int, what: str) -> bytes:
+        """readline(), turning a line over the stream limit into RequestError(status)."""
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise RequestError(status, f"{what} too long")
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        if path == "/healthz":
+            return 200, "text/plain", b"ok\n"
+
+        parsed = parse_derivative_path(path)
+        if parsed is None:
+            return 404, "text/plain", b"unknown operation or format\n"
+        op_name, fmt_name, filename = parsed
+
+        if method == "GET" and filename is not None:
+            if filename not in self.sources:
+                return 404, "text/plain", b"no such source image\n"
+            source = str(self.sources[filename])
+        elif method == "POST" and filename is None:
+            if not body:
+                return 400, "text/plain", b"empty request body\n"
+            source = body
+        else:
+            return 405, "text/plain", b"use GET /op/stem.fmt or POST /op.fmt\n"
+
+        # Shed load instead of letting the executor queue grow without bound
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, "text/plain", b"overloaded\n"
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            payload = await loop.run_in_executor(
+                self.executor, render_derivative, source, op_name, fmt_name)
+        except Exception as e:
+            return 500, "text/plain", f"error: {e}\n".encode()
+        finally:
+            self.pending -= 1
+
+        self.served += 1
+        return 200, CONTENT_TYPES[fmt_name], payload
+
+    @staticmethod
+    def write_response(writer: asyncio.StreamWriter, status: int, content_type: str,
+                       payload: bytes, keep_alive: bool) -> None:
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+
+
+async def serve(host: str, port: int, server: ThumbnailServer) -> None:
+    srv = await asyncio.start_server(server.handle_connection, host, port, backlog=1024)
+    print(f"Listening on http://{host}:{port}/ (Ctrl-C to stop)")
+    async with srv:
+        await srv.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Asyncio HTTP thumbnail service backed by VIPS.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Operations: {', '.join(OPERATION_PARAMS)}
+Formats:    {', '.join(DEFAULT_FORMATS)} by default; also {', '.join(f[0] for f in ALL_FORMATS if f[0] not in DEFAULT_FORMATS)}
+            when the local libvips build can encode them (see --formats)
+
+Examples:
+  {sys.argv[0]} --input ./sample_input/24mp
+  {sys.argv[0]} --input ./sample_input/48mp --pool process --workers 8
+  {sys.argv[0]} --input ./sample_input/24mp --formats jpeg,webp,avif --effort avif=6
+  curl -o t.webp http://127.0.0.1:{DEFAULT_PORT}/thumbnail/test_24mp_01.webp
+  curl --data-binary @photo.jpg -o t.jpg http://127.0.0.1:{DEFAULT_PORT}/thumbnail.jpeg
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        default=None,
+        help="Directory of source images served via GET (optional; POST always works)"
+    )
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help=f"Address to bind (default: {DEFAULT_HOST})"
+    )
+    parser.add_argument(
+        "--port", "-p",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on (default: {DEFAULT_PORT})"
+    )
+    parser.add_argument(
+        "--pool",
+        choices=["thread", "process"],
+        default="thread",
+        help="Executor for CPU work (default: thread)"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Pool size (default: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=DEFAULT_MAX_PENDING,
+        help=f"Requests admitted before returning 503 (default: {DEFAULT_MAX_PENDING})"
+    )
+    parser.add_argument(
+        "--formats", "-f",
+        default=",".join(DEFAULT_FORMATS),
+        help=f"Comma-separated formats to serve, or 'all' available (default: {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        "--effort",
+        type=parse_effort,
+        default={},
+        help="Encoder effort overrides, e.g. avif=6,jxl=5,webp=4"
+    )
+
+    args = parser.parse_args()
+
+    # Serve only formats the local libvips can encode
+    ENCODER_EFFORT.update(args.effort)
+    unavailable = parse_formats(args.formats)
+
+    # Index sources by stem so clients can ask for any output extension
+    sources = {}
+    if args.input:
+        sources = {f.stem: f for f in get_image_files(args.input)}
+
+    if args.pool == "process":
+        # Spawn, not fork: the format probe has already started libvips threads
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_pool_worker,
+            initargs=([name for name, _, _ in FORMATS], dict(ENCODER_EFFORT)))
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    print(f"VIPS Thumbnail Server")
+    print(f"=====================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directory: {args.input or '(POST only)'} ({len(sources)} images)")
+    print(f"Pool: {args.pool} x {args.workers}, max pending {args.max_pending}")
+    efforts = [f"{name}={ENCODER_EFFORT[name]}" for name, _, _ in FORMATS if name in ENCODER_EFFORT]
+    print(f"Formats: {', '.join(name for name, _, _ in FORMATS)}" + (f" (effort {', '.join(efforts)})" if efforts else ""))
+    if unavailable:
+        print(f"Skipped (not supported by this libvips build): {', '.join(unavailable)}")
+
+    server = ThumbnailServer(sources, executor, args.max_pending)
+    try:
+        asyncio.run(serve(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        print(f"\nServed {server.served} requests, rejected {server.rejected}")
+
+
+if __name__ == "__main__":
+    main()
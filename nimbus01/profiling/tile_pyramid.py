@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Benchmark DeepZoom/IIIF tile pyramid generation with dzsave.
+
+Runs every combination of tile size, overlap, tile format, container
+(directory tree or zip) and libvips concurrency over the input images, and
+reports build time, tiles/s and write amplification. Write amplification is
+the space the output actually occupies on disk (allocated blocks, including
+directories) divided by the tile bytes themselves; millions of small tiles
+in a directory tree waste most of a 4 KB block each, a zip does not.
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+from profile_vips import DISPLAY_QUALITY, get_image_files, pyvips
+
+DEFAULT_TILE_SIZES = "254,510"  # 254 + 1px overlap each side = 256px tiles
+DEFAULT_OVERLAPS = "0,1"
+DEFAULT_TILE_FORMATS = "jpeg,webp"
+DEFAULT_CONTAINERS = "fs,zip"
+DEFAULT_CONCURRENCY = "1,0"     # 0 = libvips default (one thread per CPU)
+TILE_SUFFIXES = {"jpeg": ".jpg", "webp": ".webp"}
+LAYOUTS = {"dz": "dz", "iiif": "iiif3"}
+
+
+@dataclass
+class PyramidResult:
+    """Totals for one parameter combination across all images."""
+    tile_size: int
+    overlap: int
+    tile_format: str
+    container: str
+    concurrency: int
+    times_s: List[float] = field(default_factory=list)
+    tiles: int = 0
+    payload_bytes: int = 0
+    disk_bytes: int = 0
+
+    @property
+    def label(self) -> str:
+        return (f"{self.tile_size}+{self.overlap} {self.tile_format} "
+                f"{self.container} t={self.concurrency}")
+
+
+def measure_tree(root: Path) -> Tuple[int, int, int]:
+    """Return (tiles, tile bytes, allocated bytes) for a dzsave directory tree."""
+    tiles = payload = disk = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        disk += os.stat(dirpath).st_blocks * 512
+        for name in filenames:
+            st = os.stat(os.path.join(dirpath, name))
+            disk += st.st_blocks * 512
+            if name.endswith(tuple(TILE_SUFFIXES.values())):
+                tiles += 1
+                payload += st.st_size
+    return tiles, payload, disk
+
+
+def measure_zip(path: Path) -> Tuple[int, int, int]:
+    """Return (tiles, tile bytes, allocated bytes) for a dzsave zip."""
+    tiles = payload = 0
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.filename.endswith(tuple(TILE_SUFFIXES.values())):
+                tiles += 1
+                payload += info.file_size
+    return tiles, payload, os.stat(path).st_blocks * 512
+
+
+def build_pyramid(image_path: Path, work_dir: Path, result: PyramidResult, layout: str,
+                  quality: int) -> Tuple[float, int, int, int]:
+    """Build one pyramid; returns (seconds, tiles, tile bytes, allocated bytes)."""
+    # Clear the previous image's pyramid so only the last one is left to keep
+    shutil.rmtree(work_dir)
+    work_dir.mkdir()
+    pyvips.concurrency_set(result.concurrency)
+    # Name the zip explicitly; dzsave writes exactly the path it is given
+    basename = work_dir / (image_path.stem + (".zip" if result.container == "zip" else ""))
+    suffix = f"{TILE_SUFFIXES[result.tile_format]}[Q={quality}]"
+    start = time.perf_counter()
+    img = pyvips.Image.new_from_file(str(image_path), access="sequential")
+    img.dzsave(str(basename), tile_size=result.tile_size, overlap=result.overlap,
+               suffix=suffix, container=result.container, layout=LAYOUTS[layout])
+    elapsed = time.perf_counter() - start
+
+    if result.container == "zip":
+        tiles, payload, disk = measure_zip(basename)
+    else:
+        tiles, payload, disk = measure_tree(work_dir)
+    return elapsed, tiles, payload, disk
+
+
+def print_pyramid_results(results: List[PyramidResult]) -> None:
+    """Print formatted pyramid results, fastest first."""
+    print("\n" + "=" * 70)
+    print("PYRAMID RESULTS")
+    print("=" * 70)
+    print(f"\n{'Configuration':<26} {'Total (s)':>10} {'Avg (s)':>8} {'Tiles':>9} "
+          f"{'Tiles/s':>9} {'Tile MB':>9} {'Disk MB':>9} {'Amp':>6}")
+    print("-" * 92)
+    for r in sorted(results, key=lambda r: sum(r.times_s)):
+        if not r.times_s:
+            continue
+        total = sum(r.times_s)
+        amp = r.disk_bytes / r.payload_bytes if r.payload_bytes else 0
+        print(f"{r.label:<26} {total:>10.2f} {total / len(r.times_s):>8.2f} {r.tiles:>9} "
+              f"{r.tiles / total:>9.0f} {r.payload_bytes / 1e6:>9.1f} "
+              f"{r.disk_bytes / 1e6:>9.1f} {amp:>6.2f}")
+    print("-" * 92)
+    print("Amp = allocated disk space / tile bytes (1.00 = no filesystem overhead)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark dzsave tile pyramid generation.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./sample_input/48mp ./sample_input/96mp
+  {sys.argv[0]} --input ./sample_input/96mp --tile-sizes 254 --overlaps 1 --containers fs,zip
+  {sys.argv[0]} --input ./sample_input/48mp --layout iiif --concurrency 1,4,8,0
+  {sys.argv[0]} --input ./sample_input/48mp --output /mnt/tiles --keep-output
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        nargs="+",
+        required=True,
+        help="Input directories containing images to process (e.g. the 48mp and 96mp presets)"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default=None,
+        help="Directory to build pyramids in; measure the filesystem you will publish from "
+             "(default: ./sample_output)"
+    )
+    parser.add_argument(
+        "--tile-sizes",
+        default=DEFAULT_TILE_SIZES,
+        help=f"Comma-separated tile sizes (default: {DEFAULT_TILE_SIZES})"
+    )
+    parser.add_argument(
+        "--overlaps",
+        default=DEFAULT_OVERLAPS,
+        help=f"Comma-separated tile overlaps in pixels (default: {DEFAULT_OVERLAPS})"
+    )
+    parser.add_argument(
+        "--tile-formats",
+        default=DEFAULT_TILE_FORMATS,
+        help=f"Comma-separated tile formats: jpeg, webp (default: {DEFAULT_TILE_FORMATS})"
+    )
+    parser.add_argument(
+        "--containers",
+        default=DEFAULT_CONTAINERS,
+        help=f"Comma-separated containers: fs, zip (default: {DEFAULT_CONTAINERS})"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default=DEFAULT_CONCURRENCY,
+        help=f"Comma-separated libvips thread counts, 0 = default (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--layout",
+        choices=list(LAYOUTS),
+        default="dz",
+        help="Pyramid layout (default: dz)"
+    )
+    parser.add_argument(
+        "--quality", "-q",
+        type=int,
+        default=DISPLAY_QUALITY,
+        help=f"Tile quality (default: {DISPLAY_QUALITY})"
+    )
+    parser.add_argument(
+        "--keep-output", "-k",
+        action="store_true",
+        help="Keep the last pyramid built for each configuration"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show timing for each individual image"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        tile_sizes = [int(v) for v in args.tile_sizes.split(",")]
+        overlaps = [int(v) for v in args.overlaps.split(",")]
+        concurrency = [int(v) for v in args.concurrency.split(",")]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    tile_formats = args.tile_formats.split(",")
+    containers = args.containers.split(",")
+    unknown = ([f for f in tile_formats if f not in TILE_SUFFIXES]
+               + [c for c in containers if c not in ("fs", "zip")])
+    if unknown:
+        print(f"Error: Unknown tile format or container: {', '.join(unknown)}")
+        sys.exit(1)
+
+    image_files = [p for d in args.input for p in get_image_files(d)]
+    if not image_files:
+        print(f"Error: No supported image files found in {', '.join(args.input)}")
+        sys.exit(1)
+
+    script_dir = Path(__file__).parent.resolve()
+    output_root = Path(args.output).resolve() if args.output else script_dir / "sample_output"
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    combos = list(itertools.product(tile_sizes, overlaps, tile_formats, containers, concurrency))
+    print(f"VIPS Tile Pyramid Benchmark")
+    print(f"===========================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directories: {', '.join(args.input)}")
+    print(f"Output directory: {output_root}")
+    print(f"Images to process: {len(image_files)}")
+    print(f"Layout: {args.layout}, tile quality {args.quality}")
+    print(f"Configurations: {len(combos)} (tile sizes {args.tile_sizes}; overlaps {args.overlaps}; "
+          f"formats {args.tile_formats}; containers {args.containers}; "
+          f"concurrency {args.concurrency})")
+    print()
+
+    default_concurrency = pyvips.concurrency_get()
+    results = [PyramidResult(size, overlap, fmt, container, threads or default_concurrency)
+               for size, overlap, fmt, container, threads in combos]
+    total_start = time.perf_counter()
+
+    for result in results:
+        print(f"  {result.label}...", end=" ", flush=True)
+        work_dir = Path(tempfile.mkdtemp(prefix="pyramid_", dir=output_root))
+        try:
+            for image_path in image_files:
+                elapsed, tiles, payload, disk = build_pyramid(
+                    image_path, work_dir, result, args.layout, args.quality)
+                result.times_s.append(elapsed)
+                result.tiles += tiles
+                result.payload_bytes += payload
+                result.disk_bytes += disk
+                if args.verbose:
+                    print(f"\n    {image_path.name}: {elapsed:.2f} s, {tiles} tiles", end="")
+        except pyvips.Error as e:
+            print(f"error: {e}")
+            continue
+        finally:
+            if not args.keep_output:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"{sum(result.times_s):.2f} s")
+        if args.keep_output:
+            print(f"    kept: {work_dir}")
+
+    total_time = time.perf_counter() - total_start
+
+    print_pyramid_results(results)
+    print(f"\nTotal benchmark time: {total_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Per-call overhead microbenchmark for tiny outputs (icons, avatars).
+
+At 64-256px the pixel work per image is small, so the fixed cost of
+each pyvips call (Python, cffi, building and running a vips operation)
+becomes a large share of the total. This script measures:
+  overhead   µs per call for a null operation, building an operation
+             without running it, opening a header, and resize_image()
+  per-image  resize_image() + encode, one pipeline per image (what
+             benchmark_resize does)
+  thumbnail  pyvips.Image.thumbnail_buffer, one call with shrink-on-load
+  batched    K images packed into one mosaic with arrayjoin, resized with
+             a single call into memory, then cropped apart and encoded
+
+The batched path pads every tile into a cell whose pitch maps to a whole
+number of output pixels, with a gutter wider than the resize kernel, so
+tiles neither shift nor bleed into each other. Edge pixels still blend
+with the gutter, and tiles keep the exact aspect ratio where a per-image
+resize stretches each edge to a whole pixel, so the report gives the mean
+pixel difference from the per-image path. Images are only packed with
+others of the same dimensions and band count.
+
+Inputs are synthesized in memory unless --input names a directory.
+"""
+
+import argparse
+import math
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from profile_vips import (DEFAULT_FORMATS, FORMATS, THUMBNAIL_QUALITY, encode_buffer,
+                          get_image_files, parse_formats, pyvips, resize_image)
+
+DEFAULT_SIZES = "64,128,256"
+DEFAULT_BATCH_SIZES = "16,64"
+DEFAULT_COUNT = 256             # Synthesized inputs
+DEFAULT_SOURCE_SIZE = 512       # Synthesized input edge, px
+DEFAULT_CALLS = 2000            # Calls per overhead measurement
+DEFAULT_REPEAT = 3              # Best of this many passes per path
+KERNEL_GUTTER = 4               # Output px between tiles; lanczos3 reaches 3
+
+
+@dataclass
+class PathResult:
+    """Best pass of one path at one size and format."""
+    path: str
+    us_per_image: float
+    bytes_out: int
+    pixel_diff: float = 0       # Mean abs difference from per-image, 0-255
+
+
+def synthesize(count: int, size: int) -> List[bytes]:
+    """Distinct JPEG sources: a gradient per image plus a little noise."""
+    xy = pyvips.Image.xyz(size, size)
+    x, y = xy[0], xy[1]
+    sources = []
+    for i in range(count):
+        r = x * (255 / size)
+        g = y * (255 / size)
+        b = ((x + y) * (128 / size) + i * 37) % 256
+        img = r.bandjoin([g, b]) + pyvips.Image.gaussnoise(size, size, sigma=12, mean=0)
+        sources.append(img.cast("uchar").jpegsave_buffer(Q=90))
+    return sources
+
+
+def time_calls(func: Callable[[], object], calls: int) -> float:
+    """Mean µs per call, after a short warm-up."""
+    for _ in range(min(calls, 50)):
+        func()
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def measure_overhead(data: bytes, size: int, calls: int) -> List[Tuple[str, float]]:
+    """µs per call for operations that do little or no pixel work."""
+    dot = pyvips.Image.black(1, 1)
+    img = pyvips.Image.new_from_buffer(data, "")
+    return [
+        ("Null op, run (1x1 avg)", time_calls(dot.avg, calls)),
+        ("Build op, not run (1x1 linear)", time_calls(lambda: dot.linear(1, 0), calls)),
+        ("Open header (new_from_buffer)", time_calls(lambda: pyvips.Image.new_from_buffer(data, ""), calls)),
+        (f"resize_image to {size}px, not run", time_calls(lambda: resize_image(img, size), calls)),
+        ("Read one field (img.width)", time_calls(lambda: img.width, calls)),
+    ]
+
+
+def per_image(sources: List[bytes], size: int, fmt: Tuple[str, str]) -> List[bytes]:
+    return [encode_buffer(resize_image(pyvips.Image.new_from_buffer(data, ""), size),
+                   fmt[0], THUMBNAIL_QUALITY) for data in sources]
+
+
+def thumbnail(sources: List[bytes], size: int, fmt: Tuple[str, str]) -> List[bytes]:
+    return [encode_buffer(pyvips.Image.thumbnail_buffer(data, size, size="down"),
+                   fmt[0], THUMBNAIL_QUALITY) for data in sources]
+
+
+def cell_pitch(edge: int, size: int) -> int:
+    """Source pixels per mosaic cell, mapping to a whole number of output pixels."""
+    for gutter in range(KERNEL_GUTTER, KERNEL_GUTTER + size):
+        if (edge * (size + gutter)) % size == 0:
+            return edge * (size + gutter) // size
+    return edge * 2    # Unreachable: gutter == size always divides
+
+
+def render_mosaic(images: List[pyvips.Image], size: int) -> List[pyvips.Image]:
+    """Resize equally sized images with one vips pipeline; returns them cropped apart."""
+    width, height = images[0].width, images[0].height
+    edge = max(width, height)
+    scale = size / edge
+    if scale >= 1.0:
+        return images   # Don't upscale
+    pitch = cell_pitch(edge, size)
+    across = math.ceil(math.sqrt(len(images)))
+    mosaic = pyvips.Image.arrayjoin(images, across=across, hspacing=pitch, vspacing=pitch)
+    # Render once into memory so each crop doesn't re-run the resize
+    resized = mosaic.resize(scale).copy_memory()
+    step = round(pitch * scale)
+    w, h = round(width * scale), round(height * scale)
+    return [resized.crop((i % across) * step, (i // across) * step, w, h)
+            for i in range(len(images))]
+
+
+def batched(sources: List[bytes], size: int, fmt: Tuple[str, str], batch_size: int) -> List[bytes]:
+    outputs = []
+    for start in range(0, len(sources), batch_size):
+        images = [pyvips.Image.new_from_buffer(data, "") for data in sources[start:start + batch_size]]
+        outputs.extend(encode_buffer(tile, fmt[0], THUMBNAIL_QUALITY)
+                       for tile in render_mosaic(images, size))
+    return outputs
+
+
+def best_pass(run: Callable[[], List[bytes]], count: int, repeat: int) -> Tuple[float, int]:
+    """Best µs per image over repeat passes, and bytes out."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6 / count, sum(map(len, outputs))
+
+
+def mosaic_difference(sources: List[bytes], size: int, batch_size: int) -> float:
+    """Mean abs pixel difference of batched tiles from per-image resizes (first batch)."""
+    images = [pyvips.Image.new_from_buffer(data, "") for data in sources[:batch_size]]
+    tiles = render_mosaic(images, size)
+    diffs = [(tile - resize_image(img, size)).abs().avg() for tile, img in zip(tiles, images)]
+    return sum(diffs) / len(diffs)
+
+
+def group_by_dimensions(sources: List[bytes]) -> Dict[Tuple[int, int, int], List[bytes]]:
+    groups: Dict[Tuple[int, int, int], List[bytes]] = {}
+    for data in sources:
+        img = pyvips.Image.new_from_buffer(data, "")
+        groups.setdefault((img.width, img.height, img.bands), []).append(data)
+    return groups
+
+
+def benchmark_size(groups: Dict[Tuple[int, int, int], List[bytes]], size: int, fmt: Tuple[str, str],
+                   batch_sizes: List[int], repeat: int) -> List[PathResult]:
+    """Run every path over all groups at one output size and format."""
+    sources = [data for group in groups.values() for data in group]
+    count = len(sources)
+    runs = [("per-image", lambda: per_image(sources, size, fmt)),
+            ("thumbnail_buffer", lambda: thumbnail(sources, size, fmt))]
+    for k in batch_sizes:
+        runs.append((f"batched x{k}", lambda k=k: [
+            out for group in groups.values() for out in batched(group, size, fmt, k)]))
+    results = []
+    for name, run in runs:
+        us, bytes_out = best_pass(run, count, repeat)
+        results.append(PathResult(name, us, bytes_out))
+    for result, k in zip(results[2:], batch_sizes):
+        # Weighted by group size, first batch of each group
+        result.pixel_diff = sum(mosaic_difference(group, size, k) * len(group)
+                                for group in groups.values()) / count
+    return results
+
+
+def print_tiny_results(overhead: List[Tuple[str, float]], results: Dict[Tuple[int, str], List[PathResult]],
+                       count: int) -> None:
+    print("\n" + "=" * 70)
+    print("PER-CALL OVERHEAD")
+    print("=" * 70)
+    print(f"\n{'Operation':<40} {'us/call':>12}")
+    print("-" * 70)
+    for name, us in overhead:
+        print(f"{name:<40} {us:>12.1f}")
+    print("-" * 70)
+
+    print("\n" + "=" * 70)
+    print(f"THROUGHPUT ({count} images per pass, best pass)")
+    print("=" * 70)
+    print(f"\n{'Size':<6} {'Format':<6} {'Path':<18} {'us/image':>10} {'images/s':>10} "
+          f"{'vs per-image':>13} {'px diff':>8}")
+    print("-" * 78)
+    best: Dict[str, Tuple[float, str]] = {}
+    for (size, fmt_name), rows in results.items():
+        baseline = rows[0].us_per_image
+        for row in rows:
+            diff = f"{row.pixel_diff:.2f}" if row.path.startswith("batched") else "-"
+            print(f"{size:<6} {fmt_name:<6} {row.path:<18} {row.us_per_image:>10.1f} "
+                  f"{1e6 / row.us_per_image:>10.0f} {baseline / row.us_per_image:>12.2f}x {diff:>8}")
+            if fmt_name not in best or row.us_per_image < best[fmt_name][0]:
+                best[fmt_name] = (row.us_per_image, f"{row.path} at {size}px")
+    print("-" * 78)
+    print("(px diff: mean absolute difference from per-image resize_image, 0-255 scale)")
+
+    print("\nSUMMARY:")
+    dispatch = overhead[0][1]
+    for (size, fmt_name), rows in results.items():
+        calls = rows[0].us_per_image / dispatch
+        print(f"  {size}px {fmt_name}: per-image path costs {rows[0].us_per_image:.0f} us, "
+              f"about {calls:.0f} null-op calls' worth")
+    for fmt_name, (us, label) in best.items():
+        print(f"  Best {fmt_name} throughput: {1e6 / us:.0f} images/s ({label})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-call overhead and batched throughput for tiny (icon/avatar) outputs.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]}
+  {sys.argv[0]} --sizes 64,96,128 --batch-sizes 16,64,256
+  {sys.argv[0]} --input /uploads/avatars --formats jpeg,webp,avif
+  {sys.argv[0]} --count 1024 --source-size 256 --repeat 5
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        default=None,
+        help="Directory of source images (default: synthesize --count images in memory)"
+    )
+    parser.add_argument(
+        "--count", "-n",
+        type=int,
+        default=DEFAULT_COUNT,
+        help=f"Images to synthesize (default: {DEFAULT_COUNT})"
+    )
+    parser.add_argument(
+        "--source-size",
+        type=int,
+        default=DEFAULT_SOURCE_SIZE,
+        help=f"Edge of synthesized sources in px (default: {DEFAULT_SOURCE_SIZE})"
+    )
+    parser.add_argument(
+        "--sizes", "-s",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated output sizes, longest edge in px (default: {DEFAULT_SIZES})"
+    )
+    parser.add_argument(
+        "--formats", "-f",
+        default=",".join(DEFAULT_FORMATS),
+        help=f"Comma-separated output formats, or 'all' available (default: {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        "--batch-sizes", "-b",
+        default=DEFAULT_BATCH_SIZES,
+        help=f"Comma-separated images per mosaic for the batched path (default: {DEFAULT_BATCH_SIZES})"
+    )
+    parser.add_argument(
+        "--calls",
+        type=int,
+        default=DEFAULT_CALLS,
+        help=f"Calls per overhead measurement (default: {DEFAULT_CALLS})"
+    )
+    parser.add_argument(
+        "--repeat", "-r",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help=f"Passes per path; the best is reported (default: {DEFAULT_REPEAT})"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(v) for v in args.sizes.split(",")]
+        batch_sizes = [int(v) for v in args.batch_sizes.split(",")]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if min(sizes + batch_sizes) < 1 or args.repeat < 1 or args.calls < 1:
+        print(f"Error: Sizes, batch sizes, --repeat and --calls must be positive")
+        sys.exit(1)
+    parse_formats(args.formats)
+
+    if args.input:
+        input_dir = Path(args.input).resolve()
+        if not input_dir.is_dir():
+            print(f"Error: Input directory does not exist: {input_dir}")
+            sys.exit(1)
+        sources = [f.read_bytes() for f in get_image_files(str(input_dir))]
+        if not sources:
+            print(f"Error: No supported image files found in {input_dir}")
+            sys.exit(1)
+        origin = str(input_dir)
+    else:
+        sources = synthesize(args.count, args.source_size)
+        origin = f"synthesized, {args.source_size}x{args.source_size} JPEG"
+    groups = group_by_dimensions(sources)
+
+    print(f"VIPS Tiny Output Benchmark")
+    print(f"==========================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Sources: {len(sources)} images ({origin}), {len(groups)} distinct dimensions")
+    print(f"Output sizes: {', '.join(f'{s}px' for s in sizes)}, quality {THUMBNAIL_QUALITY}")
+    print(f"Output formats: {', '.join(name for name, _, _ in FORMATS)}")
+    print(f"Batch sizes: {', '.join(map(str, batch_sizes))}, best of {args.repeat} passes")
+    print()
+
+    print("Measuring per-call overhead...")
+    overhead = measure_overhead(sources[0], sizes[0], args.calls)
+    results = {}
+    for size in sizes:
+        for fmt_name, ext, _ in FORMATS:
+            print(f"  {size}px {fmt_name}...", end=" ", flush=True)
+            results[(size, fmt_name)] = benchmark_size(groups, size, (fmt_name, ext),
+                                                       batch_sizes, args.repeat)
+            print("done")
+
+    print_tiny_results(overhead, results, len(sources))
+
+
+if __name__ == "__main__":
+    main()
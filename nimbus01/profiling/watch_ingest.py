@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Incremental ingest of an upload directory.
+
+Keeps a persistent index of (path, size, mtime, content hash) and only
+generates derivatives for files that are new or whose content changed since
+the last pass. A touched-but-identical file costs one hash, not a re-encode.
+The upload tree is walked recursively with the streaming scandir scanner,
+and outputs mirror its subdirectories.
+
+With --watch it keeps running: on Linux it waits on inotify for finished
+writes and renames anywhere in the tree (subdirectories created later are
+watched as they appear), elsewhere (or with --poll) it rescans on an
+interval. Changes are batched over a short quiet window before being
+processed together.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from derivative_cache import content_hash
+from profile_vips import (SUPPORTED_EXTENSIONS, benchmark_resize, new_results, print_results,
+                          pyvips, scan_image_files)
+
+DEFAULT_INTERVAL = 5.0          # Seconds between polling scans
+DEFAULT_BATCH_WINDOW = 1.0      # Quiet seconds before a batch is processed
+DEFAULT_BATCH_MAX = 256         # Process a batch early once it is this large
+INDEX_FILE = "ingest_index.sqlite"
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000         # Watch removed (directory deleted or moved away)
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")   # wd, mask, cookie, name length
+
+
+class FileIndex:
+    """SQLite-backed record of what has already been processed."""
+
+    def __init__(self, db_path: Path):
+        self.db = sqlite3.connect(str(db_path))
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash BLOB)"
+        )
+        self.entries: Dict[str, Tuple[int, int, bytes]] = {
+            path: (size, mtime_ns, digest)
+            for path, size, mtime_ns, digest in self.db.execute("SELECT * FROM files")
+        }
+
+    def check(self, path: Path, st: os.stat_result) -> Optional[bytes]:
+        """Return the content hash if path needs processing, else None."""
+        key = str(path)
+        known = self.entries.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return None
+        digest = content_hash(path)
+        if known and known[2] == digest:
+            self.record(path, st, digest)  # Touched but unchanged
+            return None
+        return digest
+
+    def record(self, path: Path, st: os.stat_result, digest: bytes) -> None:
+        key = str(path)
+        self.entries[key] = (st.st_size, st.st_mtime_ns, digest)
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                        (key, st.st_size, st.st_mtime_ns, digest))
+
+    def prune(self, present: set) -> int:
+        """Forget files that no longer exist; returns how many were removed."""
+        gone = [p for p in self.entries if p not in present]
+        for key in gone:
+            del self.entries[key]
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+        return len(gone)
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+def skip_dir(path: Path, exclude: Optional[Path]) -> bool:
+    """True for exclude (the output tree, when it sits inside the input) and below."""
+    return exclude is not None and (path == exclude or exclude in path.parents)
+
+
+class InotifyWatcher:
+    """Report files finished writing or moved into a directory tree (Linux only)."""
+
+    def __init__(self, directory: Path, exclude: Optional[Path] = None):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.exclude = exclude
+        self.dirs: Dict[int, Path] = {}     # Watch descriptor -> directory
+        self.overflowed = False     # Events were lost; caller must rescan
+        try:
+            self.add_tree(directory)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_tree(self, root: Path) -> None:
+        """Watch root and every directory below it."""
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not skip_dir(Path(dirpath, d), self.exclude)]
+            wd = self.libc.inotify_add_watch(self.fd, dirpath.encode(errors="surrogateescape"),
+                                             WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dirpath}")
+            self.dirs[wd] = Path(dirpath)
+
+    def wait(self, timeout: Optional[float]) -> List[Path]:
+        """Block up to timeout seconds; returns paths that changed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+            elif mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+            elif wd in self.dirs and name:
+                path = self.dirs[wd] / name
+                if not mask & IN_ISDIR:
+                    paths.append(path)
+                elif not skip_dir(path, self.exclude):
+                    # A new or moved-in directory: watch it, then pick up files
+                    # that landed in it before the watch existed
+                    try:
+                        self.add_tree(path)
+                    except OSError as e:
+                        print(f"  cannot watch {path} ({e}), rescanning")
+                        self.overflowed = True
+                    paths.extend(scan_image_files(str(path), recursive=True))
+        return paths
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def find_changed(index: FileIndex, paths) -> List[Tuple[Path, os.stat_result, bytes]]:
+    """Filter paths down to supported files that are new or changed."""
+    changed = []
+    for path in paths:
+        if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        digest = index.check(path, st)
+        if digest is not None:
+            changed.append((path, st, digest))
+    return changed
+
+
+def process_batch(batch, index: FileIndex, input_dir: Path, output_dir: Path, results: dict,
+                  verbose: bool) -> int:
+    """Generate derivatives for a batch; returns the number that succeeded."""
+    done = 0
+    for path, st, digest in batch:
+        if verbose:
+            print(f"\n  {path.name}")
+        try:
+            # Mirror subdirectories so equal file names in different folders don't collide
+            image_output_dir = output_dir / path.parent.relative_to(input_dir)
+            image_output_dir.mkdir(parents=True, exist_ok=True)
+            benchmark_resize(path, image_output_dir, results, verbose)
+        except Exception as e:
+            print(f"  error: {path.name}: {e}")
+            continue
+        index.record(path, st, digest)
+        done += 1
+    index.commit()
+    return done
+
+
+def full_pass(index: FileIndex, input_dir: Path, output_dir: Path, results: dict,
+              verbose: bool) -> None:
+    """Scan the whole tree and process whatever changed."""
+    scan_start = time.perf_counter()
+    present = set()
+
+    def scanned():
+        # Streams, so checking starts before the walk finishes
+        for path in scan_image_files(str(input_dir), recursive=True):
+            if not skip_dir(path.parent, output_dir):
+                present.add(str(path))
+                yield path
+
+    changed = find_changed(index, scanned())
+    pruned = index.prune(present)
+    index.commit()
+    scan_ms = (time.perf_counter() - scan_start) * 1000
+
+    print(f"  Scanned {len(present)} files in {scan_ms:.2f} ms: "
+          f"{len(changed)} new or changed, {pruned} removed")
+    if changed:
+        start = time.perf_counter()
+        done = process_batch(changed, index, input_dir, output_dir, results, verbose)
+        print(f"  Processed {done}/{len(changed)} in {time.perf_counter() - start:.2f} s")
+
+
+def open_watcher(input_dir: Path, output_dir: Path, poll: bool) -> Optional[InotifyWatcher]:
+    """inotify watcher for the input_dir tree, or None to fall back to polling."""
+    if poll or not sys.platform.startswith("linux"):
+        return None
+    try:
+        return InotifyWatcher(input_dir, exclude=output_dir)
+    except OSError as e:
+        print(f"  inotify unavailable ({e}), falling back to polling")
+        return None
+
+
+def watch(index: FileIndex, input_dir: Path, output_dir: Path, results: dict,
+          args, watcher: Optional[InotifyWatcher]) -> None:
+    """Process changes continuously until interrupted.
+
+    The watcher is opened before the initial full pass, so uploads that
+    finish during it are already queued as events.
+    """
+    print(f"Watching {input_dir} with {'inotify' if watcher else 'polling'} (Ctrl-C to stop)")
+
+    while True:
+        if watcher is None:
+            time.sleep(args.interval)
+            full_pass(index, input_dir, output_dir, results, args.verbose)
+            continue
+
+        # Collect events until the directory has been quiet for the batch window
+        pending = {p: None for p in watcher.wait(None)}
+        while len(pending) < args.batch_max:
+            more = watcher.wait(args.batch_window)
+            if not more:
+                break
+            pending.update((p, None) for p in more)
+
+        if watcher.overflowed:
+            print("  inotify queue overflowed, rescanning")
+            watcher.overflowed = False
+            full_pass(index, input_dir, output_dir, results, args.verbose)
+        changed = find_changed(index, pending)
+        if changed:
+            start = time.perf_counter()
+            done = process_batch(changed, index, input_dir, output_dir, results, args.verbose)
+            print(f"  Batch: {done}/{len(changed)} processed in "
+                  f"{time.perf_counter() - start:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incrementally generate derivatives for new or changed uploads.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]} --input ./uploads --output ./derivatives
+  {sys.argv[0]} --input ./uploads --output ./derivatives --watch
+  {sys.argv[0]} --input ./uploads --output ./derivatives --watch --poll --interval 30
+        """
+    )
+
+    parser.add_argument(
+        "--input", "-i",
+        required=True,
+        help="Upload directory to ingest"
+    )
+    parser.add_argument(
+        "--output", "-o",
+        required=True,
+        help="Output directory for derivatives (kept)"
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help=f"Index database (default: output_dir/{INDEX_FILE})"
+    )
+    parser.add_argument(
+        "--watch", "-w",
+        action="store_true",
+        help="Keep running and process changes as they arrive"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Watch by periodic rescans instead of inotify"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=DEFAULT_INTERVAL,
+        help=f"Seconds between polling scans (default: {DEFAULT_INTERVAL})"
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=DEFAULT_BATCH_WINDOW,
+        help=f"Quiet seconds before processing a batch (default: {DEFAULT_BATCH_WINDOW})"
+    )
+    parser.add_argument(
+        "--batch-max",
+        type=int,
+        default=DEFAULT_BATCH_MAX,
+        help=f"Maximum files per batch (default: {DEFAULT_BATCH_MAX})"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show timing for each individual image"
+    )
+
+    args = parser.parse_args()
+
+    input_dir = Path(args.input).resolve()
+    if not input_dir.is_dir():
+        print(f"Error: Input directory does not exist: {input_dir}")
+        sys.exit(1)
+    output_dir = Path(args.output).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index_path = Path(args.index).resolve() if args.index else output_dir / INDEX_FILE
+
+    print(f"VIPS Incremental Ingest")
+    print(f"=======================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    print(f"Input directory: {input_dir}")
+    print(f"Output directory: {output_dir}")
+
+    load_start = time.perf_counter()
+    index = FileIndex(index_path)
+    print(f"Index: {index_path} ({len(index.entries)} files, "
+          f"loaded in {(time.perf_counter() - load_start) * 1000:.2f} ms)")
+    print()
+
+    results = new_results()
+    watcher = open_watcher(input_dir, output_dir, args.poll) if args.watch else None
+    try:
+        full_pass(index, input_dir, output_dir, results, args.verbose)
+        if args.watch:
+            watch(index, input_dir, output_dir, results, args, watcher)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        if watcher:
+            watcher.close()
+        index.close()
+
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
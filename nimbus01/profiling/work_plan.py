@@ -0,0 +1,133 @@
+"""
+Header-only probe pass and work plan for profile_vips.py --plan.
+
+Opening an image with libvips only parses its header; pixels are decoded
+when an operation first needs them. The probe opens every input on a
+thread pool and records dimensions, format, EXIF orientation and whether
+an ICC profile is embedded, without decoding anything.
+
+The plan marks a derivative as passthrough when the source already fits
+(longest edge no larger than the target, since resize_image never
+upscales), is already in the output format and needs no rotation. Those
+derivatives are byte copies of the source: no decode, no encode. Note
+that a copy keeps the source's quality setting and file size.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from profile_vips import FORMATS, OPERATIONS, pyvips
+
+DEFAULT_PROBE_THREADS = 16      # Header reads are I/O bound
+
+# Output format name for each loader that can produce one
+LOADER_FORMATS = {
+    "jpegload": "jpeg",
+    "webpload": "webp",
+    "jxlload": "jxl",
+}
+HEIF_COMPRESSION_FORMATS = {"av1": "avif", "hevc": "heic"}
+
+
+@dataclass
+class ImageInfo:
+    """Header fields of one source image."""
+    path: Path
+    width: int = 0
+    height: int = 0
+    format: Optional[str] = None    # Output format name, None if not one of ours
+    loader: str = ""
+    orientation: int = 1
+    has_icc: bool = False
+    error: Optional[str] = None
+
+    @property
+    def megapixels(self) -> float:
+        return self.width * self.height / 1e6
+
+
+@dataclass
+class WorkPlan:
+    """Probe results plus the derivatives that can be copied instead of rendered."""
+    images: Dict[Path, ImageInfo] = field(default_factory=dict)
+    passthrough: Dict[Path, Set[str]] = field(default_factory=dict)
+    probe_s: float = 0
+    copied: int = 0
+    copy_ms: float = 0      # Total time spent on passthrough copies
+    rendered: int = 0
+
+    def copies(self, image_path: Path, key: str) -> bool:
+        return key in self.passthrough.get(image_path, ())
+
+
+def probe(image_path: Path) -> ImageInfo:
+    """Read one image header without decoding pixels."""
+    info = ImageInfo(image_path)
+    try:
+        img = pyvips.Image.new_from_file(str(image_path))
+        info.width, info.height = img.width, img.height
+        info.loader = img.get("vips-loader")
+        fields = img.get_fields()
+        if "orientation" in fields:
+            info.orientation = img.get("orientation")
+        info.has_icc = "icc-profile-data" in fields
+        loader = info.loader.replace("_source", "").replace("_buffer", "")
+        if loader == "heifload" and "heif-compression" in fields:
+            info.format = HEIF_COMPRESSION_FORMATS.get(img.get("heif-compression"))
+        else:
+            info.format = LOADER_FORMATS.get(loader)
+    except pyvips.Error as e:
+        info.error = str(e).splitlines()[0]
+    return info
+
+
+def build_plan(image_files: List[Path], threads: int = DEFAULT_PROBE_THREADS) -> WorkPlan:
+    """Probe every input in parallel and decide which derivatives to copy."""
+    plan = WorkPlan()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for info in pool.map(probe, image_files):
+            plan.images[info.path] = info
+    plan.probe_s = time.perf_counter() - start
+
+    for image_path, info in plan.images.items():
+        if info.error or info.orientation > 1:
+            continue
+        keys = {f"{op_name}_{fmt_name}"
+                for op_name, max_size, _ in OPERATIONS
+                for fmt_name, _, _ in FORMATS
+                if max(info.width, info.height) <= max_size and fmt_name == info.format}
+        if keys:
+            plan.passthrough[image_path] = keys
+    return plan
+
+
+def print_plan(plan: WorkPlan) -> None:
+    """Summarize what the probe found and how much work the plan skips."""
+    infos = list(plan.images.values())
+    ok = [i for i in infos if not i.error]
+    derivatives = len(OPERATIONS) * len(FORMATS)
+    copies = sum(len(keys) for keys in plan.passthrough.values())
+    by_format: Dict[str, int] = {}
+    for info in ok:
+        name = info.format or info.loader or "?"
+        by_format[name] = by_format.get(name, 0) + 1
+
+    print(f"Work plan ({len(infos)} headers probed in {plan.probe_s * 1000:.1f} ms, "
+          f"{plan.probe_s * 1e6 / max(len(infos), 1):.0f} us/image):")
+    print(f"  Formats:      {', '.join(f'{n} {c}' for n, c in sorted(by_format.items()))}")
+    if ok:
+        print(f"  Megapixels:   {sum(i.megapixels for i in ok):.1f} total, "
+              f"{min(i.megapixels for i in ok):.1f}-{max(i.megapixels for i in ok):.1f} per image")
+    print(f"  Rotated:      {sum(1 for i in ok if i.orientation > 1)} (EXIF orientation, never copied)")
+    print(f"  ICC profile:  {sum(1 for i in ok if i.has_icc)}")
+    print(f"  Passthrough:  {copies}/{len(ok) * derivatives} derivatives copied as-is, "
+          f"{sum(1 for keys in plan.passthrough.values() if len(keys) == derivatives)} "
+          f"images never decoded")
+    errors = [i for i in infos if i.error]
+    for info in errors:
+        print(f"  Unreadable:   {info.path.name}: {info.error}")
+    print()
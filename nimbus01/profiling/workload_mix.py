@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Open-loop workload benchmark with a production-like size mix.
+
+Draws uploads from several preset directories by weight (by default 70%
+12mp phone photos, 25% 48mp camera exports, 5% 96mp panoramas) and submits
+them to a worker pool at a target arrival rate, whether or not the pool
+keeps up. Each upload is decoded once and rendered to every derivative in
+memory. Arrivals are Poisson, or bursty: Poisson bursts whose size is
+geometric with mean --burst-size, at the same average rate.
+
+For every upload the report separates:
+  queue    scheduled arrival to a worker picking it up
+  service  decode, resize and encode in the worker
+  total    scheduled arrival to done (what the uploader waits)
+Latency counts from the scheduled arrival time, so a backed-up pool or a
+slow submitter cannot hide queueing delay.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from profile_vips import (DEFAULT_FORMATS, ENCODER_EFFORT, FORMATS, OPERATIONS, encode_buffer,
+                          get_image_files, parse_effort, parse_formats, percentile, pyvips,
+                          resize_image)
+
+DEFAULT_MIX = "12mp=70,48mp=25,96mp=5"
+DEFAULT_RATES = "0.5,1,2"
+DEFAULT_DURATION = 30.0
+DEFAULT_BURST_SIZE = 8
+DEFAULT_WORKERS = os.cpu_count() or 1
+DRAIN_WARN_SERVICE_TIMES = 2    # Backlog warning after this many slowest service times
+
+
+@dataclass
+class Upload:
+    """Timing of one upload, in perf_counter() seconds."""
+    size_class: str
+    scheduled: float
+    started: float = 0
+    finished: float = 0
+    failed: bool = False
+
+    @property
+    def queue_ms(self) -> float:
+        return (self.started - self.scheduled) * 1000
+
+    @property
+    def service_ms(self) -> float:
+        return (self.finished - self.started) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        return (self.finished - self.scheduled) * 1000
+
+
+@dataclass
+class LevelResult:
+    """Outcome of one arrival rate."""
+    rate: float
+    arrivals_s: float = 0       # Length of the arrival window
+    elapsed_s: float = 0        # Until the last upload finished
+    uploads: List[Upload] = field(default_factory=list)
+
+    @property
+    def done(self) -> List[Upload]:
+        return [u for u in self.uploads if not u.failed]
+
+
+def parse_mix(text: str, root: Path) -> Dict[str, Tuple[float, List[Path]]]:
+    """Parse NAME=WEIGHT[,...] into {name: (weight, image files)}.
+
+    NAME is a directory, or a preset directory name under root.
+    """
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"expected NAME=WEIGHT, got '{item}'")
+        directory = Path(name) if Path(name).is_dir() else root / name
+        if not directory.is_dir():
+            raise ValueError(f"no directory '{name}' (looked in {root})")
+        mix[Path(name).name] = (weight, get_image_files(str(directory)))
+    return mix
+
+
+def parse_rates(text: str) -> List[float]:
+    """Parse comma-separated arrival rates, each finite and above zero."""
+    try:
+        rates = [float(v) for v in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated numbers, got '{text}'")
+    if any(not 0 < rate < math.inf for rate in rates):
+        raise argparse.ArgumentTypeError(f"rates must be finite and greater than 0, got '{text}'")
+    return rates
+
+
+def arrival_times(rate: float, duration: float, arrivals: str,
+                  burst_size: float, rng: random.Random) -> List[float]:
+    """Arrival offsets in seconds for one level, averaging rate per second."""
+    times = []
+    t = 0.0
+    if arrivals == "poisson":
+        while True:
+            t += rng.expovariate(rate)
+            if t >= duration:
+                return times
+            times.append(t)
+    # Bursts arrive as a Poisson process; each brings a geometric number of uploads
+    while True:
+        t += rng.expovariate(rate / burst_size)
+        if t >= duration:
+            return times
+        times.append(t)
+        while rng.random() > 1 / burst_size:
+            times.append(t)
+
+
+def serve_upload(image_path: str) -> Tuple[float, float]:
+    """Render every derivative of one upload in memory; returns (start, end).
+
+    Encodes with the FORMATS saver options, so --formats and --effort apply.
+
+    perf_counter() is CLOCK_MONOTONIC on Linux, so process pool timestamps
+    line up with the parent's schedule.
+    """
+    start = time.perf_counter()
+    img = pyvips.Image.new_from_file(image_path)
+    for _, max_size, quality in OPERATIONS:
+        resized = resize_image(img, max_size)
+        for fmt_name, _, _ in FORMATS:
+            encode_buffer(resized, fmt_name, quality)
+    return start, time.perf_counter()
+
+
+def run_level(executor, mix: Dict[str, Tuple[float, List[Path]]], rate: float,
+              duration: float, arrivals: str, burst_size: float,
+              rng: random.Random) -> LevelResult:
+    """Submit uploads on schedule, then wait for the pool to drain."""
+    result = LevelResult(rate, duration)
+    names = list(mix)
+    weights = [mix[name][0] for name in names]
+    pending = []
+    start = time.perf_counter()
+    for offset in arrival_times(rate, duration, arrivals, burst_size, rng):
+        size_class = rng.choices(names, weights)[0]
+        image_path = rng.choice(mix[size_class][1])
+        upload = Upload(size_class, start + offset)
+        delay = upload.scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pending.append((upload, executor.submit(serve_upload, str(image_path))))
+        result.uploads.append(upload)
+    for upload, future in pending:
+        try:
+            upload.started, upload.finished = future.result()
+        except pyvips.Error as e:
+            upload.failed = True
+            print(f"\n    error: {str(e).splitlines()[0]}", end="")
+    result.elapsed_s = time.perf_counter() - start
+    return result
+
+
+def print_workload_results(results: List[LevelResult], workers: int) -> None:
+    """Print queue vs. service vs. total latency per rate and per size class."""
+    print("\n" + "=" * 70)
+    print("WORKLOAD RESULTS")
+    print("=" * 70)
+    print(f"\n{'Rate/s':>7} {'Done':>6} {'Fail':>5} {'Util':>6} {'Queue p50':>10} {'Queue p99':>10} "
+          f"{'Svc p50':>9} {'Svc p99':>9} {'Total p50':>10} {'Total p99':>10}")
+    print("-" * 88)
+    for r in results:
+        done = r.done
+        queue = [u.queue_ms for u in done]
+        service = [u.service_ms for u in done]
+        total = [u.total_ms for u in done]
+        # Offered work per worker-second over the arrival window
+        util = sum(service) / 1000 / (r.arrivals_s * workers) * 100
+        print(f"{r.rate:>7g} {len(done):>6} {len(r.uploads) - len(done):>5} {util:>5.0f}% "
+              f"{percentile(queue, 50):>10.1f} {percentile(queue, 99):>10.1f} "
+              f"{percentile(service, 50):>9.1f} {percentile(service, 99):>9.1f} "
+              f"{percentile(total, 50):>10.1f} {percentile(total, 99):>10.1f}")
+    print("-" * 88)
+    print("(ms; Util = service time offered per worker over the arrival window)")
+
+    print(f"\n{'Rate/s':>7} {'Class':<8} {'Share':>6} {'Svc avg':>9} {'Queue p99':>10} {'Total p99':>10}")
+    print("-" * 70)
+    for r in results:
+        done = r.done
+        for size_class in sorted({u.size_class for u in done}):
+            subset = [u for u in done if u.size_class == size_class]
+            print(f"{r.rate:>7g} {size_class:<8} {len(subset) / len(done) * 100:>5.0f}% "
+                  f"{sum(u.service_ms for u in subset) / len(subset):>9.1f} "
+                  f"{percentile([u.queue_ms for u in subset], 99):>10.1f} "
+                  f"{percentile([u.total_ms for u in subset], 99):>10.1f}")
+    print("-" * 70)
+
+    for r in results:
+        # A pool that keeps up drains within about one service time of the last arrival
+        drain = r.elapsed_s - r.arrivals_s
+        if r.done and drain > DRAIN_WARN_SERVICE_TIMES * max(u.service_ms for u in r.done) / 1000:
+            print(f"WARNING: at {r.rate:g}/s the pool needed {drain:.1f} s after the last "
+                  f"arrival to drain; offered load exceeds capacity and queueing grows without bound")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop upload workload with a mixed image size distribution.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"""
+Examples:
+  {sys.argv[0]}
+  {sys.argv[0]} --mix 12mp=70,48mp=25,96mp=5 --rates 0.5,1,2 --workers 8
+  {sys.argv[0]} --arrivals bursty --burst-size 20 --rates 1 --duration 120
+  {sys.argv[0]} --mix /uploads/phone=9,/uploads/pano=1 --pool process
+  {sys.argv[0]} --formats jpeg,webp,avif --effort avif=6
+        """
+    )
+
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help=f"Comma-separated NAME=WEIGHT; NAME is a directory or a preset under --root "
+             f"(default: {DEFAULT_MIX})"
+    )
+    parser.add_argument(
+        "--root",
+        default=None,
+        help="Where preset directories live (default: ./sample_input)"
+    )
+    parser.add_argument(
+        "--rates", "-r",
+        type=parse_rates,
+        default=DEFAULT_RATES,
+        help=f"Comma-separated arrival rates in uploads/s (default: {DEFAULT_RATES})"
+    )
+    parser.add_argument(
+        "--arrivals", "-a",
+        choices=["poisson", "bursty"],
+        default="poisson",
+        help="Arrival process (default: poisson)"
+    )
+    parser.add_argument(
+        "--burst-size",
+        type=float,
+        default=DEFAULT_BURST_SIZE,
+        help=f"Mean uploads per burst for --arrivals bursty (default: {DEFAULT_BURST_SIZE})"
+    )
+    parser.add_argument(
+        "--duration", "-d",
+        type=float,
+        default=DEFAULT_DURATION,
+        help=f"Seconds of arrivals per rate (default: {DEFAULT_DURATION})"
+    )
+    parser.add_argument(
+        "--pool",
+        choices=["thread", "process"],
+        default="thread",
+        help="Executor for CPU work (default: thread)"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Pool size (default: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--formats", "-f",
+        default=",".join(DEFAULT_FORMATS),
+        help=f"Comma-separated output formats, or 'all' available (default: {','.join(DEFAULT_FORMATS)})"
+    )
+    parser.add_argument(
+        "--effort",
+        type=parse_effort,
+        default={},
+        help="Encoder effort overrides, e.g. avif=6,jxl=5,webp=4"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for a repeatable arrival schedule and mix"
+    )
+
+    args = parser.parse_args()
+
+    # Render only formats the local libvips can encode
+    ENCODER_EFFORT.update(args.effort)
+    unavailable = parse_formats(args.formats)
+
+    script_dir = Path(__file__).parent.resolve()
+    root = Path(args.root).resolve() if args.root else script_dir / "sample_input"
+    try:
+        mix = parse_mix(args.mix, root)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    empty = [name for name, (_, files) in mix.items() if not files]
+    if empty:
+        print(f"Error: No supported image files found for: {', '.join(empty)}")
+        sys.exit(1)
+    if args.burst_size < 1:
+        print(f"Error: --burst-size must be at least 1")
+        sys.exit(1)
+
+    print(f"VIPS Workload Mix Benchmark")
+    print(f"===========================")
+    print(f"VIPS version: {pyvips.version(0)}.{pyvips.version(1)}.{pyvips.version(2)}")
+    weight_total = sum(weight for weight, _ in mix.values())
+    print("Mix: " + ", ".join(f"{name} {weight / weight_total * 100:.0f}% ({len(files)} images)"
+                              for name, (weight, files) in mix.items()))
+    bursts = f", mean burst {args.burst_size:g}" if args.arrivals == "bursty" else ""
+    print(f"Arrivals: {args.arrivals}{bursts}, {args.duration:.0f} s per rate")
+    print(f"Pool: {args.pool} x {args.workers}")
+    print(f"Derivatives per upload: "
+          f"{', '.join(f'{op}/{fmt}' for op, _, _ in OPERATIONS for fmt, _, _ in FORMATS)}")
+    efforts = [f"{name}={ENCODER_EFFORT[name]}" for name, _, _ in FORMATS if name in ENCODER_EFFORT]
+    if efforts:
+        print(f"Encoder effort: {', '.join(efforts)}")
+    if unavailable:
+        print(f"Skipped (not supported by this libvips build): {', '.join(unavailable)}")
+    print()
+
+    if args.pool == "process":
+        from batch_process import init_worker
+        # Spawn, not fork: libvips threads in this process do not survive fork()
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=([name for name, _, _ in FORMATS], dict(ENCODER_EFFORT)))
+    else:
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    rng = random.Random(args.seed)
+    results = []
+    with executor:
+        # Warm the pool so worker startup does not land in the first level's queue
+        files = [f for _, files in mix.values() for f in files]
+        list(executor.map(serve_upload, [str(files[0])] * args.workers))
+        for rate in args.rates:
+            print(f"  Rate {rate:g}/s...", end=" ", flush=True)
+            result = run_level(executor, mix, rate, args.duration, args.arrivals,
+                               args.burst_size, rng)
+            results.append(result)
+            print(f"{len(result.done)} uploads, done in {result.elapsed_s:.1f} s")
+
+    print_workload_results(results, args.workers)
+
+
+if __name__ == "__main__":
+    main()